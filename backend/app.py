@@ -1,16 +1,100 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, jsonify, request, send_from_directory, stream_with_context
 from flask_cors import CORS
+import csv
+import hashlib
+import io
+import json
 import os
+import queue
 from dotenv import load_dotenv 
-from database import Database
+from datetime import date
+from cycles import FUTURE_CYCLES, PAST_CYCLES, cycle_to_api, cycles_for_group, cycles_for_groups
+from database import (Database, BULK_MAX_RECORDS, RECORDS_PAGE_SIZE, WatermarkExpired, encode_cursor,
+                      decode_cursor, encode_watermark)
+from encoding import compress_response, json_provider
+from feed import ChangeFeed, format_event
+from metrics import METRICS_ENABLED, InstrumentedConnection, begin_request, finish_request, registry
+from worker import start_embedded as start_embedded_worker
 
 load_dotenv()
 
 app = Flask(__name__)
+app.json = json_provider(app)
 CORS(app)
 
-# Initialize database
-db = Database()
+# Initialize database (with timed cursors when instrumentation is on)
+db = Database(connection_factory=InstrumentedConnection) if METRICS_ENABLED else Database()
+
+def load_changed_records(keys):
+    """Records for the change feed (runs on the listener thread, so hand its connection back)"""
+    try:
+        return db.get_billing_records_by_keys(keys)
+    finally:
+        db.release_connection()
+
+# Single-process deployments run the job worker inside the web workers
+if os.environ.get('JOBS_EMBEDDED_WORKER', '').lower() in ('1', 'true', 'yes'):
+    start_embedded_worker(db)
+
+# Each open event stream holds one of the worker's threads
+feed = ChangeFeed(db.listener, load_changed_records,
+                  max_subscribers=int(os.environ.get('EVENT_STREAM_MAX_CLIENTS', 2)))
+
+@app.teardown_appcontext
+def release_db_connection(exc):
+    """Hand the request's pooled connection back once the response is done"""
+    db.release_connection()
+
+if METRICS_ENABLED:
+    @app.before_request
+    def start_request_metrics():
+        begin_request()
+
+    @app.after_request
+    def finish_request_metrics(response):
+        """Record the request's timings and report them in a Server-Timing header"""
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        size = None if response.is_streamed else response.calculate_content_length()
+        timing = finish_request(request.method, endpoint, response.status_code, size)
+        if timing:
+            response.headers['Server-Timing'] = timing
+        return response
+
+@app.after_request
+def compress_body(response):
+    """gzip/brotli large responses (runs before finish_request_metrics, which then sees the bytes sent)"""
+    return compress_response(response, request.headers.get('Accept-Encoding'))
+
+def conditional_json(tables, load, vary=()):
+    """jsonify(load()) tagged with an ETag derived from the tables' change counters
+    
+    `vary` adds inputs beyond the URL that the payload depends on (e.g.
+    today's date). Answers If-None-Match with 304 Not Modified without
+    calling `load`. The tag is weak: it identifies the data, and the body
+    may be sent compressed or not. Cached reads older than `versions` are
+    dropped first, so the tag never labels a stale body.
+    """
+    versions = db.get_table_versions(tables)
+    db.sync_cache_versions(versions)
+    tag = hashlib.sha1(f"{request.full_path}|{sorted(versions.items())}|{vary}".encode()).hexdigest()
+    if request.if_none_match.contains_weak(tag):
+        response = Response(status=304)
+    else:
+        response = jsonify(load())
+    response.set_etag(tag, weak=True)
+    # Let browsers keep the copy but revalidate it on every request
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Tables each read endpoint depends on
+GROUP_TABLES = ('facility_groups', 'facilities', 'billing_statuses', 'custom_dates')
+FACILITY_TABLES = ('facilities',)
+CUSTOM_DATE_TABLES = ('custom_dates',)
+SETTINGS_TABLES = ('settings',)
+STATUS_TABLES = ('status_groups', 'billing_statuses')
+# Relative cycle keys also depend on custom dates
+RECORD_TABLES = ('billing_records', 'facilities', 'facility_groups', 'custom_dates')
+BOOTSTRAP_TABLES = tuple(dict.fromkeys(GROUP_TABLES + STATUS_TABLES + RECORD_TABLES + SETTINGS_TABLES))
 
 # Serve the frontend
 @app.route('/')
@@ -18,6 +102,40 @@ def serve_frontend():
     frontend_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'frontend')
     return send_from_directory(frontend_path, 'billing_tracker.html')
 
+# ============================================================================
+# BOOTSTRAP
+# ============================================================================
+
+def bootstrap_args(args):
+    """(group id or None, first cycle, last cycle) from bootstrap query parameters"""
+    group_id = args.get('groupId')
+    return (
+        int(group_id) if group_id else None,
+        int(args.get('cycleFrom', -PAST_CYCLES)),
+        int(args.get('cycleTo', FUTURE_CYCLES)),
+    )
+
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """Everything the UI loads on start, in one response
+    
+    Returns facilityGroups (with statuses and custom dates), facilities,
+    statuses, settings, cycle windows for every group, and the records of
+    one group (groupId, default the first) for cycles cycleFrom..cycleTo
+    (default -12..6), keyed like GET /api/billing-records.
+    """
+    try:
+        group_id, first, last = bootstrap_args(request.args)
+        # Relative cycles roll over with the date
+        return conditional_json(BOOTSTRAP_TABLES, lambda: db.get_bootstrap(group_id, first, last),
+                                vary=date.today().isoformat())
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============================================================================
 # FACILITY GROUPS
 # ============================================================================
@@ -26,8 +144,7 @@ def serve_frontend():
 def get_facility_groups():
     """Get all facility groups with their facilities"""
     try:
-        groups = db.get_facility_groups()
-        return jsonify(groups)
+        return conditional_json(GROUP_TABLES, db.get_facility_groups)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -53,10 +170,16 @@ def update_facility_group(group_id):
 
 @app.route('/api/facility-groups/<int:group_id>', methods=['DELETE'])
 def delete_facility_group(group_id):
-    """Delete a facility group"""
+    """Queue the deletion of a facility group and everything in it
+    
+    Returns 202 with the job (poll /api/jobs/<id>); deleting a group that
+    is already being deleted returns the job in flight. The job's
+    workersAlive is 0 when no job worker is running to pick it up.
+    """
     try:
-        db.delete_facility_group(group_id)
-        return jsonify({'success': True})
+        job = db.enqueue_job('delete_facility_group', {'groupId': group_id},
+                             dedupe_key=f'delete_facility_group:{group_id}')
+        return jsonify({'success': True, 'job': job}), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -68,8 +191,7 @@ def delete_facility_group(group_id):
 def get_facilities():
     """Get all facilities"""
     try:
-        facilities = db.get_facilities()
-        return jsonify(facilities)
+        return conditional_json(FACILITY_TABLES, db.get_facilities)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -96,15 +218,145 @@ def delete_facility(facility_id):
 # BILLING RECORDS
 # ============================================================================
 
+RECORD_FILTER_TYPES = {
+    'groupId': int,
+    'facilityId': int,
+    'cycleFrom': int,
+    'cycleTo': int,
+    'periodFrom': date.fromisoformat,
+    'periodTo': date.fromisoformat,
+    'dateFrom': date.fromisoformat,
+    'dateTo': date.fromisoformat,
+}
+
+def parse_record_filters(args):
+    """Parse billing-record filter query parameters from a mapping (raises ValueError on bad input)"""
+    filters = {}
+    for key, convert in RECORD_FILTER_TYPES.items():
+        value = args.get(key)
+        try:
+            filters[key] = convert(value) if value else None
+        except ValueError:
+            raise ValueError(f"Invalid value for {key}: {value}")
+    status_ids = args.get('statusId')
+    if status_ids:
+        filters['statusIds'] = [int(s) for s in status_ids.split(',')]
+    return filters
+
+def record_filters_from_request():
+    """Parse the current request's billing-record filters (raises ValueError on bad input)"""
+    return parse_record_filters(request.args)
+
 @app.route('/api/billing-records', methods=['GET'])
 def get_billing_records():
-    """Get all billing records"""
+    """Get billing records, optionally filtered
+    
+    Without `limit`/`cursor` the response is the keyed dict
+    ({"facilityId-cycle": record}); with either, it is a keyset-paginated
+    page: {"records": [...], "nextCursor": "..." | null}. Records carry
+    both their absolute cycleStart and their cycle relative to today.
+    """
     try:
-        records = db.get_billing_records()
-        return jsonify(records)
+        filters = record_filters_from_request()
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        limit = request.args.get('limit', type=int)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        # Relative cycles roll over with the date
+        today = date.today().isoformat()
+        if cursor is None and limit is None:
+            return conditional_json(RECORD_TABLES, lambda: db.get_billing_records(filters), vary=today)
+        
+        def load_page():
+            records, next_key = db.get_billing_records_page(filters, after, limit or RECORDS_PAGE_SIZE)
+            return {
+                'records': records,
+                'nextCursor': encode_cursor(next_key) if next_key else None
+            }
+        return conditional_json(RECORD_TABLES, load_page, vary=today)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+EXPORT_COLUMNS = ['facilityId', 'cycleStart', 'cycle', 'billingDate', 'fromDate', 'throughDate',
+                  'billedAmount', 'paidAmount', 'paidDate', 'statusId']
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+def ndjson_chunks(records):
+    """Serialize records as newline-delimited JSON, batched into ~64KB chunks"""
+    buf = []
+    size = 0
+    for record in records:
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        buf.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield ''.join(buf)
+            buf, size = [], 0
+    yield ''.join(buf)
+
+def csv_chunks(records):
+    """Serialize records as CSV with a header row, batched into ~64KB chunks"""
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+    writer.writeheader()
+    for record in records:
+        writer.writerow(record)
+        if buf.tell() >= EXPORT_CHUNK_BYTES:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+EXPORT_FORMATS = {
+    'ndjson': (ndjson_chunks, 'application/x-ndjson'),
+    'csv': (csv_chunks, 'text/csv'),
+}
+
+@app.route('/api/billing-records/changes', methods=['GET'])
+def get_billing_record_changes():
+    """Billing records written and deleted since a watermark
+    
+    `since` is the token from a previous call (or from /api/bootstrap's
+    changesToken). Returns {"token", "upserted": [record, ...],
+    "deleted": [{"facilityId", "cycleStart"}, ...], "reset"}; with reset
+    true (always, without `since`) the client must reload its records
+    instead. 410 Gone when the token has expired.
+    """
+    try:
+        since = request.args.get('since')
+        if not since:
+            token = encode_watermark(db.get_changes_horizon())
+            return jsonify({'token': token, 'upserted': [], 'deleted': [], 'reset': True})
+        return jsonify(db.get_billing_record_changes(since))
+    except WatermarkExpired as e:
+        return jsonify({'error': str(e)}), 410
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/billing-records/export', methods=['GET'])
+def export_billing_records():
+    """Stream billing records as NDJSON or CSV (same filters as the list endpoint)"""
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format: {fmt}"}), 400
+    try:
+        filters = record_filters_from_request()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    serialize, mimetype = EXPORT_FORMATS[fmt]
+    body = serialize(db.iter_billing_records(filters))
+    return Response(
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=billing-records.{fmt}'}
+    )
+
 @app.route('/api/billing-records', methods=['POST'])
 def save_billing_record():
     """Create or update a billing record"""
@@ -112,6 +364,114 @@ def save_billing_record():
         data = request.json
         db.save_billing_record(data)
         return jsonify({'success': True})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/billing-records/summary', methods=['GET'])
+def get_billing_summary():
+    """Billed/paid/outstanding totals grouped by facility, group, status group, status and/or period
+    
+    ?groupBy=group,period&period=month plus the list endpoint's filters.
+    """
+    try:
+        filters = record_filters_from_request()
+        group_by = [d for d in request.args.get('groupBy', '').split(',') if d]
+        period = request.args.get('period', 'month')
+        return conditional_json(RECORD_TABLES, lambda: db.get_billing_summary(filters, group_by, period),
+                                vary=date.today().isoformat())
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/billing-records/bulk', methods=['POST'])
+def save_billing_records():
+    """Create or update many billing records in one transaction
+    
+    Accepts {"records": [...]} (or a bare list) of at most BULK_MAX_RECORDS
+    records and reports an outcome for each one.
+    """
+    data = request.json
+    records = data.get('records') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return jsonify({'error': 'Expected a list of records'}), 400
+    if len(records) > BULK_MAX_RECORDS:
+        return jsonify({'error': f'At most {BULK_MAX_RECORDS} records per request'}), 413
+    
+    try:
+        results = db.save_billing_records(records)
+        counts = {'inserted': 0, 'updated': 0, 'skipped': 0, 'error': 0}
+        for r in results:
+            counts[r['status']] += 1
+        return jsonify({
+            'success': counts['error'] == 0,
+            'inserted': counts['inserted'],
+            'updated': counts['updated'],
+            'skipped': counts['skipped'],
+            'errors': counts['error'],
+            'results': results
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/billing-matrix', methods=['GET'])
+def get_billing_matrix():
+    """One group's records as a columnar facilities x cycles grid
+    
+    Query parameters: groupId (required), cycleFrom/cycleTo (relative
+    cycles, default -12..6). See database.billing_matrix for the layout.
+    """
+    try:
+        group_id, first, last = bootstrap_args(request.args)
+        if group_id is None:
+            raise ValueError("groupId is required")
+        return conditional_json(RECORD_TABLES, lambda: db.get_billing_matrix(group_id, first, last),
+                                vary=date.today().isoformat())
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# ============================================================================
+# BILLING CYCLES
+# ============================================================================
+
+@app.route('/api/cycles', methods=['GET'])
+def get_cycles():
+    """Cycle windows per facility group
+    
+    Query parameters: groupId (one group; otherwise all groups keyed by id),
+    cycleFrom/cycleTo (relative cycle indexes, default -12..6) and anchor (ISO date
+    that cycle 0 contains, default today).
+    """
+    try:
+        args = request.args
+        group_id = args.get('groupId', type=int)
+        first = int(args.get('cycleFrom', -PAST_CYCLES))
+        last = int(args.get('cycleTo', FUTURE_CYCLES))
+        anchor = date.fromisoformat(args['anchor']) if args.get('anchor') else date.today()
+        
+        def load():
+            groups = db.get_facility_groups()
+            if group_id is None:
+                return {
+                    str(gid): [cycle_to_api(c) for c in cycles]
+                    for gid, cycles in cycles_for_groups(groups, first, last, anchor).items()
+                }
+            group = next((g for g in groups if g['id'] == group_id), None)
+            if group is None:
+                raise LookupError(f"Facility group {group_id} not found")
+            return [cycle_to_api(c) for c in cycles_for_group(group, first, last, anchor)]
+        
+        return conditional_json(GROUP_TABLES, load, vary=anchor.isoformat())
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -123,20 +483,19 @@ def save_billing_record():
 def get_custom_dates(group_id):
     """Get custom dates for a group"""
     try:
-        dates = db.get_custom_dates(group_id)
-        return jsonify(dates)
+        return conditional_json(CUSTOM_DATE_TABLES, lambda: db.get_custom_dates(group_id))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/custom-dates', methods=['POST'])
 def save_custom_dates():
-    """Save custom dates for a group"""
+    """Replace a group's custom dates; returns the dates inserted, updated and deleted"""
     try:
         data = request.json
         group_id = data.get('groupId')
         dates = data.get('customDates', [])
-        db.save_custom_dates(group_id, dates)
-        return jsonify({'success': True})
+        changes = db.save_custom_dates(group_id, dates)
+        return jsonify({'success': True, **changes})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -148,8 +507,7 @@ def save_custom_dates():
 def get_settings():
     """Get application settings"""
     try:
-        settings = db.get_settings()
-        return jsonify(settings)
+        return conditional_json(SETTINGS_TABLES, db.get_settings)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -163,6 +521,84 @@ def save_settings():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# ============================================================================
+# CHANGE EVENTS
+# ============================================================================
+
+EVENT_KEEPALIVE = float(os.environ.get('EVENT_STREAM_KEEPALIVE', 15))
+EVENT_QUEUE_SIZE = 100
+# Browser reconnect delay after a dropped stream
+EVENT_RETRY_MS = 5000
+RESYNC_EVENT = format_event('resync', {})
+
+@app.route('/api/events', methods=['GET'])
+def event_stream():
+    """Server-Sent Events stream of billing record deltas and reference-data changes (see feed.py)"""
+    messages = queue.Queue(EVENT_QUEUE_SIZE)
+    
+    def deliver(message):
+        try:
+            messages.put_nowait(message)
+        except queue.Full:
+            # Too far behind to catch up from deltas: drop them and ask for a reload
+            while not messages.empty():
+                messages.get_nowait()
+            messages.put_nowait(RESYNC_EVENT)
+    
+    if not feed.subscribe(deliver):
+        return jsonify({'error': 'Too many event streams open'}), 503
+    
+    def generate():
+        try:
+            yield f"retry: {EVENT_RETRY_MS}\n\n"
+            while True:
+                try:
+                    yield messages.get(timeout=EVENT_KEEPALIVE)
+                except queue.Empty:
+                    # Comment line; also how a closed connection is noticed
+                    yield ': keepalive\n\n'
+        finally:
+            feed.unsubscribe(deliver)
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ============================================================================
+# JOBS
+# ============================================================================
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Recent background jobs (?status=queued|running|succeeded|failed&limit=50)"""
+    try:
+        return jsonify(db.list_jobs(request.args.get('status'), min(request.args.get('limit', 50, type=int), 500)))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def enqueue_job():
+    """Queue a background job: {"kind": ..., "payload": {...}}; returns 202 with the job"""
+    try:
+        data = request.json or {}
+        job = db.enqueue_job(data.get('kind'), data.get('payload'))
+        return jsonify(job), 202
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+def get_job(job_id):
+    """A job's status, progress ({done, total, message}), result and error, plus workersAlive"""
+    try:
+        return jsonify(db.get_job(job_id))
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ============================================================================
 # HEALTH CHECK
 # ============================================================================
@@ -170,7 +606,27 @@ def save_settings():
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
-    return jsonify({'status': 'healthy', 'database': 'connected'})
+    return jsonify({'status': 'healthy', 'database': 'connected', 'pool': db.pool.stats(), 'cache': db.cache_stats(),
+                    'eventStreams': feed.subscriber_count(), 'jobWorkers': db.live_job_workers()})
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    """Request, SQL and pool metrics in the Prometheus text format (needs METRICS_ENABLED)"""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled; set METRICS_ENABLED=1'}), 404
+    pool = db.pool.stats()
+    caches = db.cache_stats()
+    gauges = [
+        ('billing_pool_connections', 'Open pooled connections', pool['size']),
+        ('billing_pool_connections_in_use', 'Pooled connections checked out', pool['inUse']),
+        ('billing_pool_waiting', 'Threads waiting for a pooled connection', pool['waiting']),
+        ('billing_pool_timeouts', 'Pool checkouts that timed out', pool['timeouts']),
+        ('billing_event_streams', 'Open event streams', feed.subscriber_count()),
+    ]
+    for name, stats in caches.items():
+        gauges.append((f'billing_{name}_cache_hits', f'{name.capitalize()} cache hits', stats['hits']))
+        gauges.append((f'billing_{name}_cache_misses', f'{name.capitalize()} cache misses', stats['misses']))
+    return Response(registry.render(gauges), mimetype='text/plain; version=0.0.4')
 # ============================================================================
 # STATUS GROUPS
 # ============================================================================
@@ -179,8 +635,7 @@ def health_check():
 def get_status_groups():
     """Get all status groups with their statuses"""
     try:
-        groups = db.get_status_groups()
-        return jsonify(groups)
+        return conditional_json(STATUS_TABLES, db.get_status_groups)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -202,8 +657,7 @@ def create_status_group():
 def get_statuses():
     """Get all statuses"""
     try:
-        statuses = db.get_all_statuses()
-        return jsonify(statuses)
+        return conditional_json(STATUS_TABLES, db.get_all_statuses)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -211,8 +665,7 @@ def get_statuses():
 def get_statuses_by_group(group_id):
     """Get statuses for a specific group"""
     try:
-        statuses = db.get_statuses_by_group(group_id)
-        return jsonify(statuses)
+        return conditional_json(STATUS_TABLES, lambda: db.get_statuses_by_group(group_id))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
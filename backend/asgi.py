@@ -0,0 +1,324 @@
+"""ASGI entry point: native async handlers for the hot read endpoints, Flask for everything else.
+
+    gunicorn --chdir backend -k uvicorn.workers.UvicornWorker asgi:app
+
+The GET endpoints in ROUTES run on an async psycopg 3 pool, so one worker
+can keep many requests waiting on the database at once, and independent
+queries within a request run concurrently. Every other path and method
+goes to the Flask app (app.py) through a WSGI adapter, which runs it on a
+thread pool. Native handlers use the same SQL, JSON shapes and ETags as
+their Flask counterparts, and read through the Flask side's reference
+cache, so its writes and LISTEN/NOTIFY invalidations apply to both.
+"""
+import asyncio
+import contextlib
+import hashlib
+import os
+from datetime import date
+
+from a2wsgi import WSGIMiddleware
+from psycopg.rows import dict_row, tuple_row
+from psycopg_pool import AsyncConnectionPool
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+from werkzeug.http import parse_etags, quote_etag
+
+import app as wsgi
+import jobs
+from encoding import COMPRESS_MIN_BYTES, COMPRESSION, compress
+from database import (
+    ALL_STATUSES_SQL, CHANGES_HORIZON_SQL, CUSTOM_DATES_SQL, FACILITIES_SQL, FACILITY_GROUPS_SQL, RECORDS_MAX_PAGE_SIZE,
+    RECORDS_PAGE_SIZE, SETTINGS_SQL, STATUS_GROUPS_SQL, STATUSES_BY_GROUP_SQL, TABLE_VERSIONS_SQL,
+    billing_record_filters, bootstrap_group, bootstrap_payload, bootstrap_records_filters, cycle_indexer,
+    decode_cursor, encode_cursor, keyed_records, records_page, records_query,
+)
+from cycles import check_cycle_range
+
+# Flask's compact JSON output, so both entry points return identical bodies
+JSON_SEPARATORS = (',', ':')
+
+
+class AsyncDatabase:
+    """Async counterparts of Database's hot reads over a psycopg 3 connection pool"""
+
+    def __init__(self, dsn, cache):
+        self.pool = AsyncConnectionPool(
+            dsn,
+            min_size=int(os.environ.get('DB_POOL_MIN', 1)),
+            max_size=int(os.environ.get('DB_POOL_MAX', 10)),
+            timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            kwargs={'row_factory': dict_row},
+            open=False,
+        )
+        # Shared with the sync Database, under the same keys
+        self._reference_cache = cache
+
+    async def fetch(self, sql, params=None, row_factory=None):
+        """All rows of a query, as dicts unless another `row_factory` is given"""
+        async with self.pool.connection() as conn:
+            async with conn.cursor(row_factory=row_factory) as cur:
+                await cur.execute(sql, params)
+                return await cur.fetchall()
+
+    def _cached(self, key, sql, params=None):
+        return self._reference_cache.get_or_load_async(key, lambda: self.fetch(sql, params))
+
+    async def get_live_job_workers(self):
+        rows = await self.fetch(jobs.LIVE_WORKERS_SQL, (jobs.JOB_WORKER_STALE_SECONDS,))
+        return rows[0]['workers']
+
+    async def get_table_versions(self, tables):
+        rows = await self.fetch(TABLE_VERSIONS_SQL, (list(tables),))
+        versions = {r['table_name']: r['version'] for r in rows}
+        return {table: versions.get(table, 0) for table in tables}
+
+    def get_facility_groups(self):
+        return self._cached(('facility_groups',), FACILITY_GROUPS_SQL)
+
+    def get_facilities(self):
+        return self._cached(('facilities',), FACILITIES_SQL)
+
+    def get_status_groups(self):
+        return self._cached(('status_groups',), STATUS_GROUPS_SQL)
+
+    def get_all_statuses(self):
+        return self._cached(('statuses',), ALL_STATUSES_SQL)
+
+    def get_statuses_by_group(self, group_id):
+        return self._cached(('statuses', group_id), STATUSES_BY_GROUP_SQL, (group_id,))
+
+    def get_custom_dates(self, group_id):
+        return self._cached(('custom_dates', group_id), CUSTOM_DATES_SQL, (group_id,))
+
+    async def get_settings(self):
+        async def load():
+            return {r['key']: r['value'] for r in await self.fetch(SETTINGS_SQL)}
+        return await self._reference_cache.get_or_load_async(('settings',), load)
+
+    async def _records(self, filters, groups, after=None, limit=None):
+        needs_groups = filters.get('cycleFrom') is not None or filters.get('cycleTo') is not None
+        where, params = billing_record_filters(filters, groups if needs_groups else ())
+        sql, params = records_query(where, params, after=after, limit=limit)
+        # Tuples, as record_to_api expects
+        return await self.fetch(sql, params, row_factory=tuple_row)
+
+    async def get_billing_records(self, filters, groups):
+        """Database.get_billing_records, given the cached facility groups"""
+        return keyed_records(await self._records(filters, groups), cycle_indexer(groups))
+
+    async def get_billing_records_page(self, filters, groups, after=None, limit=RECORDS_PAGE_SIZE):
+        """Database.get_billing_records_page, given the cached facility groups"""
+        limit = max(1, min(limit, RECORDS_MAX_PAGE_SIZE))
+        rows = await self._records(filters, groups, after, limit)
+        return records_page(rows, limit, cycle_indexer(groups))
+
+    async def get_changes_horizon(self):
+        rows = await self.fetch(CHANGES_HORIZON_SQL)
+        return rows[0]['horizon']
+
+    async def get_bootstrap(self, groups, horizon, group_id, first, last):
+        """Database.get_bootstrap; the cached reads and the records query run concurrently"""
+        group = bootstrap_group(groups, group_id)
+
+        async def records():
+            if group is None:
+                return {}
+            return await self.get_billing_records(bootstrap_records_filters(group, first, last), groups)
+        facilities, statuses, settings, records = await asyncio.gather(
+            self.get_facilities(), self.get_all_statuses(), self.get_settings(), records()
+        )
+        return bootstrap_payload(groups, facilities, statuses, settings, group, records, first, last, horizon)
+
+
+adb = AsyncDatabase(wsgi.db.db_url, wsgi.db._reference_cache)
+# Event streams are coroutines here, not threads
+wsgi.feed.max_subscribers = int(os.environ.get('ASYNC_EVENT_STREAM_MAX_CLIENTS', 1000))
+
+
+def json_response(data, status=200, headers=None, accept_encoding=None):
+    """JSON through the Flask app's provider; compressed as the Flask side would for `accept_encoding`"""
+    body = (wsgi.app.json.dumps(data, separators=JSON_SEPARATORS) + '\n').encode()
+    headers = dict(headers or {})
+    if COMPRESSION and len(body) >= COMPRESS_MIN_BYTES:
+        headers['Vary'] = 'Accept-Encoding'
+    body, encoding = compress(body, accept_encoding)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    return Response(body, status_code=status, headers=headers, media_type='application/json')
+
+
+def error_response(e, status=500):
+    return json_response({'error': str(e)}, status)
+
+
+async def conditional_json(request, versions, load, vary=()):
+    """app.conditional_json for an already fetched `versions`; `load` is a coroutine function"""
+    wsgi.db.sync_cache_versions(versions)
+    full_path = f"{request.url.path}?{request.url.query}"
+    tag = hashlib.sha1(f"{full_path}|{sorted(versions.items())}|{vary}".encode()).hexdigest()
+    headers = {'ETag': quote_etag(tag, weak=True), 'Cache-Control': 'no-cache'}
+    if 'origin' in request.headers:
+        headers['Access-Control-Allow-Origin'] = '*'
+    if parse_etags(request.headers.get('if-none-match')).contains_weak(tag):
+        return Response(status_code=304, headers=headers)
+    return json_response(await load(), headers=headers, accept_encoding=request.headers.get('accept-encoding'))
+
+
+def reference_endpoint(tables, load):
+    """GET handler serving `load(request)` under the tables' ETag"""
+    async def endpoint(request):
+        try:
+            versions = await adb.get_table_versions(tables)
+            return await conditional_json(request, versions, lambda: load(request))
+        except Exception as e:
+            return error_response(e)
+    return endpoint
+
+
+async def billing_records(request):
+    """Async GET /api/billing-records: keyed dict, or a keyset page with limit/cursor"""
+    args = request.query_params
+    try:
+        filters = wsgi.parse_record_filters(args)
+        cursor = args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+        try:
+            limit = int(args['limit']) if 'limit' in args else None
+        except ValueError:
+            limit = None
+    except ValueError as e:
+        return error_response(e, 400)
+
+    try:
+        # The ETag's versions and the facility groups don't depend on each other
+        versions, groups = await asyncio.gather(
+            adb.get_table_versions(wsgi.RECORD_TABLES), adb.get_facility_groups()
+        )
+        if wsgi.db.sync_cache_versions(versions):
+            # The groups may predate the versions; reload them
+            groups = await adb.get_facility_groups()
+        today = date.today().isoformat()
+        if cursor is None and limit is None:
+            return await conditional_json(request, versions,
+                                          lambda: adb.get_billing_records(filters, groups), vary=today)
+
+        async def load_page():
+            records, next_key = await adb.get_billing_records_page(
+                filters, groups, after, limit or RECORDS_PAGE_SIZE)
+            return {
+                'records': records,
+                'nextCursor': encode_cursor(next_key) if next_key else None
+            }
+        return await conditional_json(request, versions, load_page, vary=today)
+    except Exception as e:
+        return error_response(e)
+
+
+async def bootstrap(request):
+    """Async GET /api/bootstrap"""
+    try:
+        group_id, first, last = wsgi.bootstrap_args(request.query_params)
+        check_cycle_range(first, last)
+        # The horizon must be read before the records, so it joins the first round
+        versions, groups, horizon = await asyncio.gather(
+            adb.get_table_versions(wsgi.BOOTSTRAP_TABLES), adb.get_facility_groups(),
+            adb.get_changes_horizon()
+        )
+        if wsgi.db.sync_cache_versions(versions):
+            groups = await adb.get_facility_groups()
+        return await conditional_json(request, versions,
+                                      lambda: adb.get_bootstrap(groups, horizon, group_id, first, last),
+                                      vary=date.today().isoformat())
+    except LookupError as e:
+        return error_response(e, 404)
+    except ValueError as e:
+        return error_response(e, 400)
+    except Exception as e:
+        return error_response(e)
+
+
+async def event_stream(request):
+    """Async GET /api/events: app.event_stream without holding a thread per client"""
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue(wsgi.EVENT_QUEUE_SIZE)
+
+    def put(message):
+        try:
+            messages.put_nowait(message)
+        except asyncio.QueueFull:
+            while not messages.empty():
+                messages.get_nowait()
+            messages.put_nowait(wsgi.RESYNC_EVENT)
+
+    def deliver(message):
+        # Called on the listener thread
+        loop.call_soon_threadsafe(put, message)
+
+    if not wsgi.feed.subscribe(deliver):
+        return error_response('Too many event streams open', 503)
+
+    async def generate():
+        try:
+            yield f"retry: {wsgi.EVENT_RETRY_MS}\n\n"
+            while True:
+                try:
+                    yield await asyncio.wait_for(messages.get(), wsgi.EVENT_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+        finally:
+            wsgi.feed.unsubscribe(deliver)
+
+    return StreamingResponse(generate(), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def health_check(request):
+    return JSONResponse({
+        'status': 'healthy',
+        'database': 'connected',
+        'pool': wsgi.db.pool.stats(),
+        'asyncPool': adb.pool.get_stats(),
+        'cache': wsgi.db.cache_stats(),
+        'eventStreams': wsgi.feed.subscriber_count(),
+        'jobWorkers': await adb.get_live_job_workers(),
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await adb.pool.open()
+    try:
+        yield
+    finally:
+        await adb.pool.close()
+
+
+def group_id(request):
+    return request.path_params['group_id']
+
+
+ROUTES = [
+    Route('/api/facility-groups', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.GROUP_TABLES, lambda request: adb.get_facility_groups())),
+    Route('/api/facilities', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.FACILITY_TABLES, lambda request: adb.get_facilities())),
+    Route('/api/status-groups', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.STATUS_TABLES, lambda request: adb.get_status_groups())),
+    Route('/api/statuses', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.STATUS_TABLES, lambda request: adb.get_all_statuses())),
+    Route('/api/billing-statuses/group/{group_id:int}', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.STATUS_TABLES, lambda request: adb.get_statuses_by_group(group_id(request)))),
+    Route('/api/custom-dates/{group_id:int}', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.CUSTOM_DATE_TABLES, lambda request: adb.get_custom_dates(group_id(request)))),
+    Route('/api/settings', methods=['GET'], endpoint=reference_endpoint(
+        wsgi.SETTINGS_TABLES, lambda request: adb.get_settings())),
+    Route('/api/bootstrap', bootstrap, methods=['GET']),
+    Route('/api/billing-records', billing_records, methods=['GET']),
+    Route('/api/events', event_stream, methods=['GET']),
+    Route('/api/health', health_check, methods=['GET']),
+    # Anything not matched above (including writes to the paths above) is Flask's
+    Mount('', app=WSGIMiddleware(wsgi.app)),
+]
+
+app = Starlette(routes=ROUTES, lifespan=lifespan)
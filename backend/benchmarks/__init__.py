@@ -0,0 +1,6 @@
+"""Benchmark scripts for the billing tracker backend.
+
+Run from the backend directory, e.g. ``python -m benchmarks.facility_groups``.
+They write seed data, so point DATABASE_URL at a throwaway database;
+``benchmarks.api`` starts its own (see benchmarks.postgres).
+"""
@@ -0,0 +1,296 @@
+"""Benchmark the HTTP API end to end against a throwaway PostgreSQL.
+
+    python -m benchmarks.api --groups 50 --facilities 20 --cycles 24 --output bench.json
+    python -m benchmarks.api --baseline bench.json     # exit status 1 on regressions
+
+Starts a private server, or uses BENCH_DATABASE_URL (see benchmarks.postgres),
+and seeds synthetic data (see benchmarks.dataset). It then drives the Flask
+app through its test client, once per endpoint in two passes:
+
+- a sequential pass, which measures latency, statements per request,
+  response bytes and the benchmark process's CPU time per MB served;
+- a concurrent pass (--concurrency threads), which measures latency and
+  throughput under load.
+
+Results are printed as a table. --output writes them as JSON. --baseline
+compares them with an earlier JSON file and flags any metric that got
+worse by more than --tolerance. --json-provider and --accept-encoding
+select the serialization path and response compression (see encoding.py).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import psycopg2
+
+from benchmarks.common import CountingConnection, percentile, print_table, total_queries
+from benchmarks.dataset import seed_dataset
+from benchmarks.facility_groups import cleanup
+from benchmarks.postgres import temporary_postgres
+
+# Metrics compared with a baseline: (pass, metric, higher is better)
+COMPARED_METRICS = (
+    ('sequential', 'p95_ms', False),
+    ('sequential', 'queries_per_request', False),
+    ('sequential', 'bytes_per_response', False),
+    ('sequential', 'cpu_ms_per_mb', False),
+    ('concurrent', 'p95_ms', False),
+    ('concurrent', 'throughput_rps', True),
+)
+
+
+def endpoints(ctx):
+    """name -> function(i) returning the i-th request as (method, path, json body, headers)"""
+    groups, facilities = ctx['groups'], ctx['facilities']
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    return {
+        'bootstrap': lambda i: ('GET', f"/api/bootstrap?groupId={pick(groups, i)}", None, {}),
+        'facility-groups': lambda i: ('GET', '/api/facility-groups', None, {}),
+        'facility-groups:304': lambda i: ('GET', '/api/facility-groups', None,
+                                          {'If-None-Match': ctx['groups_etag']}),
+        'cycles': lambda i: ('GET', '/api/cycles?cycleFrom=-12&cycleTo=6', None, {}),
+        'records:group': lambda i: ('GET', f"/api/billing-records?groupId={pick(groups, i)}"
+                                           '&cycleFrom=-12&cycleTo=6', None, {}),
+        'records:matrix': lambda i: ('GET', f"/api/billing-matrix?groupId={pick(groups, i)}"
+                                            '&cycleFrom=-12&cycleTo=6', None, {}),
+        'records:page': lambda i: ('GET', '/api/billing-records?limit=500', None, {}),
+        'records:summary': lambda i: ('GET', '/api/billing-records/summary?groupBy=group,status', None, {}),
+        'records:changes': lambda i: ('GET', f"/api/billing-records/changes?since={ctx['token']}", None, {}),
+        'records:save': lambda i: ('POST', '/api/billing-records', {
+            'facilityId': pick(facilities, i),
+            'cycle': 0,
+            'billedAmount': str(1000 + i % 100),
+            'paidAmount': '',
+            'paidDate': '',
+        }, {}),
+    }
+
+
+def request(client, spec, accept_encoding=None):
+    method, path, body, headers = spec
+    if accept_encoding:
+        headers = {**headers, 'Accept-Encoding': accept_encoding}
+    started = time.perf_counter()
+    response = client.open(path, method=method, json=body, headers=headers)
+    elapsed = (time.perf_counter() - started) * 1000
+    return elapsed, len(response.get_data()), response.status_code
+
+
+def summarize(timings):
+    timings = sorted(timings)
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+    }
+
+
+def sequential_pass(app, make, requests, warmup, accept_encoding=None):
+    client = app.test_client()
+    for i in range(warmup):
+        request(client, make(i), accept_encoding)
+    timings, sizes, errors = [], [], 0
+    queries = total_queries()
+    # CPU of this process only (the app, not PostgreSQL): serialization, compression, ...
+    cpu_started = time.process_time()
+    for i in range(requests):
+        elapsed, size, status = request(client, make(i), accept_encoding)
+        timings.append(elapsed)
+        sizes.append(size)
+        errors += status >= 400
+    cpu = time.process_time() - cpu_started
+    megabytes = sum(sizes) / 1e6
+    return {
+        'requests': requests,
+        **summarize(timings),
+        'queries_per_request': round((total_queries() - queries) / requests, 2),
+        'bytes_per_response': round(statistics.fmean(sizes)),
+        'cpu_ms_per_request': round(cpu * 1000 / requests, 3),
+        'cpu_ms_per_mb': round(cpu * 1000 / megabytes, 1) if megabytes else 0.0,
+        'errors': errors,
+    }
+
+
+def concurrent_pass(app, make, requests, concurrency, accept_encoding=None):
+    local = threading.local()
+
+    def run(i):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        return request(local.client, make(i), accept_encoding)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(run, range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        **summarize([elapsed for elapsed, _, _ in results]),
+        'throughput_rps': round(requests / wall, 1),
+        'errors': sum(status >= 400 for _, _, status in results),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Rows comparing each metric with the baseline; regressions are marked"""
+    rows = []
+    for name, passes in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for pass_name, metric, higher_is_better in COMPARED_METRICS:
+            if metric not in before[pass_name]:
+                # Baseline from before the metric existed
+                continue
+            old, new = before[pass_name][metric], passes[pass_name][metric]
+            change = (new - old) / old if old else 0.0
+            worse = -change if higher_is_better else change
+            rows.append({
+                'endpoint': name,
+                'metric': f'{pass_name}.{metric}',
+                'baseline': old,
+                'current': new,
+                'change': f'{change:+.1%}',
+                'regression': 'YES' if worse > tolerance else '',
+            })
+    return rows
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--facilities', type=int, default=20, help='facilities per group')
+    parser.add_argument('--cycles', type=int, default=24, help='records per facility')
+    parser.add_argument('--custom-dates', type=int, default=12, help='custom dates per custom group')
+    parser.add_argument('--requests', type=int, default=200, help='requests per endpoint and pass')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--endpoints', help='comma-separated subset of endpoints to run')
+    parser.add_argument('--json-provider', help='JSON_PROVIDER for the app (default: its own default)')
+    parser.add_argument('--accept-encoding', help="Accept-Encoding sent with every request, e.g. 'gzip, br'")
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative worsening before a metric counts as a regression')
+    args = parser.parse_args()
+
+    with temporary_postgres() as dsn:
+        os.environ['DATABASE_URL'] = dsn
+        os.environ.setdefault('DB_POOL_MAX', str(args.concurrency + 2))
+        if args.json_provider:
+            os.environ['JSON_PROVIDER'] = args.json_provider
+        # An embedded job worker would hold on to the Database replaced below
+        os.environ.pop('JOBS_EMBEDDED_WORKER', None)
+        # Importing the app migrates the fresh database
+        import app as api
+        from database import Database
+        from feed import ChangeFeed
+
+        seed_conn = psycopg2.connect(dsn)
+        try:
+            created = seed_dataset(seed_conn, args.groups, args.facilities, args.cycles, args.custom_dates)
+            with seed_conn.cursor() as cur:
+                cur.execute('SHOW server_version')
+                server_version = cur.fetchone()[0]
+            seed_conn.commit()
+
+            # Serve requests from a Database on statement-counting connections.
+            # Retire the app's own first: stop its listener, close its pool
+            # and move the change feed over to the new listener.
+            retired = api.db
+            retired.listener.stop()
+            retired.release_connection()
+            retired.pool.closeall()
+            api.db = Database(connection_factory=CountingConnection)
+            api.feed = ChangeFeed(api.db.listener, api.load_changed_records,
+                                  max_subscribers=api.feed.max_subscribers)
+
+            client = api.app.test_client()
+            groups_response = client.get('/api/facility-groups')
+            bench_groups = [g for g in groups_response.get_json() if g['name'].startswith('bench-')]
+            ctx = {
+                'groups': [g['id'] for g in bench_groups],
+                'facilities': [f['id'] for g in bench_groups for f in g['facilities']],
+                'groups_etag': groups_response.headers['ETag'],
+                'token': client.get('/api/billing-records/changes').get_json()['token'],
+            }
+
+            selected = endpoints(ctx)
+            if args.endpoints:
+                selected = {name: selected[name] for name in args.endpoints.split(',')}
+            results = {}
+            for name, make in selected.items():
+                results[name] = {
+                    'sequential': sequential_pass(api.app, make, args.requests, args.warmup,
+                                                  args.accept_encoding),
+                    'concurrent': concurrent_pass(api.app, make, args.requests, args.concurrency,
+                                                  args.accept_encoding),
+                }
+                print(f"{name}: done", file=sys.stderr)
+        finally:
+            cleanup(seed_conn)
+            seed_conn.close()
+
+    rows = [
+        {'endpoint': name, 'pass': pass_name, **stats}
+        for name, passes in results.items()
+        for pass_name, stats in passes.items()
+    ]
+    columns = ['endpoint', 'pass', 'p50_ms', 'p95_ms', 'p99_ms', 'mean_ms',
+               'queries_per_request', 'bytes_per_response', 'cpu_ms_per_mb', 'throughput_rps', 'errors']
+    print_table([{c: row.get(c, '') for c in columns} for row in rows], columns)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'postgres': server_version,
+            'scale': {'groups': args.groups, 'facilities': args.facilities, 'cycles': args.cycles,
+                      'custom_dates': args.custom_dates},
+            'seeded': created,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'json_provider': api.app.json.__class__.__name__,
+            'accept_encoding': args.accept_encoding,
+        },
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        comparison = compare(results, baseline['results'], args.tolerance)
+        print()
+        print_table(comparison, ['endpoint', 'metric', 'baseline', 'current', 'change', 'regression'])
+        if any(row['regression'] for row in comparison):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+"""Compare per-record saves with the batched bulk upsert.
+
+    DATABASE_URL=postgresql://localhost/billing_bench python -m benchmarks.bulk_upsert
+
+Seeds one ``bench-*`` facility group, writes equally sized batches through
+save_billing_record (one commit each) and save_billing_records (one
+transaction) over disjoint cycle ranges, reports records/second, then
+deletes the seeded rows.
+"""
+import argparse
+import time
+
+from database import Database
+from benchmarks.common import CountingConnection, print_table
+from benchmarks.facility_groups import cleanup
+
+
+def seed_facilities(conn, count):
+    with conn.cursor() as cur:
+        cur.execute('''
+            INSERT INTO facility_groups (name, billing_type, billing_day)
+            VALUES ('bench-bulk', 'monthly', 1) RETURNING id
+        ''')
+        group_id = cur.fetchone()[0]
+        cur.execute('''
+            INSERT INTO facilities (name, group_id)
+            SELECT 'bench facility ' || n, %s FROM generate_series(1, %s) n
+            RETURNING id
+        ''', (group_id, count))
+        facility_ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    return facility_ids
+
+
+def make_records(facility_ids, cycle_range, amount):
+    return [
+        {
+            'facilityId': facility_id,
+            'cycle': cycle,
+            'billingDate': '01012025',
+            'fromDate': '01012025',
+            'throughDate': '01312025',
+            'billedAmount': str(amount),
+            'paidAmount': '',
+            'paidDate': '',
+        }
+        for facility_id in facility_ids
+        for cycle in cycle_range
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--facilities', type=int, default=200)
+    parser.add_argument('--cycles', type=int, default=12, help='records per facility')
+    args = parser.parse_args()
+
+    db = Database(connection_factory=CountingConnection)
+    conn = db.conn
+    rows = []
+    try:
+        facility_ids = seed_facilities(conn, args.facilities)
+
+        # First pass inserts, second pass updates the same keys
+        for amount, phase in ((100, 'insert'), (200, 'update')):
+            records = make_records(facility_ids, range(-args.cycles, 0), amount)
+
+            conn.queries = 0
+            started = time.perf_counter()
+            for record in records:
+                db.save_billing_record(record)
+            elapsed = time.perf_counter() - started
+            rows.append({'path': 'single', 'phase': phase, 'records': len(records),
+                         'queries': conn.queries, 'seconds': round(elapsed, 3),
+                         'records_per_s': round(len(records) / elapsed)})
+
+            records = make_records(facility_ids, range(1, args.cycles + 1), amount)
+            conn.queries = 0
+            started = time.perf_counter()
+            results = db.save_billing_records(records)
+            elapsed = time.perf_counter() - started
+            expected = 'inserted' if phase == 'insert' else 'updated'
+            assert all(r['status'] == expected for r in results)
+            rows.append({'path': 'bulk', 'phase': phase, 'records': len(records),
+                         'queries': conn.queries, 'seconds': round(elapsed, 3),
+                         'records_per_s': round(len(records) / elapsed)})
+    finally:
+        cleanup(conn)
+        db.release_connection()
+
+    print_table(rows, ['path', 'phase', 'records', 'queries', 'seconds', 'records_per_s'])
+
+
+if __name__ == '__main__':
+    main()
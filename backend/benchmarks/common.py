@@ -0,0 +1,80 @@
+import math
+import statistics
+import threading
+import time
+
+import psycopg2.extensions
+
+_counting_cursors = {}
+_total_queries = 0
+_total_lock = threading.Lock()
+
+
+def _count(conn):
+    global _total_queries
+    conn.queries += 1
+    with _total_lock:
+        _total_queries += 1
+
+
+def total_queries():
+    """Statements sent through every CountingConnection in this process"""
+    with _total_lock:
+        return _total_queries
+
+
+def _counting_cursor(base):
+    """Subclass of cursor class `base` whose execute() bumps the connection counter"""
+    if base not in _counting_cursors:
+        def execute(self, query, vars=None):
+            _count(self.connection)
+            return base.execute(self, query, vars)
+
+        def executemany(self, query, vars_list):
+            _count(self.connection)
+            return base.executemany(self, query, vars_list)
+
+        _counting_cursors[base] = type(f'Counting{base.__name__}', (base,), {
+            'execute': execute,
+            'executemany': executemany,
+        })
+    return _counting_cursors[base]
+
+
+class CountingConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that counts statements sent through its cursors"""
+
+    queries = 0
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop('cursor_factory', None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=_counting_cursor(base), **kwargs)
+
+
+def measure(fn, conn, repeat=20):
+    """Run `fn` `repeat` times; return latency percentiles and statements per call"""
+    timings = []
+    conn.queries = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 3),
+        'max_ms': round(timings[-1], 3),
+        'queries': conn.queries // repeat,
+    }
+
+
+def percentile(timings, p):
+    """Nearest-rank percentile `p` (0-100) of sorted `timings`"""
+    return timings[max(0, math.ceil(p / 100 * len(timings)) - 1)]
+
+
+def print_table(rows, columns):
+    """Print a list of dicts as an aligned plain-text table"""
+    widths = [max(len(col), *(len(str(row[col])) for row in rows)) for col in columns]
+    print('  '.join(col.rjust(w) for col, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(str(row[col]).rjust(w) for col, w in zip(columns, widths)))
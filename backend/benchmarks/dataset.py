@@ -0,0 +1,97 @@
+"""Synthetic billing data at a configurable scale.
+
+Every group, facility and status group is named ``bench-*``, so
+benchmarks.facility_groups.cleanup removes them. The seeded rows cascade
+with them.
+"""
+from datetime import date, timedelta
+
+from psycopg2.extras import execute_values
+
+import partitions
+from cycles import CYCLE_TYPES, cycles_for_group, format_date
+
+STATUSES_PER_GROUP = 5
+
+
+def custom_dates(count, today):
+    """`count` monthly billing dates (MMDDYYYY) ending around today"""
+    return [format_date(today - timedelta(days=30 * n)) for n in range(count - 1, -1, -1)]
+
+
+def seed_dataset(conn, groups=50, facilities=20, cycles=24, custom_date_count=12, today=None):
+    """Seed `groups` facility groups, rotating through the billing types
+
+    Each group gets `facilities` facilities with one record in each of the
+    group's last `cycles` cycles (up to the current one). Custom groups get
+    `custom_date_count` custom dates, so they have at most that many
+    cycles. Returns a summary of what was created.
+    """
+    today = today or date.today()
+    created = {'groups': 0, 'facilities': 0, 'records': 0, 'custom_dates': 0}
+    with conn.cursor() as cur:
+        cur.execute("INSERT INTO status_groups (name) VALUES ('bench-statuses') RETURNING id")
+        status_group_id = cur.fetchone()[0]
+        cur.execute('''
+            INSERT INTO billing_statuses (status_group_id, name, color, sort_order)
+            SELECT %s, 'Status ' || n, '#93C5FD', n FROM generate_series(1, %s) n
+            RETURNING id
+        ''', (status_group_id, STATUSES_PER_GROUP))
+        status_ids = [row[0] for row in cur.fetchall()]
+
+        records = []
+        for g in range(groups):
+            billing_type = CYCLE_TYPES[g % len(CYCLE_TYPES)]
+            billing_day = 5 if billing_type in ('weekly', 'biweekly') else 15
+            cur.execute('''
+                INSERT INTO facility_groups (name, billing_type, billing_day, status_group_id)
+                VALUES (%s, %s, %s, %s) RETURNING id
+            ''', (f'bench-{g}', billing_type, billing_day, status_group_id))
+            group_id = cur.fetchone()[0]
+            group = {'id': group_id, 'billingType': billing_type, 'billingDay': billing_day, 'customDates': []}
+            if billing_type == 'custom':
+                dates = custom_dates(custom_date_count, today)
+                execute_values(cur, '''
+                    INSERT INTO custom_dates (group_id, date, frequency) VALUES %s
+                ''', [(group_id, d, 'monthly') for d in dates])
+                group['customDates'] = [{'date': d} for d in dates]
+                created['custom_dates'] += len(dates)
+
+            cur.execute('''
+                INSERT INTO facilities (name, group_id)
+                SELECT 'bench facility ' || n, %s FROM generate_series(1, %s) n
+                RETURNING id
+            ''', (group_id, facilities))
+            facility_ids = [row[0] for row in cur.fetchall()]
+
+            windows = cycles_for_group(group, -(cycles - 1), 0, today)
+            for facility_id in facility_ids:
+                for n, cycle in enumerate(windows):
+                    paid = n % 3 != 0
+                    records.append((
+                        facility_id, cycle.start, cycle.billing, cycle.start, cycle.end,
+                        1000 + facility_id % 500, 1000 + facility_id % 500 if paid else None,
+                        cycle.billing + timedelta(days=14) if paid else None,
+                        status_ids[(facility_id + n) % len(status_ids)],
+                    ))
+            created['groups'] += 1
+            created['facilities'] += len(facility_ids)
+
+        if records:
+            partitions.ensure_partitions(cur, since=min(r[1] for r in records))
+            execute_values(cur, '''
+                INSERT INTO billing_records (facility_id, cycle_start, billing_date, from_date, through_date,
+                                             billed_amount, paid_amount, paid_date, status_id)
+                VALUES %s
+            ''', records, page_size=5000)
+            created['records'] = len(records)
+    conn.commit()
+
+    # Fresh statistics, so plans match a long-running database
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute('ANALYZE')
+    finally:
+        conn.autocommit = False
+    return created
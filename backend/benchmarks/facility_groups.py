@@ -0,0 +1,118 @@
+"""Compare the per-group (N+1) facility/status group loaders with the aggregated queries.
+
+    DATABASE_URL=postgresql://localhost/billing_bench python -m benchmarks.facility_groups
+
+Seeds groups named ``bench-*`` at increasing scale, measures statement count
+and latency for both implementations, then deletes the seeded rows.
+"""
+import argparse
+
+from psycopg2.extras import RealDictCursor
+
+from database import Database
+from benchmarks.common import CountingConnection, measure, print_table
+
+
+def legacy_get_facility_groups(conn):
+    """The previous implementation: three queries per group"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute('SELECT id, name, billing_type, billing_day, status_group_id FROM facility_groups ORDER BY id')
+        groups = cur.fetchall()
+        for group in groups:
+            cur.execute('SELECT id, name FROM facilities WHERE group_id = %s ORDER BY id', (group['id'],))
+            group['facilities'] = cur.fetchall()
+            cur.execute('SELECT id, name, color FROM billing_statuses WHERE status_group_id = %s ORDER BY id',
+                        (group.pop('status_group_id'),))
+            group['statuses'] = cur.fetchall()
+            cur.execute('''
+                SELECT date, frequency, custom_from, custom_through
+                FROM custom_dates WHERE group_id = %s ORDER BY date DESC
+            ''', (group['id'],))
+            group['customDates'] = cur.fetchall()
+        return groups
+
+
+def legacy_get_status_groups(conn):
+    """The previous implementation: one query per status group"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute('SELECT id, name, is_default FROM status_groups ORDER BY is_default DESC, name')
+        groups = cur.fetchall()
+        for group in groups:
+            cur.execute('''
+                SELECT id, name, color, sort_order FROM billing_statuses
+                WHERE status_group_id = %s ORDER BY sort_order
+            ''', (group['id'],))
+            group['statuses'] = cur.fetchall()
+        return groups
+
+
+def seed(conn, groups, facilities_per_group, custom_dates_per_group):
+    with conn.cursor() as cur:
+        for g in range(groups):
+            cur.execute('''
+                INSERT INTO status_groups (name) VALUES (%s) RETURNING id
+            ''', (f'bench-{g}',))
+            status_group_id = cur.fetchone()[0]
+            cur.execute('''
+                INSERT INTO billing_statuses (status_group_id, name, color, sort_order)
+                SELECT %s, 'Status ' || n, '#93C5FD', n FROM generate_series(1, 5) n
+            ''', (status_group_id,))
+            cur.execute('''
+                INSERT INTO facility_groups (name, billing_type, billing_day, status_group_id)
+                VALUES (%s, 'monthly', 1, %s) RETURNING id
+            ''', (f'bench-{g}', status_group_id))
+            group_id = cur.fetchone()[0]
+            cur.execute('''
+                INSERT INTO facilities (name, group_id)
+                SELECT 'bench facility ' || n, %s FROM generate_series(1, %s) n
+            ''', (group_id, facilities_per_group))
+            cur.execute('''
+                INSERT INTO custom_dates (group_id, date, frequency)
+                SELECT %s, to_char(DATE '2020-01-01' + n * 30, 'MMDDYYYY'), 'monthly'
+                FROM generate_series(1, %s) n
+            ''', (group_id, custom_dates_per_group))
+    conn.commit()
+
+
+def cleanup(conn):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM facility_groups WHERE name LIKE 'bench-%'")
+        cur.execute("DELETE FROM status_groups WHERE name LIKE 'bench-%'")
+    conn.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='10,100,300', help='comma-separated group counts')
+    parser.add_argument('--facilities', type=int, default=10, help='facilities per group')
+    parser.add_argument('--custom-dates', type=int, default=12, help='custom dates per group')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    db = Database(connection_factory=CountingConnection)
+    conn = db.conn
+    rows = []
+    seeded = 0
+    try:
+        for scale in (int(s) for s in args.scales.split(',')):
+            seed(conn, scale - seeded, args.facilities, args.custom_dates)
+            seeded = scale
+            cases = [
+                ('facility-groups legacy', lambda: legacy_get_facility_groups(conn)),
+                # __wrapped__ bypasses the reference cache
+                ('facility-groups aggregated', lambda: Database.get_facility_groups.__wrapped__(db)),
+                ('status-groups legacy', lambda: legacy_get_status_groups(conn)),
+                ('status-groups aggregated', lambda: Database.get_status_groups.__wrapped__(db)),
+            ]
+            for name, fn in cases:
+                rows.append({'groups': scale, 'case': name, **measure(fn, conn, args.repeat)})
+                conn.rollback()
+    finally:
+        cleanup(conn)
+        db.release_connection()
+
+    print_table(rows, ['groups', 'case', 'queries', 'p50_ms', 'max_ms'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+"""Throwaway PostgreSQL server for benchmarks.
+
+Uses BENCH_DATABASE_URL when it is set. Otherwise runs initdb into a temporary
+directory and starts a private server on a free port, listening only on a Unix
+socket in that directory. It is tuned for speed over durability (fsync off),
+and everything is deleted on exit. The server binaries are looked up in
+PG_BIN, then ``pg_config --bindir``, then PATH.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+import psycopg2
+
+DATABASE = 'billing_bench'
+
+
+def _pg_bin(name):
+    candidates = []
+    if os.environ.get('PG_BIN'):
+        candidates.append(os.path.join(os.environ['PG_BIN'], name))
+    try:
+        bindir = subprocess.run(['pg_config', '--bindir'], capture_output=True, text=True, check=True)
+        candidates.append(os.path.join(bindir.stdout.strip(), name))
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    candidates.append(shutil.which(name))
+    for path in candidates:
+        if path and os.access(path, os.X_OK):
+            return path
+    raise RuntimeError(f"{name} not found; set PG_BIN or BENCH_DATABASE_URL")
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextmanager
+def temporary_postgres(settings=None):
+    """Yield the DSN of an empty benchmark database
+
+    `settings` are extra server parameters (name -> value) for the private
+    server; they are ignored with BENCH_DATABASE_URL.
+    """
+    if os.environ.get('BENCH_DATABASE_URL'):
+        yield os.environ['BENCH_DATABASE_URL']
+        return
+
+    root = tempfile.mkdtemp(prefix='billing-bench-')
+    data = os.path.join(root, 'data')
+    port = _free_port()
+    pg_ctl = _pg_bin('pg_ctl')
+    try:
+        subprocess.run([_pg_bin('initdb'), '-D', data, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8'],
+                       check=True, capture_output=True)
+        options = {
+            'port': port,
+            'listen_addresses': "''",
+            'unix_socket_directories': root,
+            'fsync': 'off',
+            'synchronous_commit': 'off',
+            'full_page_writes': 'off',
+            'max_connections': 200,
+            **(settings or {}),
+        }
+        subprocess.run([
+            pg_ctl, '-D', data, '-l', os.path.join(root, 'server.log'), '-w',
+            '-o', ' '.join(f'-c {name}={value}' for name, value in options.items()),
+            'start',
+        ], check=True, capture_output=True)
+        try:
+            admin = psycopg2.connect(host=root, port=port, user='postgres', dbname='postgres')
+            admin.autocommit = True
+            with admin.cursor() as cur:
+                cur.execute(f'CREATE DATABASE {DATABASE}')
+            admin.close()
+            yield f'postgresql://postgres@/{DATABASE}?host={root}&port={port}'
+        finally:
+            subprocess.run([pg_ctl, '-D', data, '-m', 'immediate', '-w', 'stop'], capture_output=True)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
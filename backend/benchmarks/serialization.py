@@ -0,0 +1,134 @@
+"""CPU cost of turning billing record rows into a response body, per MB served.
+
+    python -m benchmarks.serialization --records 50000
+
+Needs no database: it synthesizes RECORD_COLUMNS rows and times each stage
+of GET /api/billing-records after the query:
+
+- building the keyed records, from tuples (record_to_api) and, for
+  comparison, from dict rows reshaped in Python as before;
+- jsonify() with each JSON provider (see encoding.py);
+- gzip and brotli at the configured levels.
+"""
+import argparse
+import gzip
+import time
+from datetime import date, timedelta
+
+from flask import Flask
+
+from benchmarks.common import print_table
+from cycles import cycle_start
+from database import cycle_indexer, keyed_records
+from encoding import BROTLI_QUALITY, GZIP_LEVEL, JSON_PROVIDERS, brotli, orjson
+
+
+def make_groups(count):
+    return [{'id': g, 'billingType': 'monthly', 'billingDay': 1 + g % 28, 'customDates': []}
+            for g in range(1, count + 1)]
+
+
+def make_rows(groups, records):
+    """RECORD_COLUMNS tuples spread over the groups' last cycles"""
+    rows, starts = [], {}
+    today = date.today()
+    for i in range(records):
+        group = groups[i % len(groups)]
+        key = (group['id'], -(i // len(groups) % 24))
+        if key not in starts:
+            starts[key] = cycle_start(group, key[1], today)
+        start = starts[key]
+        billing = start + timedelta(days=30)
+        rows.append((
+            1000 + i % 5000, start, group['id'], start.isoformat(),
+            billing.strftime('%m%d%Y'), start.strftime('%m%d%Y'), billing.strftime('%m%d%Y'),
+            f'{1000 + i % 500}.00', f'{1000 + i % 500}.00' if i % 3 else '',
+            billing.strftime('%m%d%Y') if i % 3 else '', 1 + i % 5,
+        ))
+    return rows
+
+
+def dict_rows(rows):
+    """The same rows as RealDictCursor used to return them"""
+    names = ('facility_id', 'cycle_start', 'group_id', 'cycle_start_iso', 'billing_date', 'from_date',
+             'through_date', 'billed_amount', 'paid_amount', 'paid_date', 'status_id')
+    return [dict(zip(names, r)) for r in rows]
+
+
+def keyed_dict_records(rows, index):
+    """keyed_records over dict rows with the key renaming done per row in Python"""
+    keyed = {}
+    for r in rows:
+        # cycle_indexer reads group_id and cycle_start from positions 2 and 1
+        cycle = index((None, r['cycle_start'], r['group_id']))
+        keyed[f"{r['facility_id']}-{cycle}"] = {
+            'facilityId': r['facility_id'],
+            'cycle': cycle,
+            'cycleStart': r['cycle_start'].isoformat(),
+            'billingDate': r['billing_date'],
+            'fromDate': r['from_date'],
+            'throughDate': r['through_date'],
+            'billedAmount': r['billed_amount'] or '',
+            'paidAmount': r['paid_amount'] or '',
+            'paidDate': r['paid_date'] or '',
+            'statusId': r['status_id'],
+        }
+    return keyed
+
+
+def time_cpu(fn, repeat):
+    """(result, CPU ms per call)"""
+    started = time.process_time()
+    for _ in range(repeat):
+        result = fn()
+    return result, (time.process_time() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=50000)
+    parser.add_argument('--groups', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    groups = make_groups(args.groups)
+    rows = make_rows(groups, args.records)
+    indexer = cycle_indexer(groups)
+    legacy_rows = dict_rows(rows)
+
+    results = []
+    payload, cpu = time_cpu(lambda: keyed_records(rows, indexer), args.repeat)
+    results.append({'stage': 'build: tuples', 'cpu_ms': cpu, 'bytes': None})
+    _, cpu = time_cpu(lambda: keyed_dict_records(legacy_rows, indexer), args.repeat)
+    results.append({'stage': 'build: dict rows', 'cpu_ms': cpu, 'bytes': None})
+
+    body = None
+    for name, provider in JSON_PROVIDERS.items():
+        if name == 'orjson' and orjson is None:
+            continue
+        app = Flask(__name__)
+        app.json = provider(app)
+        with app.app_context():
+            response, cpu = time_cpu(lambda: app.json.response(payload), args.repeat)
+        data = response.get_data()
+        body = body or data
+        results.append({'stage': f'jsonify: {name}', 'cpu_ms': cpu, 'bytes': len(data)})
+
+    _, cpu = time_cpu(lambda: gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), args.repeat)
+    results.append({'stage': f'gzip {GZIP_LEVEL}', 'cpu_ms': cpu, 'bytes': len(gzip.compress(body, GZIP_LEVEL))})
+    if brotli is not None:
+        compressed, cpu = time_cpu(lambda: brotli.compress(body, quality=BROTLI_QUALITY), args.repeat)
+        results.append({'stage': f'brotli {BROTLI_QUALITY}', 'cpu_ms': cpu, 'bytes': len(compressed)})
+
+    # Per MB of uncompressed JSON, so the stages add up
+    megabytes = len(body) / 1e6
+    print_table([{
+        'stage': r['stage'],
+        'cpu_ms': round(r['cpu_ms'], 2),
+        'bytes': r['bytes'] or '',
+        'cpu_ms_per_mb': round(r['cpu_ms'] / megabytes, 2),
+    } for r in results], ['stage', 'cpu_ms', 'bytes', 'cpu_ms_per_mb'])
+
+
+if __name__ == '__main__':
+    main()
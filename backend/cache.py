@@ -0,0 +1,88 @@
+import threading
+import time
+
+
+def _family(key):
+    """Invalidation family of a key: the key itself, or the first item of a tuple key"""
+    return key[0] if isinstance(key, tuple) else key
+
+
+class TTLCache:
+    """Thread-safe read-through cache whose entries expire after `ttl` seconds.
+
+    Keys are names or tuples starting with a name, e.g. ``'settings'`` or
+    ``('custom_dates', 3)``; invalidating a name drops every key in its
+    family. Cached values are shared between threads; callers must treat
+    them as read-only.
+    """
+
+    def __init__(self, ttl, maxsize=1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = {}      # key -> (expires_at, value), oldest first
+        self._generations = {}  # family -> invalidation count
+        self._clears = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _generation(self, key):
+        return (self._clears, self._generations.get(_family(key), 0))
+
+    def _lookup(self, key, now):
+        """(hit, value or generation) under the lock"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return True, entry[1]
+            self.misses += 1
+            return False, self._generation(key)
+
+    def _store(self, key, value, now, generation):
+        with self._lock:
+            # Don't store a value that was invalidated while it was loading
+            if generation == self._generation(key):
+                self._entries.pop(key, None)
+                self._entries[key] = (now + self.ttl, value)
+                while len(self._entries) > self.maxsize:
+                    self._entries.pop(next(iter(self._entries)))
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` on a miss"""
+        now = time.monotonic()
+        hit, found = self._lookup(key, now)
+        if hit:
+            return found
+        value = loader()
+        self._store(key, value, now, found)
+        return value
+
+    async def get_or_load_async(self, key, loader):
+        """get_or_load for a coroutine function `loader`"""
+        now = time.monotonic()
+        hit, found = self._lookup(key, now)
+        if hit:
+            return found
+        value = await loader()
+        self._store(key, value, now, found)
+        return value
+
+    def invalidate(self, *names):
+        """Drop every key in the named families, or everything when called without arguments"""
+        with self._lock:
+            if not names:
+                self._entries.clear()
+                self._generations.clear()
+                self._clears += 1
+                return
+            names = set(names)
+            for key in [k for k in self._entries if _family(k) in names]:
+                del self._entries[key]
+            for name in names:
+                self._generations[name] = self._generations.get(name, 0) + 1
+
+    def stats(self):
+        """Entry count and hit/miss counters"""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
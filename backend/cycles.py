@@ -0,0 +1,250 @@
+"""Billing cycle calendar: turns a facility group's billing settings into cycle windows.
+
+A cycle is addressed by its index relative to the cycle containing an
+anchor date (today by default): 0 is the current cycle, negative indexes
+are past cycles and positive ones are upcoming. Windows follow the rules
+the frontend has always used:
+
+- ``weekly``: Monday to Sunday, billed on the group's billing day
+- ``biweekly``: two weeks from a Monday an even number of weeks after
+  WEEK_EPOCH, billed on the second Monday
+- ``monthly``: calendar months, billed on the billing day of the month
+  (clamped to the month's length)
+- ``bimonthly``: January-February, March-April and so on, billed on the 1st
+  of the second month
+- ``custom``: one cycle per custom date (the billing date), running from
+  the day after the previous custom date unless customFrom/customThrough
+  are given; groups without custom dates fall back to monthly
+
+Windows are computed arithmetically for a whole index range at once and
+memoized per (group settings, anchor, range), so many groups sharing a
+billing setup cost one computation.
+
+Billing records are stored against the absolute start date of their
+cycle (``cycle_start``); `cycle_start` and `cycle_index` convert between
+that and the relative index for a given anchor. Multi-week and
+multi-month cycles therefore sit on a fixed grid rather than starting at
+the anchor, so a cycle keeps its start date whatever day it is viewed.
+"""
+import calendar
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+CYCLE_TYPES = ('weekly', 'biweekly', 'monthly', 'bimonthly', 'custom')
+
+# Default window the UI shows around the current cycle
+PAST_CYCLES = 12
+FUTURE_CYCLES = 6
+MAX_CYCLE_SPAN = 520
+
+WEEKDAYS = {name: number for number, name in enumerate(
+    ('sunday', 'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday')
+)}
+
+# Monday on which the biweekly grid starts (weekly cycles are on it too)
+WEEK_EPOCH = date(2001, 1, 1)
+
+Cycle = namedtuple('Cycle', 'index start end billing')
+
+
+def parse_billing_day(value):
+    """Normalize a billing day to an int: a day of month, or a weekday (0/7 = Sunday ... 6 = Saturday)
+
+    Accepts ints, digit strings and weekday names ('Friday'); returns None when unset.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, str) and not value.strip().isdigit():
+        day = WEEKDAYS.get(value.strip().lower())
+        if day is None:
+            raise ValueError(f"Invalid billing day: {value}")
+        return day
+    day = int(value)
+    if not 0 <= day <= 31:
+        raise ValueError(f"Invalid billing day: {value}")
+    return day
+
+
+def parse_date(value):
+    """Parse an MMDDYYYY or ISO (YYYY-MM-DD) date string; None for blanks"""
+    if not value:
+        return None
+    if '-' in value:
+        return date.fromisoformat(value)
+    return datetime.strptime(value, '%m%d%Y').date()
+
+
+def format_date(value):
+    """MMDDYYYY string, the format billing records store dates in"""
+    return value.strftime('%m%d%Y')
+
+
+def group_signature(group):
+    """Hashable billing settings of an API-shaped facility group (memoization key)"""
+    billing_type = group.get('billingType') or 'monthly'
+    custom = ()
+    if billing_type == 'custom':
+        custom = tuple(sorted(
+            (d['date'], d.get('customFrom') or '', d.get('customThrough') or '')
+            for d in group.get('customDates') or ()
+        ))
+    return (billing_type, parse_billing_day(group.get('billingDay')), custom)
+
+
+def _month_end(month):
+    """Last day of the absolute month number (year * 12 + month - 1)"""
+    year, m = divmod(month, 12)
+    return date(year, m + 1, calendar.monthrange(year, m + 1)[1])
+
+
+def _week_start(anchor, weeks):
+    """First day of the `weeks`-week cycle containing `anchor`"""
+    return anchor - timedelta(days=(anchor - WEEK_EPOCH).days % (7 * weeks))
+
+
+def _month_base(anchor, months):
+    """Absolute month number (year * 12 + month - 1) of the `months`-month cycle containing `anchor`"""
+    month = anchor.year * 12 + anchor.month - 1
+    return month - month % months
+
+
+def _month_windows(anchor, first, last, months, billing_day):
+    base = _month_base(anchor, months)
+    cycles = []
+    for index in range(first, last + 1):
+        month = base + index * months
+        year, m = divmod(month, 12)
+        start = date(year, m + 1, 1)
+        end = _month_end(month + months - 1)
+        if months == 1:
+            billing = start.replace(day=min(billing_day or 1, end.day))
+        else:
+            billing = _month_end(month) + timedelta(days=1)
+        cycles.append(Cycle(index, start, end, billing))
+    return cycles
+
+
+def _week_windows(anchor, first, last, weeks, billing_day):
+    monday = _week_start(anchor, weeks)
+    if weeks == 1:
+        # Offset from Monday: Sunday (0 or 7) is the last day of the week
+        offset = 6 if billing_day in (0, 7) else (billing_day or 1) - 1
+    else:
+        offset = 7
+    span = timedelta(days=7 * weeks)
+    return [
+        Cycle(index, start, start + span - timedelta(days=1), start + timedelta(days=offset))
+        for index, start in ((i, monday + span * i) for i in range(first, last + 1))
+    ]
+
+
+def _custom_windows(anchor, first, last, custom):
+    billing_dates = sorted((parse_date(d), parse_date(f), parse_date(t)) for d, f, t in custom)
+    windows = []
+    previous = None
+    for billing, start, end in billing_dates:
+        start = start or (previous + timedelta(days=1) if previous else billing.replace(day=1))
+        windows.append((start, end or billing, billing))
+        previous = billing
+    # Cycle 0 is the first one that hasn't ended before the anchor
+    current = next((i for i, w in enumerate(windows) if w[1] >= anchor), len(windows))
+    return [
+        Cycle(index, *windows[current + index])
+        for index in range(first, last + 1)
+        if 0 <= current + index < len(windows)
+    ]
+
+
+@lru_cache(maxsize=4096)
+def _windows(signature, anchor, first, last):
+    billing_type, billing_day, custom = signature
+    if billing_type == 'weekly':
+        return tuple(_week_windows(anchor, first, last, 1, billing_day))
+    if billing_type == 'biweekly':
+        return tuple(_week_windows(anchor, first, last, 2, billing_day))
+    if billing_type == 'bimonthly':
+        return tuple(_month_windows(anchor, first, last, 2, billing_day))
+    if billing_type == 'custom' and custom:
+        return tuple(_custom_windows(anchor, first, last, custom))
+    # monthly, and the fallback for unknown types / custom without dates
+    return tuple(_month_windows(anchor, first, last, 1, billing_day))
+
+
+def check_cycle_range(first, last):
+    """Raise ValueError unless `first`..`last` is an ascending range of at most MAX_CYCLE_SPAN cycles"""
+    if last < first or last - first > MAX_CYCLE_SPAN:
+        raise ValueError(f"Cycle range must be ascending and span at most {MAX_CYCLE_SPAN} cycles")
+
+
+def cycles_for_group(group, first=-PAST_CYCLES, last=FUTURE_CYCLES, anchor=None):
+    """Cycle windows `first`..`last` (inclusive) of an API-shaped facility group"""
+    check_cycle_range(first, last)
+    return list(_windows(group_signature(group), anchor or date.today(), first, last))
+
+
+def cycle_start(group, index, anchor=None):
+    """Start date of relative cycle `index`, or None if the group has no such cycle"""
+    cycles = cycles_for_group(group, index, index, anchor)
+    return cycles[0].start if cycles else None
+
+
+def cycle_range_starts(group, first=None, last=None, anchor=None):
+    """Start dates of the group's first and last cycle within `first`..`last`
+
+    Either index may be None (unbounded), giving None for that start. A
+    range reaching past a custom group's cycles is clamped to the cycles it
+    has; returns None when the group has no cycle in the range at all.
+    """
+    anchor = anchor or date.today()
+    billing_type, _, custom = signature = group_signature(group)
+    if billing_type == 'custom' and custom:
+        cycles = [
+            c for c in _custom_index(signature, anchor)
+            if (first is None or c.index >= first) and (last is None or c.index <= last)
+        ]
+        if not cycles:
+            return None
+        return (cycles[0].start if first is not None else None,
+                cycles[-1].start if last is not None else None)
+    return (cycle_start(group, first, anchor) if first is not None else None,
+            cycle_start(group, last, anchor) if last is not None else None)
+
+
+def cycle_index(group, day, anchor=None):
+    """Relative index of the cycle containing `day`, or None if no cycle does"""
+    anchor = anchor or date.today()
+    billing_type, _, custom = signature = group_signature(group)
+    if billing_type in ('weekly', 'biweekly'):
+        weeks = 1 if billing_type == 'weekly' else 2
+        return (day - _week_start(anchor, weeks)).days // (7 * weeks)
+    if billing_type == 'custom' and custom:
+        for cycle in _custom_index(signature, anchor):
+            if cycle.start <= day <= cycle.end:
+                return cycle.index
+        return None
+    months = 2 if billing_type == 'bimonthly' else 1
+    return (_month_base(day, months) - _month_base(anchor, months)) // months
+
+
+@lru_cache(maxsize=256)
+def _custom_index(signature, anchor):
+    # Every window of a custom group, whatever its index
+    return tuple(_custom_windows(anchor, -len(signature[2]), len(signature[2]), signature[2]))
+
+
+def cycles_for_groups(groups, first=-PAST_CYCLES, last=FUTURE_CYCLES, anchor=None):
+    """{group id: cycle windows} for many groups sharing one anchor"""
+    anchor = anchor or date.today()
+    return {g['id']: cycles_for_group(g, first, last, anchor) for g in groups}
+
+
+def cycle_to_api(cycle):
+    """Cycle as returned by the API: dates in the MMDDYYYY format records use"""
+    return {
+        'index': cycle.index,
+        'cycleStart': cycle.start.isoformat(),
+        'fromDate': format_date(cycle.start),
+        'throughDate': format_date(cycle.end),
+        'billingDate': format_date(cycle.billing),
+    }
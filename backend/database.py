@@ -1,275 +1,658 @@
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import os
+import re
 import json
+import base64
+import functools
+import threading
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from cache import TTLCache
+from cycles import (
+    FUTURE_CYCLES, PAST_CYCLES, check_cycle_range, cycle_index, cycle_range_starts, cycle_start, cycle_to_api,
+    cycles_for_group, cycles_for_groups, parse_billing_day, parse_date,
+)
+import jobs
+from listener import NotificationListener
+from migrations import ROLLUP_PERIOD_SQL, ROLLUP_STATUS_SQL, migrate
+import partitions
+from pool import ConnectionPool
+
+# Summary filters that the rollup table can answer
+ROLLUP_FILTERS = {'groupId', 'facilityId', 'statusIds'}
+
+# Keyset pagination for billing records
+RECORDS_PAGE_SIZE = int(os.environ.get('RECORDS_PAGE_SIZE', 500))
+RECORDS_MAX_PAGE_SIZE = int(os.environ.get('RECORDS_MAX_PAGE_SIZE', 5000))
+
+# Rows fetched per round trip by the server-side export cursor
+EXPORT_ITERSIZE = int(os.environ.get('EXPORT_ITERSIZE', 2000))
+
+# Fetched as plain tuples (see record_to_api): the key and group_id, which
+# callers use to derive relative cycles, then the API fields already
+# converted in SQL to the MMDDYYYY / plain strings the frontend has always
+# received, so no per-row dicts are built or reshaped in Python
+RECORD_COLUMNS = '''
+    br.facility_id, br.cycle_start, f.group_id,
+    to_char(br.cycle_start, 'YYYY-MM-DD') AS cycle_start_iso,
+    to_char(br.billing_date, 'MMDDYYYY') AS billing_date,
+    to_char(br.from_date, 'MMDDYYYY') AS from_date,
+    to_char(br.through_date, 'MMDDYYYY') AS through_date,
+    COALESCE(br.billed_amount::text, '') AS billed_amount,
+    COALESCE(br.paid_amount::text, '') AS paid_amount,
+    COALESCE(to_char(br.paid_date, 'MMDDYYYY'), '') AS paid_date,
+    br.status_id
+'''
+RECORD_SOURCE = 'billing_records br JOIN facilities f ON f.id = br.facility_id'
+
+# One group's records as grid cells (see billing_matrix): amounts in
+# integer cents, dates as day offsets from the record's cycle start
+MATRIX_SQL = '''
+    SELECT br.facility_id, br.cycle_start, br.status_id,
+           (br.billed_amount * 100)::bigint, (br.paid_amount * 100)::bigint,
+           br.billing_date - br.cycle_start, br.from_date - br.cycle_start,
+           br.through_date - br.cycle_start, br.paid_date - br.cycle_start
+    FROM billing_records br
+    JOIN facilities f ON f.id = br.facility_id
+    WHERE f.group_id = %s AND br.cycle_start >= %s AND br.cycle_start <= %s
+'''
+# Matrix columns, in MATRIX_SQL order after the key
+MATRIX_COLUMNS = ('statusId', 'billedCents', 'paidCents', 'billingDay', 'fromDay', 'throughDay', 'paidDay')
+
+# Read queries shared by Database and the async entry point (asgi.py);
+# both must return the same JSON shapes
+TABLE_VERSIONS_SQL = 'SELECT table_name, version FROM change_counters WHERE table_name = ANY(%s)'
+
+FACILITY_GROUPS_SQL = '''
+    WITH group_facilities AS (
+        SELECT group_id,
+               json_agg(json_build_object('id', id, 'name', name) ORDER BY id) AS facilities
+        FROM facilities
+        GROUP BY group_id
+    ),
+    group_statuses AS (
+        SELECT status_group_id,
+               json_agg(json_build_object(
+                   'id', id, 'name', name, 'color', color, 'sortOrder', sort_order
+               ) ORDER BY sort_order, id) AS statuses
+        FROM billing_statuses
+        GROUP BY status_group_id
+    ),
+    group_custom_dates AS (
+        SELECT group_id,
+               jsonb_agg(
+                   jsonb_build_object('date', date, 'frequency', frequency)
+                   || jsonb_strip_nulls(jsonb_build_object(
+                       'customFrom', NULLIF(custom_from, ''),
+                       'customThrough', NULLIF(custom_through, '')
+                   ))
+                   ORDER BY date DESC
+               ) AS custom_dates
+        FROM custom_dates
+        GROUP BY group_id
+    )
+    SELECT fg.id, fg.name,
+           COALESCE(gf.facilities, '[]'::json) AS facilities,
+           COALESCE(gs.statuses, '[]'::json) AS statuses,
+           COALESCE(gcd.custom_dates, '[]'::jsonb) AS "customDates",
+           fg.billing_type AS "billingType",
+           fg.billing_day AS "billingDay"
+    FROM facility_groups fg
+    LEFT JOIN group_facilities gf ON gf.group_id = fg.id
+    LEFT JOIN group_statuses gs ON gs.status_group_id = fg.status_group_id
+    LEFT JOIN group_custom_dates gcd ON gcd.group_id = fg.id
+    ORDER BY fg.id
+'''
+
+FACILITIES_SQL = 'SELECT id, name, group_id AS "groupId" FROM facilities ORDER BY id'
+
+CUSTOM_DATES_SQL = '''
+    SELECT date, frequency, custom_from, custom_through
+    FROM custom_dates
+    WHERE group_id = %s
+    ORDER BY date DESC
+'''
+
+SETTINGS_SQL = 'SELECT key, value FROM settings'
+
+STATUS_GROUPS_SQL = '''
+    WITH group_statuses AS (
+        SELECT status_group_id,
+               json_agg(json_build_object(
+                   'id', id, 'name', name, 'color', color, 'sort_order', sort_order
+               ) ORDER BY sort_order) AS statuses
+        FROM billing_statuses
+        GROUP BY status_group_id
+    )
+    SELECT sg.id, sg.name,
+           COALESCE(gs.statuses, '[]'::json) AS statuses,
+           sg.is_default AS "isDefault"
+    FROM status_groups sg
+    LEFT JOIN group_statuses gs ON gs.status_group_id = sg.id
+    ORDER BY sg.is_default DESC, sg.name
+'''
+
+ALL_STATUSES_SQL = '''
+    SELECT bs.id, bs.name, bs.color, bs.sort_order AS "sortOrder",
+           bs.status_group_id AS "statusGroupId", sg.name AS "groupName"
+    FROM billing_statuses bs
+    JOIN status_groups sg ON bs.status_group_id = sg.id
+    ORDER BY sg.is_default DESC, bs.sort_order
+'''
+
+STATUSES_BY_GROUP_SQL = '''
+    SELECT id, name, color, sort_order AS "sortOrder"
+    FROM billing_statuses
+    WHERE status_group_id = %s
+    ORDER BY sort_order
+'''
+
+# Largest batch accepted by save_billing_records
+BULK_MAX_RECORDS = int(os.environ.get('BULK_MAX_RECORDS', 5000))
+
+RECORD_VALUES_TEMPLATE = '''(
+    %s, %s,
+    billing_parse_date(%s), billing_parse_date(%s), billing_parse_date(%s),
+    billing_parse_amount(%s), billing_parse_amount(%s), billing_parse_date(%s),
+    %s
+)'''
+
+# Record fields stored through billing_parse_date / billing_parse_amount,
+# which turn anything they can't parse into NULL (see check_record_fields)
+RECORD_DATE_FIELDS = ('billingDate', 'fromDate', 'throughDate', 'paidDate')
+RECORD_AMOUNT_FIELDS = ('billedAmount', 'paidAmount')
+# Amounts are NUMERIC(14, 2)
+AMOUNT_LIMIT = Decimal(10) ** 12
+
+UPSERT_RECORD_SQL = '''
+    INSERT INTO billing_records 
+        (facility_id, cycle_start, billing_date, from_date, through_date, 
+         billed_amount, paid_amount, paid_date, status_id)
+    VALUES {values}
+    ON CONFLICT (facility_id, cycle_start) 
+    DO UPDATE SET
+        billing_date = EXCLUDED.billing_date,
+        from_date = EXCLUDED.from_date,
+        through_date = EXCLUDED.through_date,
+        billed_amount = EXCLUDED.billed_amount,
+        paid_amount = EXCLUDED.paid_amount,
+        paid_date = EXCLUDED.paid_date,
+        status_id = EXCLUDED.status_id,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+# Placeholder records for upcoming cycles (see Database.generate_placeholders):
+# one row per facility of each window's group, with the group's PLACEHOLDER_STATUS
+PLACEHOLDER_CYCLES = int(os.environ.get('PLACEHOLDER_CYCLES', 3))
+PLACEHOLDER_STATUS = os.environ.get('PLACEHOLDER_STATUS', 'Not Billed')
+
+PLACEHOLDERS_SQL = '''
+    INSERT INTO billing_records
+        (facility_id, cycle_start, billing_date, from_date, through_date, status_id)
+    SELECT f.id, w.cycle_start, w.billing_date, w.cycle_start, w.through_date, s.id
+    FROM unnest(%(groups)s::int[], %(starts)s::date[], %(billing)s::date[], %(through)s::date[])
+         AS w (group_id, cycle_start, billing_date, through_date)
+    JOIN facility_groups fg ON fg.id = w.group_id
+    JOIN facilities f ON f.group_id = fg.id
+    LEFT JOIN LATERAL (
+        SELECT bs.id FROM billing_statuses bs
+        WHERE bs.status_group_id = fg.status_group_id AND lower(bs.name) = lower(%(status)s)
+        ORDER BY bs.sort_order, bs.id
+        LIMIT 1
+    ) s ON true
+    ON CONFLICT (facility_id, cycle_start) DO NOTHING
+'''
+
+# Dimensions the billing summary can be grouped by:
+# name -> (output key, expression over billing_records, expression over billing_rollups)
+SUMMARY_DIMENSIONS = {
+    'facility': ('facilityId', 'br.facility_id', 'r.facility_id'),
+    'group': ('groupId', 'f.group_id', 'r.group_id'),
+    'statusGroup': ('statusGroupId', 'fg.status_group_id', 'fg.status_group_id'),
+    'status': ('statusId', 'br.status_id', 'NULLIF(r.status_id, 0)'),
+    'period': ('period', "date_trunc(%s, br.billing_date)::date",
+               "date_trunc(%s, NULLIF(r.period, '-infinity'))::date"),
+}
+SUMMARY_PERIODS = ('month', 'quarter', 'year')
+SUMMARY_CACHE_TTL = float(os.environ.get('SUMMARY_CACHE_TTL', 60))
+
+# Reference data (groups, facilities, statuses, settings) is cached per
+# worker; writers NOTIFY this channel with the comma-separated cache families
+# they changed so every worker drops them
+REFERENCE_CACHE_TTL = float(os.environ.get('REFERENCE_CACHE_TTL', 300))
+CACHE_CHANNEL = 'billing_cache'
+# Cache families holding data read from each counted table (what the
+# writes to it invalidate through _commit)
+TABLE_CACHE_FAMILIES = {
+    'facility_groups': ('facility_groups',),
+    'facilities': ('facilities', 'facility_groups'),
+    'custom_dates': ('custom_dates', 'facility_groups'),
+    'billing_statuses': ('statuses', 'status_groups', 'facility_groups'),
+    'status_groups': ('status_groups', 'statuses', 'facility_groups'),
+    'settings': ('settings',),
+    'billing_records': ('billing_summary',),
+}
+
+# Delta sync (/api/billing-records/changes): tombstones, and so watermarks,
+# are kept this long; more changes than CHANGES_MAX_RECORDS mean "reload"
+TOMBSTONE_RETENTION_DAYS = int(os.environ.get('TOMBSTONE_RETENTION_DAYS', 30))
+CHANGES_MAX_RECORDS = int(os.environ.get('CHANGES_MAX_RECORDS', 5000))
+
+# Every change stamped (updated_at / deleted_at) before this is committed:
+# writes carry their transaction's start time, so it is the start of the
+# oldest other open transaction, or now
+CHANGES_HORIZON_SQL = '''
+    SELECT LEAST(now(), min(xact_start))::timestamp AS horizon
+    FROM pg_stat_activity
+    WHERE datname = current_database() AND pid <> pg_backend_pid()
+'''
+
+class WatermarkExpired(Exception):
+    """A changes watermark older than the tombstone retention"""
+
+def encode_cursor(key):
+    """Opaque pagination cursor for a (facility_id, cycle_start) key"""
+    facility_id, start = key
+    return base64.urlsafe_b64encode(json.dumps([facility_id, start.isoformat()]).encode()).decode()
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        facility_id, start = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(facility_id), date.fromisoformat(start)
+    except (TypeError, ValueError, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def encode_watermark(horizon):
+    """Opaque delta-sync token for a CHANGES_HORIZON_SQL timestamp"""
+    return base64.urlsafe_b64encode(horizon.isoformat().encode()).decode()
+
+def decode_watermark(token):
+    """Inverse of encode_watermark; raises ValueError on a malformed token"""
+    try:
+        return datetime.fromisoformat(base64.urlsafe_b64decode(token.encode()).decode())
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid changes token: {token}") from e
+
+def record_to_api(r, cycle):
+    """Convert a RECORD_COLUMNS row (a tuple) to the shape expected by the frontend
+    
+    `cycle` is the record's cycle index relative to today (see Database._cycle_indexer).
+    """
+    return {
+        'facilityId': r[0],
+        'cycle': cycle,
+        'cycleStart': r[3],
+        'billingDate': r[4],
+        'fromDate': r[5],
+        'throughDate': r[6],
+        'billedAmount': r[7],
+        'paidAmount': r[8],
+        'paidDate': r[9],
+        'statusId': r[10]
+    }
+
+def billing_record_filters(filters, groups=()):
+    """Build a WHERE clause over billing_records (aliased br) from API filters
+
+    Supported keys: groupId, facilityId, cycleFrom, cycleTo (relative
+    cycle indexes), periodFrom, periodTo (datetime.date, compared with
+    cycle_start), statusIds, dateFrom, dateTo (datetime.date, compared
+    with billing_date). `groups` (API-shaped facility groups) is needed
+    to resolve cycleFrom/cycleTo.
+    """
+    filters = filters or {}
+    clauses, params = [], []
+    if filters.get('groupId') is not None:
+        clauses.append('br.facility_id IN (SELECT id FROM facilities WHERE group_id = %s)')
+        params.append(filters['groupId'])
+    if filters.get('facilityId') is not None:
+        clauses.append('br.facility_id = %s')
+        params.append(filters['facilityId'])
+    if filters.get('cycleFrom') is not None or filters.get('cycleTo') is not None:
+        # A relative cycle is a different date in each group; compare
+        # cycle_start with per-group bounds (NULL = that end of the range
+        # was not given; see cycle_bounds)
+        clauses.append('''EXISTS (
+            SELECT 1 FROM facilities cf
+            JOIN unnest(%s::int[], %s::date[], %s::date[]) AS b(group_id, lo, hi)
+                ON b.group_id = cf.group_id
+            WHERE cf.id = br.facility_id
+              AND br.cycle_start >= COALESCE(b.lo, '-infinity')
+              AND br.cycle_start <= COALESCE(b.hi, 'infinity')
+        )''')
+        group_ids, lows, highs = cycle_bounds(groups, filters.get('cycleFrom'), filters.get('cycleTo'))
+        params.extend((group_ids, lows, highs))
+        # Overall bounds as plain comparisons, so partitions outside them are pruned
+        if filters.get('cycleFrom') is not None and lows:
+            clauses.append('br.cycle_start >= %s')
+            params.append(min(lows))
+        if filters.get('cycleTo') is not None and highs:
+            clauses.append('br.cycle_start <= %s')
+            params.append(max(highs))
+    if filters.get('periodFrom') is not None:
+        clauses.append('br.cycle_start >= %s')
+        params.append(filters['periodFrom'])
+    if filters.get('periodTo') is not None:
+        clauses.append('br.cycle_start <= %s')
+        params.append(filters['periodTo'])
+    if filters.get('statusIds'):
+        clauses.append('br.status_id = ANY(%s)')
+        params.append(list(filters['statusIds']))
+    if filters.get('dateFrom') is not None:
+        clauses.append('br.billing_date >= %s')
+        params.append(filters['dateFrom'])
+    if filters.get('dateTo') is not None:
+        clauses.append('br.billing_date <= %s')
+        params.append(filters['dateTo'])
+    
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    return where, params
+
+def check_record_fields(data):
+    """Raise ValueError for a date or amount of a record payload that the database would store as NULL
+
+    Blank values are fine (they clear the field). Dates are MMDDYYYY;
+    amounts may carry $, thousands separators and spaces.
+    """
+    for field in RECORD_DATE_FIELDS:
+        value = data.get(field)
+        if value is None or value == '':
+            continue
+        try:
+            if not re.fullmatch(r'[0-9]{8}', value):
+                raise ValueError
+            datetime.strptime(value, '%m%d%Y')
+        except (TypeError, ValueError):
+            raise ValueError(f"{field} must be an MMDDYYYY date, got {value!r}") from None
+    for field in RECORD_AMOUNT_FIELDS:
+        value = data.get(field)
+        if value is None or str(value).strip() == '':
+            continue
+        try:
+            amount = Decimal(re.sub(r'[$,\s]', '', str(value)))
+        except InvalidOperation:
+            amount = None
+        if (amount is None or not amount.is_finite() or abs(amount) >= AMOUNT_LIMIT
+                or abs(amount.quantize(Decimal('0.01'))) >= AMOUNT_LIMIT):
+            raise ValueError(f"{field} must be a number under 1,000,000,000,000, got {value!r}")
+
+def cycle_bounds(groups, cycle_from, cycle_to, anchor=None):
+    """Per-group cycle_start bounds of a relative cycle range: [group ids], [lows], [highs]
+
+    A bound is None only when its index was not given. Groups with no
+    cycle in the range (custom groups with fewer cycles) are left out, so
+    none of their records match.
+    """
+    group_ids, lows, highs = [], [], []
+    for g in groups:
+        starts = cycle_range_starts(g, cycle_from, cycle_to, anchor)
+        if starts is None:
+            continue
+        group_ids.append(g['id'])
+        lows.append(starts[0])
+        highs.append(starts[1])
+    return group_ids, lows, highs
+
+def cycle_indexer(groups, anchor=None):
+    """Function mapping a RECORD_COLUMNS row to its cycle index relative to `anchor` (today)"""
+    anchor = anchor or date.today()
+    groups = {g['id']: g for g in groups}
+    indexes = {}
+    
+    def index(r):
+        key = (r[2], r[1])
+        if key not in indexes:
+            indexes[key] = cycle_index(groups.get(r[2], {}), r[1], anchor)
+        return indexes[key]
+    return index
+
+def records_query(where, params, after=None, limit=None):
+    """SELECT over billing records for a billing_record_filters clause
+    
+    With `limit`, returns one keyset page (plus one lookahead row) after
+    the (facility_id, cycle_start) key `after`.
+    """
+    if limit is None:
+        return f'SELECT {RECORD_COLUMNS} FROM {RECORD_SOURCE} {where}', params
+    if after is not None:
+        where = (where + ' AND ' if where else 'WHERE ') + '(br.facility_id, br.cycle_start) > (%s, %s)'
+        params = params + list(after)
+    return f'''
+        SELECT {RECORD_COLUMNS}
+        FROM {RECORD_SOURCE}
+        {where}
+        ORDER BY br.facility_id, br.cycle_start
+        LIMIT %s
+    ''', params + [limit + 1]
+
+def keyed_records(rows, index):
+    """Records keyed by facility_id-cycle, the shape the frontend loads"""
+    keyed = {}
+    for r in rows:
+        record = record_to_api(r, index(r))
+        keyed[f"{r[0]}-{record['cycle']}"] = record
+    return keyed
+
+def records_page(rows, limit, index):
+    """(records, next_key) from the rows of a paged records_query"""
+    next_key = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_key = (rows[-1][0], rows[-1][1])
+    return [record_to_api(r, index(r)) for r in rows], next_key
+
+def billing_matrix(group, windows, rows):
+    """Columnar facilities x cycles grid of a group's MATRIX_SQL rows
+    
+    Rows are the group's facilities (facilityIds) and columns its cycle
+    `windows` (cycles, cycleStarts). Every entry of `columns` is a flat
+    row-major list with one value per cell (cell = row * len(cycles) +
+    column), null where the record or field is empty; `present` marks the
+    cells that have a record. Day columns are offsets from the cell's
+    cycle start.
+    """
+    facility_ids = [f['id'] for f in group['facilities']]
+    row_of = {facility_id: i for i, facility_id in enumerate(facility_ids)}
+    column_of = {c.start: j for j, c in enumerate(windows)}
+    width = len(windows)
+    size = len(facility_ids) * width
+    present = [0] * size
+    columns = {name: [None] * size for name in MATRIX_COLUMNS}
+    fields = [columns[name] for name in MATRIX_COLUMNS]
+    for facility_id, start, *values in rows:
+        row, column = row_of.get(facility_id), column_of.get(start)
+        if row is None or column is None:
+            # A facility newer than the cached group, or a start off the calendar
+            continue
+        cell = row * width + column
+        present[cell] = 1
+        for field, value in zip(fields, values):
+            field[cell] = value
+    return {
+        'groupId': group['id'],
+        'facilityIds': facility_ids,
+        'cycles': [c.index for c in windows],
+        'cycleStarts': [c.start.isoformat() for c in windows],
+        'columns': {'present': present, **columns},
+    }
+
+def bootstrap_group(groups, group_id=None):
+    """The group the UI opens on: `group_id`, else the first group (None when there are none)"""
+    if group_id is None:
+        return groups[0] if groups else None
+    group = next((g for g in groups if g['id'] == group_id), None)
+    if group is None:
+        raise LookupError(f"Facility group {group_id} not found")
+    return group
+
+def bootstrap_records_filters(group, first, last):
+    return {'groupId': group['id'], 'cycleFrom': first, 'cycleTo': last}
+
+def bootstrap_payload(groups, facilities, statuses, settings, group, records, first, last, horizon):
+    """Everything the UI needs to render its first screen
+
+    Cycle windows cover every group; records only `group`'s cycles
+    `first`..`last`, the rest are fetched when another group is opened.
+    `horizon`, read before the records, becomes the delta-sync token.
+    """
+    return {
+        'facilityGroups': groups,
+        'facilities': facilities,
+        'statuses': statuses,
+        'settings': settings,
+        'cycles': {
+            str(gid): [cycle_to_api(c) for c in cycles]
+            for gid, cycles in cycles_for_groups(groups, first, last).items()
+        },
+        'groupId': group['id'] if group else None,
+        'cycleFrom': first,
+        'cycleTo': last,
+        'records': records,
+        'changesToken': encode_watermark(horizon),
+    }
+
+def cached(family):
+    """Serve a Database read method from the reference cache, keyed by family and arguments"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            return self._reference_cache.get_or_load(
+                (family, *args), lambda: method(self, *args)
+            )
+        return wrapper
+    return decorator
 
 class Database:
-    def __init__(self):
-        """Initialize database connection"""
+    def __init__(self, **connect_kwargs):
+        """Initialize the connection pool (extra kwargs go to psycopg2.connect)"""
         self.db_url = os.environ.get('DATABASE_URL')
         if not self.db_url:
             raise Exception("DATABASE_URL environment variable not set")
         
         # Railway provides DATABASE_URL in the correct format
-        self.conn = psycopg2.connect(self.db_url)
-        self.create_tables()
+        self.pool = ConnectionPool(
+            self.db_url,
+            minconn=int(os.environ.get('DB_POOL_MIN', 1)),
+            maxconn=int(os.environ.get('DB_POOL_MAX', 10)),
+            timeout=float(os.environ.get('DB_POOL_TIMEOUT', 30)),
+            health_check_interval=float(os.environ.get('DB_POOL_HEALTH_CHECK_INTERVAL', 30)),
+            **connect_kwargs
+        )
+        self._local = threading.local()
+        self._summary_cache = TTLCache(SUMMARY_CACHE_TTL)
+        self._reference_cache = TTLCache(REFERENCE_CACHE_TTL)
+        # Highest change counter seen per table (see sync_cache_versions)
+        self._seen_versions = {}
+        self._seen_versions_lock = threading.Lock()
+        try:
+            self.create_tables()
+        finally:
+            self.release_connection()
+        
+        # Notifications missed while the listener was disconnected can't be
+        # replayed, so a reconnect flushes everything
+        self.listener = NotificationListener(self.db_url)
+        self.listener.subscribe(CACHE_CHANNEL, lambda payload: self._invalidate_local(payload.split(',')))
+        self.listener.on_reconnect(lambda: self._invalidate_local())
+        self.listener.start()
     
-    def create_tables(self):
-        """Create all necessary tables if they don't exist"""
-        with self.conn.cursor() as cur:
-            # Status Groups table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS status_groups (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    is_default BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-
-            # Billing Statuses table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS billing_statuses (
-                    id SERIAL PRIMARY KEY,
-                    status_group_id INTEGER REFERENCES status_groups(id) ON DELETE CASCADE,
-                    name VARCHAR(100) NOT NULL,
-                    color VARCHAR(20) NOT NULL,
-                    sort_order INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            # Facility Groups table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS facility_groups (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    billing_type VARCHAR(50) NOT NULL,
-                    billing_day INTEGER,
-                    status_group_id INTEGER REFERENCES status_groups(id) DEFAULT 1,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Facilities table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS facilities (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) NOT NULL,
-                    group_id INTEGER REFERENCES facility_groups(id) ON DELETE CASCADE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Billing Records table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS billing_records (
-                    id SERIAL PRIMARY KEY,
-                    facility_id INTEGER REFERENCES facilities(id) ON DELETE CASCADE,
-                    cycle INTEGER NOT NULL,
-                    billing_date VARCHAR(8),
-                    from_date VARCHAR(8),
-                    through_date VARCHAR(8),
-                    billed_amount VARCHAR(50),
-                    status_id INTEGER REFERENCES billing_statuses(id),
-                    paid_amount VARCHAR(50),
-                    paid_date VARCHAR(8),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(facility_id, cycle)
-                )
-            ''')
-            
-            # Custom Dates table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS custom_dates (
-                    id SERIAL PRIMARY KEY,
-                    group_id INTEGER REFERENCES facility_groups(id) ON DELETE CASCADE,
-                    date VARCHAR(8) NOT NULL,
-                    frequency VARCHAR(50),
-                    custom_from VARCHAR(10),
-                    custom_through VARCHAR(10),
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Settings table
-            cur.execute('''
-                CREATE TABLE IF NOT EXISTS settings (
-                    id SERIAL PRIMARY KEY,
-                    key VARCHAR(100) UNIQUE NOT NULL,
-                    value TEXT,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            
-            self.conn.commit()
-            
-           # Insert default data if tables are empty
-            self._insert_default_data()
-            
-           # Run migrations for existing tables
-            self._run_migrations()
-            
-
-            
-    def _run_migrations(self):
-        """Run database migrations for schema updates"""
+    @property
+    def conn(self):
+        """Connection borrowed by the current thread (checked out on first use)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self.pool.getconn()
+            self._local.conn = conn
+        return conn
+    
+    def release_connection(self):
+        """Return the current thread's connection to the pool, if it borrowed one"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._local.conn = None
+            self.pool.putconn(conn)
+    
+    def _invalidate_local(self, families=None):
+        """Drop cache families in this worker (everything when `families` is None)"""
+        if families is None:
+            self._reference_cache.invalidate()
+            self._summary_cache.invalidate()
+            return
+        families = set(families)
+        if 'billing_summary' in families:
+            self._summary_cache.invalidate()
+        self._reference_cache.invalidate(*(families - {'billing_summary'}))
+    
+    def _commit(self, *families):
+        """Commit, invalidating the given cache families in every worker
+        
+        The NOTIFY is queued in the same transaction, so other workers only
+        hear about committed changes; this worker invalidates synchronously
+        so its next read sees the write.
+        """
         with self.conn.cursor() as cur:
-            try:
-                # Insert status group first if it doesn't exist
-                cur.execute('''
-                    INSERT INTO status_groups (id, name, is_default)
-                    VALUES (1, 'Default', true)
-                    ON CONFLICT (id) DO NOTHING
-                ''')
-                
-                # Insert default statuses if they don't exist
-                cur.execute('''
-                    INSERT INTO billing_statuses (status_group_id, name, color, sort_order)
-                    VALUES 
-                        (1, 'Not Billed', '#93C5FD', 1),
-                        (1, 'Billed', '#FDE047', 2),
-                        (1, 'Pending', '#C4B5FD', 3),
-                        (1, 'Approved', '#86EFAC', 4),
-                        (1, 'Paid', '#22C55E', 5)
-                    ON CONFLICT DO NOTHING
-                ''')
-                
-                # Now add columns (without foreign key constraints to avoid errors)
-                cur.execute('''
-                    ALTER TABLE facility_groups 
-                    ADD COLUMN IF NOT EXISTS status_group_id INTEGER DEFAULT 1
-                ''')
-                
-                cur.execute('''
-                    ALTER TABLE billing_records 
-                    ADD COLUMN IF NOT EXISTS billed_amount VARCHAR(50)
-                ''')
-                
-                cur.execute('''
-                    ALTER TABLE billing_records 
-                    ADD COLUMN IF NOT EXISTS status_id INTEGER
-                ''')
-                
-                self.conn.commit()
-                print("Migration completed successfully")
-            except Exception as e:
-                self.conn.rollback()
-                print(f"Migration error: {e}")
-                
-                
+            cur.execute('SELECT pg_notify(%s, %s)', (CACHE_CHANNEL, ','.join(families)))
+        self.conn.commit()
+        self._invalidate_local(families)
+    
+    def cache_stats(self):
+        """Hit/miss counters of the in-process caches"""
+        return {'reference': self._reference_cache.stats(), 'summary': self._summary_cache.stats()}
     
-    def _insert_default_data(self):
-        """Insert default data if database is empty"""
+    def create_tables(self):
+        """Bring the schema up to date and pre-create upcoming billing_records partitions
+        
+        Neither runs DDL when nothing is missing.
+        """
+        migrate(self)
+        self.ensure_partitions()
+    
+    def get_table_versions(self, tables):
+        """Current change counter of each table in `tables`"""
         with self.conn.cursor() as cur:
-            # Check if we have any groups
-            cur.execute('SELECT COUNT(*) FROM facility_groups')
-            count = cur.fetchone()[0]
-            
-            if count == 0:
-                # Insert default status group
-                cur.execute('''
-                    INSERT INTO status_groups (id, name, is_default)
-                    VALUES (1, 'Default', true)
-                    ON CONFLICT (id) DO NOTHING
-                ''')
-
-                # Insert default statuses
-                cur.execute('''
-                    INSERT INTO billing_statuses (status_group_id, name, color, sort_order)
-                    VALUES 
-                        (1, 'Not Billed', '#93C5FD', 1),
-                        (1, 'Billed', '#FDE047', 2),
-                        (1, 'Pending', '#C4B5FD', 3),
-                        (1, 'Approved', '#86EFAC', 4),
-                        (1, 'Paid', '#22C55E', 5)
-                    ON CONFLICT DO NOTHING
-                ''')
-                # Insert default groups
-                cur.execute('''
-                    INSERT INTO facility_groups (id, name, billing_type, billing_day)
-                    VALUES 
-                        (1, 'Alabama Facilities', 'monthly', 1),
-                        (2, 'Weekly Facilities', 'weekly', 5)
-                ''')
-                
-                # Insert default facilities
-                cur.execute('''
-                    INSERT INTO facilities (id, name, group_id)
-                    VALUES 
-                        (1, 'Birmingham Care Center', 1),
-                        (2, 'Montgomery Health', 1),
-                        (3, 'Phoenix Center', 2),
-                        (4, 'Sunrise Health', 2)
-                ''')
-                
-                self.conn.commit()
+            cur.execute(TABLE_VERSIONS_SQL, (list(tables),))
+            versions = dict(cur.fetchall())
+        return {table: versions.get(table, 0) for table in tables}
+    
+    def sync_cache_versions(self, versions):
+        """Drop this worker's cached reads of tables whose counters passed the highest seen
+        
+        The NOTIFY that invalidates caches arrives after the commit, so a
+        worker can read a table's new counter while still caching the old
+        data. Callers tagging responses with `versions` call this before
+        loading, so a new ETag never goes out with a stale body. Returns
+        whether anything was dropped.
+        """
+        with self._seen_versions_lock:
+            changed = [table for table, version in versions.items()
+                       if version > self._seen_versions.get(table, -1)]
+            if not changed:
+                return False
+            families = {family for table in changed for family in TABLE_CACHE_FAMILIES.get(table, ())}
+            # Still under the lock: no caller sees the new versions before the drop
+            self._invalidate_local(families)
+            for table in changed:
+                self._seen_versions[table] = versions[table]
+        return True
     
     # ========================================================================
     # FACILITY GROUPS
     # ========================================================================
     
+    @cached('facility_groups')
     def get_facility_groups(self):
-        """Get all facility groups with their facilities and custom dates"""
+        """Get all facility groups with their facilities, statuses and custom dates"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT id, name, billing_type, billing_day
-                FROM facility_groups
-                ORDER BY id
-            ''')
-            groups = cur.fetchall()
-            
-            # Get facilities and custom dates for each group
-            for group in groups:
-                # Get facilities
-                cur.execute('''
-                    SELECT id, name
-                    FROM facilities
-                    WHERE group_id = %s
-                    ORDER BY id
-                ''', (group['id'],))
-                group['facilities'] = cur.fetchall()
-                
-                # Get statuses for this facility group (ONLY ONCE)
-                try:
-                    cur.execute('''
-                        SELECT id, name, color
-                        FROM billing_statuses
-                        WHERE group_id = %s
-                        ORDER BY id
-                    ''', (group['id'],))
-                    group['statuses'] = cur.fetchall()
-                except Exception as e:
-                    print(f"Error getting statuses for group {group['id']}: {e}")
-                    group['statuses'] = []
-                    
-                # Get custom dates
-                cur.execute('''
-                    SELECT date, frequency, custom_from, custom_through
-                    FROM custom_dates
-                    WHERE group_id = %s
-                    ORDER BY date DESC
-                ''', (group['id'],))
-                custom_dates = cur.fetchall()
-                
-                # Convert to format expected by frontend
-                group['customDates'] = []
-                for cd in custom_dates:
-                    date_obj = {'date': cd['date'], 'frequency': cd['frequency']}
-                    if cd['custom_from']:
-                        date_obj['customFrom'] = cd['custom_from']
-                    if cd['custom_through']:
-                        date_obj['customThrough'] = cd['custom_through']
-                    group['customDates'].append(date_obj)
-                
-                # Convert snake_case to camelCase for frontend
-                group['billingType'] = group.pop('billing_type')
-                group['billingDay'] = group.pop('billing_day')
-            
-            return groups
+            # One round trip: child rows are aggregated per group in the database
+            cur.execute(FACILITY_GROUPS_SQL)
+            return cur.fetchall()
+    
+    @staticmethod
+    def _billing_day(data):
+        """Billing day of a group payload as stored (the UI sends monthly days as billingDate)"""
+        value = data.get('billingDay')
+        return parse_billing_day(data.get('billingDate') if value is None else value)
     
     def create_facility_group(self, data):
         """Create a new facility group"""
@@ -278,9 +661,9 @@ class Database:
                 INSERT INTO facility_groups (name, billing_type, billing_day)
                 VALUES (%s, %s, %s)
                 RETURNING id
-            ''', (data['name'], data['billingType'], data.get('billingDay')))
+            ''', (data['name'], data['billingType'], self._billing_day(data)))
             group_id = cur.fetchone()[0]
-            self.conn.commit()
+            self._commit('facility_groups')
             return group_id
     
     def update_facility_group(self, group_id, data):
@@ -290,34 +673,46 @@ class Database:
                 UPDATE facility_groups
                 SET name = %s, billing_type = %s, billing_day = %s, updated_at = CURRENT_TIMESTAMP
                 WHERE id = %s
-            ''', (data['name'], data['billingType'], data.get('billingDay'), group_id))
-            self.conn.commit()
+            ''', (data['name'], data['billingType'], self._billing_day(data), group_id))
+            self._commit('facility_groups')
     
     def delete_facility_group(self, group_id):
         """Delete a facility group (cascades to facilities and records)"""
         with self.conn.cursor() as cur:
             cur.execute('DELETE FROM facility_groups WHERE id = %s', (group_id,))
-            self.conn.commit()
+            self._commit('facility_groups', 'facilities', 'custom_dates', 'billing_summary')
+    
+    def get_group_facility_ids(self, group_id):
+        """Ids of a group's facilities, or None when the group does not exist"""
+        with self.conn.cursor() as cur:
+            cur.execute('''
+                SELECT array_remove(array_agg(f.id ORDER BY f.id), NULL)
+                FROM facility_groups fg
+                LEFT JOIN facilities f ON f.group_id = fg.id
+                WHERE fg.id = %s
+                GROUP BY fg.id
+            ''', (group_id,))
+            row = cur.fetchone()
+            return row[0] if row else None
+    
+    def delete_facility_records(self, facility_ids):
+        """Delete every billing record of the given facilities; returns how many"""
+        with self.conn.cursor() as cur:
+            cur.execute('DELETE FROM billing_records WHERE facility_id = ANY(%s)', (list(facility_ids),))
+            count = cur.rowcount
+            self._commit('billing_summary')
+        return count
     
     # ========================================================================
     # FACILITIES
     # ========================================================================
     
+    @cached('facilities')
     def get_facilities(self):
         """Get all facilities"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT id, name, group_id
-                FROM facilities
-                ORDER BY id
-            ''')
-            facilities = cur.fetchall()
-            
-            # Convert snake_case to camelCase
-            for f in facilities:
-                f['groupId'] = f.pop('group_id')
-            
-            return facilities
+            cur.execute(FACILITIES_SQL)
+            return cur.fetchall()
     
     def create_facility(self, data):
         """Create a new facility"""
@@ -328,131 +723,645 @@ class Database:
                 RETURNING id
             ''', (data['name'], data['groupId']))
             facility_id = cur.fetchone()[0]
-            self.conn.commit()
+            self._commit('facilities', 'facility_groups')
             return facility_id
     
     def delete_facility(self, facility_id):
         """Delete a facility (cascades to billing records)"""
         with self.conn.cursor() as cur:
             cur.execute('DELETE FROM facilities WHERE id = %s', (facility_id,))
-            self.conn.commit()
+            self._commit('facilities', 'facility_groups', 'billing_summary')
     
     # ========================================================================
     # BILLING RECORDS
     # ========================================================================
     
-    def get_billing_records(self):
-        """Get all billing records"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT 
-                    facility_id, cycle, billing_date, from_date, through_date,
-                    billed_amount, paid_amount, paid_date, status_id
-                FROM billing_records
-            ''')
+    def _billing_record_filters(self, filters):
+        """billing_record_filters with this worker's cached facility groups"""
+        filters = filters or {}
+        needs_groups = filters.get('cycleFrom') is not None or filters.get('cycleTo') is not None
+        return billing_record_filters(filters, self.get_facility_groups() if needs_groups else ())
+    
+    def _facility_groups_by_facility(self):
+        """Function mapping a facility id to its (API-shaped) group; {} when ungrouped"""
+        groups = {g['id']: g for g in self.get_facility_groups()}
+        facilities = {f['id']: f['groupId'] for f in self.get_facilities()}
+        refreshed = []
+        
+        def group_of(facility_id):
+            if facility_id not in facilities and not refreshed:
+                # Possibly created in another worker whose notification hasn't arrived yet
+                refreshed.append(True)
+                self._reference_cache.invalidate('facilities', 'facility_groups')
+                groups.update((g['id'], g) for g in self.get_facility_groups())
+                facilities.update((f['id'], f['groupId']) for f in self.get_facilities())
+            return groups.get(facilities.get(facility_id), {})
+        return group_of
+    
+    def _cycle_indexer(self, anchor=None):
+        """cycle_indexer over this worker's cached facility groups"""
+        return cycle_indexer(self.get_facility_groups(), anchor)
+    
+    def get_billing_records(self, filters=None):
+        """Get billing records keyed by facility_id-cycle (optionally filtered)
+        
+        The cycle in the key is relative to today, as the frontend expects.
+        """
+        sql, params = records_query(*self._billing_record_filters(filters))
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
             records = cur.fetchall()
             
             # Convert to format expected by frontend (keyed by facility_id-cycle)
-            records_dict = {}
-            for r in records:
-                key = f"{r['facility_id']}-{r['cycle']}"
-                records_dict[key] = {
-                    'facilityId': r['facility_id'],
-                    'cycle': r['cycle'],
-                    'billingDate': r['billing_date'],
-                    'fromDate': r['from_date'],
-                    'throughDate': r['through_date'],
-                    'billedAmount': r['billed_amount'] or '',
-                    'paidAmount': r['paid_amount'] or '',
-                    'paidDate': r['paid_date'] or '',
-                    'statusId': r['status_id']
-                }
-            
-            return records_dict
+            return keyed_records(records, self._cycle_indexer())
+    
+    def get_billing_records_by_keys(self, keys):
+        """API-shaped records for (facility_id, cycle_start) keys; keys without a record are skipped"""
+        if not keys:
+            return []
+        where = 'WHERE (br.facility_id, br.cycle_start) IN (SELECT * FROM unnest(%s::int[], %s::date[]))'
+        sql, params = records_query(where, [[k[0] for k in keys], [k[1] for k in keys]])
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        index = self._cycle_indexer()
+        return [record_to_api(r, index(r)) for r in rows]
+    
+    def get_changes_horizon(self):
+        """Timestamp before which every billing record change is visible (see CHANGES_HORIZON_SQL)"""
+        with self.conn.cursor() as cur:
+            cur.execute(CHANGES_HORIZON_SQL)
+            return cur.fetchone()[0]
+    
+    def get_billing_record_changes(self, token, limit=CHANGES_MAX_RECORDS):
+        """Billing records written and deleted since a delta-sync token
+        
+        Returns {'token', 'upserted', 'deleted', 'reset'}: upserted records
+        in their current state and the (facilityId, cycleStart) keys of
+        records that no longer exist, plus the token to pass next time.
+        Changes right at the watermark may be repeated; applying them again
+        is harmless. When more than `limit` records changed, the lists are
+        empty and `reset` is True: reload instead. Raises ValueError for a
+        malformed token and WatermarkExpired for one older than the
+        tombstone retention.
+        """
+        since = decode_watermark(token)
+        # Read before the changes, so anything committed later is >= it
+        horizon = self.get_changes_horizon()
+        if since < horizon - timedelta(days=TOMBSTONE_RETENTION_DAYS):
+            raise WatermarkExpired(f"Changes token is older than {TOMBSTONE_RETENTION_DAYS} days; reload")
+        with self.conn.cursor() as cur:
+            cur.execute(f'''
+                SELECT {RECORD_COLUMNS} FROM {RECORD_SOURCE}
+                WHERE br.updated_at >= %s
+                LIMIT %s
+            ''', (since, limit + 1))
+            rows = cur.fetchall()
+            cur.execute('''
+                SELECT DISTINCT t.facility_id, t.cycle_start
+                FROM billing_record_tombstones t
+                WHERE t.deleted_at >= %s
+                  AND NOT EXISTS (
+                      SELECT 1 FROM billing_records br
+                      WHERE br.facility_id = t.facility_id AND br.cycle_start = t.cycle_start
+                  )
+                LIMIT %s
+            ''', (since, limit + 1))
+            deleted = cur.fetchall()
+        if len(rows) + len(deleted) > limit:
+            return {'token': encode_watermark(horizon), 'upserted': [], 'deleted': [], 'reset': True}
+        index = self._cycle_indexer()
+        return {
+            'token': encode_watermark(horizon),
+            'upserted': [record_to_api(r, index(r)) for r in rows],
+            'deleted': [{'facilityId': facility_id, 'cycleStart': start.isoformat()}
+                        for facility_id, start in deleted],
+            'reset': False,
+        }
+    
+    def purge_tombstones(self):
+        """Delete tombstones past the retention period; returns how many"""
+        with self.conn.cursor() as cur:
+            cur.execute('''
+                DELETE FROM billing_record_tombstones
+                WHERE deleted_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+            ''', (TOMBSTONE_RETENTION_DAYS,))
+            count = cur.rowcount
+        self.conn.commit()
+        return count
+    
+    def get_bootstrap(self, group_id=None, first=-PAST_CYCLES, last=FUTURE_CYCLES):
+        """Reference data, settings, cycle windows and one group's records in one payload
+        
+        Raises LookupError for an unknown `group_id` and ValueError for a bad cycle range.
+        """
+        check_cycle_range(first, last)
+        horizon = self.get_changes_horizon()
+        groups = self.get_facility_groups()
+        group = bootstrap_group(groups, group_id)
+        records = self.get_billing_records(bootstrap_records_filters(group, first, last)) if group else {}
+        return bootstrap_payload(groups, self.get_facilities(), self.get_all_statuses(),
+                                 self.get_settings(), group, records, first, last, horizon)
+    
+    def get_billing_records_page(self, filters=None, after=None, limit=RECORDS_PAGE_SIZE):
+        """Get one page of billing records ordered by (facility_id, cycle_start)
+        
+        `after` is the (facility_id, cycle_start) key of the last record of
+        the previous page. Returns (records, next_key); next_key is None on
+        the last page.
+        """
+        limit = max(1, min(limit, RECORDS_MAX_PAGE_SIZE))
+        where, params = self._billing_record_filters(filters)
+        sql, params = records_query(where, params, after=after, limit=limit)
+        with self.conn.cursor() as cur:
+            cur.execute(sql, params)
+            rows = cur.fetchall()
+        return records_page(rows, limit, self._cycle_indexer())
+    
+    def get_billing_matrix(self, group_id, first=-PAST_CYCLES, last=FUTURE_CYCLES):
+        """One group's records for cycles `first`..`last` as a columnar grid (see billing_matrix)
+        
+        Raises LookupError for an unknown group and ValueError for a bad cycle range.
+        """
+        group = bootstrap_group(self.get_facility_groups(), group_id)
+        windows = cycles_for_group(group, first, last)
+        if not windows:
+            return billing_matrix(group, windows, [])
+        with self.conn.cursor() as cur:
+            cur.execute(MATRIX_SQL, (group_id, windows[0].start, windows[-1].start))
+            return billing_matrix(group, windows, cur.fetchall())
+    
+    def iter_billing_records(self, filters=None, itersize=EXPORT_ITERSIZE):
+        """Yield billing records one by one through a server-side cursor
+        
+        Only `itersize` rows are held in memory at a time, so exports of any
+        size run in constant memory.
+        """
+        where, params = self._billing_record_filters(filters)
+        index = self._cycle_indexer()
+        conn = self.conn
+        try:
+            with conn.cursor(name=f'billing_export_{id(conn)}') as cur:
+                cur.itersize = itersize
+                cur.execute(f'''
+                    SELECT {RECORD_COLUMNS}
+                    FROM {RECORD_SOURCE}
+                    {where}
+                    ORDER BY br.facility_id, br.cycle_start
+                ''', params)
+                for r in cur:
+                    yield record_to_api(r, index(r))
+        finally:
+            # The named cursor lived in a read-only transaction; end it
+            conn.rollback()
+    
+    @staticmethod
+    def _record_cycle_start(data, group, anchor=None):
+        """Absolute cycle of a record payload: its cycleStart, or its relative cycle resolved in `group`"""
+        if data.get('cycleStart'):
+            return parse_date(data['cycleStart'])
+        start = cycle_start(group, int(data['cycle']), anchor)
+        if start is None:
+            raise ValueError(f"Cycle {data['cycle']} does not exist in the facility's group")
+        return start
+    
+    @staticmethod
+    def _record_values(data, start):
+        """Column values for UPSERT_RECORD_SQL from an API record payload and its cycle start"""
+        return (
+            data['facilityId'],
+            start,
+            data.get('billingDate'),
+            data.get('fromDate'),
+            data.get('throughDate'),
+            data.get('billedAmount', ''),
+            data.get('paidAmount', ''),
+            data.get('paidDate', ''),
+            data.get('statusId')
+        )
     
     def save_billing_record(self, data):
-        """Create or update a billing record"""
+        """Create or update a billing record
+        
+        The record is identified by facilityId plus either cycleStart (ISO
+        or MMDDYYYY date) or cycle (relative to today).
+        """
+        check_record_fields(data)
+        group = self._facility_groups_by_facility()(int(data['facilityId']))
+        start = self._record_cycle_start(data, group)
         with self.conn.cursor() as cur:
+            cur.execute(
+                UPSERT_RECORD_SQL.format(values=RECORD_VALUES_TEMPLATE),
+                self._record_values(data, start)
+            )
+            self._commit('billing_summary')
+    
+    def save_billing_records(self, records):
+        """Create or update many billing records in a single transaction
+        
+        Rows are identified like in save_billing_record. Returns one outcome
+        per input row, in order: {'index', 'status'} where status is
+        'inserted', 'updated', 'skipped' (a later row in the batch has the
+        same facility and cycle) or 'error' (with 'error'). Invalid rows are
+        reported and left out; the valid rows are applied in one
+        INSERT ... ON CONFLICT statement.
+        """
+        results = [{'index': i, 'status': None} for i in range(len(records))]
+        group_of = self._facility_groups_by_facility()
+        today = date.today()
+        
+        # Validate shape and keep only the last row per (facility, cycle start)
+        latest = {}
+        for i, data in enumerate(records):
+            try:
+                facility_id = int(data['facilityId'])
+                key = (facility_id, self._record_cycle_start(data, group_of(facility_id), today))
+            except (KeyError, TypeError, ValueError):
+                results[i].update(status='error', error='facilityId must be an integer and cycleStart '
+                                                        'a date or cycle an existing cycle index')
+                continue
+            if data.get('statusId') is not None and not isinstance(data['statusId'], int):
+                results[i].update(status='error', error='statusId must be an integer')
+                continue
+            try:
+                check_record_fields(data)
+            except ValueError as e:
+                results[i].update(status='error', error=str(e))
+                continue
+            if key in latest:
+                results[latest[key]].update(status='skipped', error=f'superseded by row {i}')
+            latest[key] = i
+        
+        with self.conn.cursor() as cur:
+            # Report unknown facilities and statuses per row instead of failing the batch
+            facility_ids = list({key[0] for key in latest})
+            cur.execute('SELECT id FROM facilities WHERE id = ANY(%s)', (facility_ids,))
+            known_facilities = {row[0] for row in cur.fetchall()}
+            status_ids = list({records[i].get('statusId') for i in latest.values()} - {None})
+            cur.execute('SELECT id FROM billing_statuses WHERE id = ANY(%s)', (status_ids,))
+            known_statuses = {row[0] for row in cur.fetchall()}
+            
+            rows = {}
+            for key, i in latest.items():
+                data = records[i]
+                if key[0] not in known_facilities:
+                    results[i].update(status='error', error=f'unknown facility {key[0]}')
+                elif data.get('statusId') is not None and data['statusId'] not in known_statuses:
+                    results[i].update(status='error', error=f"unknown status {data['statusId']}")
+                else:
+                    rows[key] = i
+            
+            if rows:
+                applied = execute_values(
+                    cur,
+                    UPSERT_RECORD_SQL.format(values='%s') + ' RETURNING facility_id, cycle_start, (xmax = 0)',
+                    [self._record_values({**records[i], 'facilityId': key[0]}, key[1])
+                     for key, i in sorted(rows.items())],
+                    template=RECORD_VALUES_TEMPLATE,
+                    page_size=1000,
+                    fetch=True
+                )
+                for facility_id, start, inserted in applied:
+                    results[rows[(facility_id, start)]]['status'] = 'inserted' if inserted else 'updated'
+            self._commit('billing_summary')
+        
+        return results
+    
+    def generate_placeholders(self, cycles=PLACEHOLDER_CYCLES, anchor=None):
+        """Create the records of the current and next `cycles` cycles for every facility
+        
+        Windows come from each group's billing settings, as for the cycles the
+        frontend shows; the current cycle is the one containing `anchor`
+        (today by default). Records are inserted in one statement with their
+        billing/from/through dates and the group's PLACEHOLDER_STATUS status
+        (none if its status group has no such status). Records that already
+        exist are left alone, so running it again only fills gaps.
+        """
+        if cycles < 0:
+            raise ValueError("cycles must not be negative")
+        today = date.today()
+        windows = [(group['id'], cycle)
+                   for group in self.get_facility_groups()
+                   for cycle in cycles_for_group(group, 0, cycles, anchor or today)]
+        if not windows:
+            return {'cycles': cycles, 'windows': 0, 'inserted': 0}
+        starts = [cycle.start for _, cycle in windows]
+        # Cover the new cycle starts with partitions instead of the default partition
+        last = max(starts)
+        ahead = ((last.year - today.year) * 12 + last.month - today.month) // partitions.PARTITION_MONTHS + 1
+        with self.conn.cursor() as cur:
+            partitions.ensure_partitions(cur, since=min(starts), ahead=max(ahead, partitions.PARTITIONS_AHEAD))
+            cur.execute(PLACEHOLDERS_SQL, {
+                'groups': [group_id for group_id, _ in windows],
+                'starts': starts,
+                'billing': [cycle.billing for _, cycle in windows],
+                'through': [cycle.end for _, cycle in windows],
+                'status': PLACEHOLDER_STATUS,
+            })
+            inserted = cur.rowcount
+            self._commit('billing_summary')
+        return {'cycles': cycles, 'windows': len(windows), 'inserted': inserted}
+    
+    def get_billing_summary(self, filters=None, group_by=(), period='month'):
+        """Billed, paid and outstanding totals with per-status counts
+        
+        `group_by` is a sequence of SUMMARY_DIMENSIONS names; `period` sets
+        the calendar granularity of the 'period' dimension. Results are
+        cached per argument combination until billing records change.
+        """
+        group_by = list(dict.fromkeys(group_by))
+        unknown = [d for d in group_by if d not in SUMMARY_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown summary dimension(s): {', '.join(unknown)}")
+        if period not in SUMMARY_PERIODS:
+            raise ValueError(f"Unknown summary period: {period}")
+        
+        key = (
+            tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                         for k, v in (filters or {}).items() if v is not None)),
+            tuple(group_by),
+            period,
+            # cycleFrom/cycleTo are relative to today
+            date.today(),
+        )
+        return self._summary_cache.get_or_load(
+            key, lambda: self._load_billing_summary(filters, group_by, period)
+        )
+    
+    def _load_billing_summary(self, filters, group_by, period):
+        filters = {k: v for k, v in (filters or {}).items() if v is not None}
+        select_params = [period] if 'period' in group_by else []
+        keys = [SUMMARY_DIMENSIONS[d][0] for d in group_by]
+        # Positional GROUP BY: output names like "period" would resolve to input columns
+        ordinals = ', '.join(str(i + 1) for i in range(len(keys) + 1))
+        
+        # Filters on group/facility/status only can be answered from the rollups
+        # (O(facilities x months)) instead of scanning billing_records
+        if set(filters) <= ROLLUP_FILTERS:
+            columns = ''.join(f'{SUMMARY_DIMENSIONS[d][2]} AS "{SUMMARY_DIMENSIONS[d][0]}", '
+                              for d in group_by)
+            clauses, params = [], []
+            if 'groupId' in filters:
+                clauses.append('r.group_id = %s')
+                params.append(filters['groupId'])
+            if 'facilityId' in filters:
+                clauses.append('r.facility_id = %s')
+                params.append(filters['facilityId'])
+            if filters.get('statusIds'):
+                clauses.append('r.status_id = ANY(%s)')
+                params.append(list(filters['statusIds']))
+            where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+            sql = f'''
+                SELECT {columns}
+                       NULLIF(r.status_id, 0) AS "_statusId",
+                       SUM(r.record_count) AS record_count,
+                       SUM(r.billed_total) AS billed,
+                       SUM(r.paid_total) AS paid
+                FROM billing_rollups r
+                LEFT JOIN facility_groups fg ON fg.id = r.group_id
+                {where}
+                GROUP BY {ordinals}
+                ORDER BY {ordinals}
+            '''
+        else:
+            columns = ''.join(f'{SUMMARY_DIMENSIONS[d][1]} AS "{SUMMARY_DIMENSIONS[d][0]}", '
+                              for d in group_by)
+            where, params = self._billing_record_filters(filters)
+            sql = f'''
+                SELECT {columns}
+                       br.status_id AS "_statusId",
+                       COUNT(*) AS record_count,
+                       COALESCE(SUM(br.billed_amount), 0) AS billed,
+                       COALESCE(SUM(br.paid_amount), 0) AS paid
+                FROM billing_records br
+                LEFT JOIN facilities f ON f.id = br.facility_id
+                LEFT JOIN facility_groups fg ON fg.id = f.group_id
+                {where}
+                GROUP BY {ordinals}
+                ORDER BY {ordinals}
+            '''
+        
+        # Group by the requested dimensions plus status, then fold statuses in Python
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(sql, select_params + params)
+            rows = cur.fetchall()
+        
+        buckets = {}
+        for row in rows:
+            bucket_key = tuple(row[k] for k in keys)
+            bucket = buckets.get(bucket_key)
+            if bucket is None:
+                bucket = buckets[bucket_key] = {
+                    **{k: row[k] for k in keys},
+                    'count': 0, 'billed': 0, 'paid': 0, 'statusCounts': {}
+                }
+            bucket['count'] += row['record_count']
+            bucket['billed'] += row['billed']
+            bucket['paid'] += row['paid']
+            status_key = 'none' if row['_statusId'] is None else str(row['_statusId'])
+            bucket['statusCounts'][status_key] = bucket['statusCounts'].get(status_key, 0) + row['record_count']
+        
+        totals = {'count': 0, 'billed': 0, 'paid': 0}
+        groups = []
+        for bucket in buckets.values():
+            for k in totals:
+                totals[k] += bucket[k]
+            if bucket.get('period') is not None:
+                bucket['period'] = bucket['period'].isoformat()
+            groups.append(self._summary_amounts(bucket))
+        
+        return {'groupBy': list(group_by), 'period': period,
+                'totals': self._summary_amounts(totals), 'groups': groups}
+    
+    @staticmethod
+    def _summary_amounts(bucket):
+        """Add the outstanding balance and render amounts as strings"""
+        billed, paid = bucket['billed'], bucket['paid']
+        bucket['billed'] = str(billed)
+        bucket['paid'] = str(paid)
+        bucket['outstanding'] = str(billed - paid)
+        return bucket
+    
+    def rebuild_rollups(self, dry_run=False):
+        """Recompute billing_rollups from billing_records and report drift
+        
+        Writes to billing_records are blocked while the rollups are
+        recomputed. Returns row counts plus up to 20 sample differences
+        between the stored and recomputed rollups.
+        """
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute('LOCK TABLE billing_records IN SHARE MODE')
+            cur.execute(f'''
+                CREATE TEMP TABLE expected_rollups ON COMMIT DROP AS
+                SELECT f.group_id, br.facility_id,
+                       {ROLLUP_PERIOD_SQL.format(row='br')} AS period,
+                       {ROLLUP_STATUS_SQL.format(row='br')} AS status_id,
+                       COUNT(*) AS record_count,
+                       COALESCE(SUM(br.billed_amount), 0) AS billed_total,
+                       COALESCE(SUM(br.paid_amount), 0) AS paid_total
+                FROM billing_records br
+                LEFT JOIN facilities f ON f.id = br.facility_id
+                WHERE br.facility_id IS NOT NULL
+                GROUP BY 1, 2, 3, 4
+            ''')
             cur.execute('''
-                INSERT INTO billing_records 
-                    (facility_id, cycle, billing_date, from_date, through_date, 
-                     billed_amount, paid_amount, paid_date, status_id)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                ON CONFLICT (facility_id, cycle) 
-                DO UPDATE SET
-                    billing_date = EXCLUDED.billing_date,
-                    from_date = EXCLUDED.from_date,
-                    through_date = EXCLUDED.through_date,
-                    billed_amount = EXCLUDED.billed_amount,
-                    paid_amount = EXCLUDED.paid_amount,
-                    paid_date = EXCLUDED.paid_date,
-                    status_id = EXCLUDED.status_id,
-                    updated_at = CURRENT_TIMESTAMP
-            ''', (
-                data['facilityId'],
-                data['cycle'],
-                data.get('billingDate'),
-                data.get('fromDate'),
-                data.get('throughDate'),
-                data.get('billedAmount', ''),
-                data.get('paidAmount', ''),
-                data.get('paidDate', ''),
-                data.get('statusId')
-            ))
-            self.conn.commit()
+                SELECT COALESCE(e.facility_id, r.facility_id) AS facility_id,
+                       COALESCE(e.period, r.period) AS period,
+                       COALESCE(e.status_id, r.status_id) AS status_id,
+                       CASE WHEN r.facility_id IS NULL THEN 'missing'
+                            WHEN e.facility_id IS NULL THEN 'extra'
+                            ELSE 'mismatched' END AS kind,
+                       e.record_count AS expected_count, r.record_count AS stored_count,
+                       e.billed_total AS expected_billed, r.billed_total AS stored_billed,
+                       e.paid_total AS expected_paid, r.paid_total AS stored_paid
+                FROM expected_rollups e
+                FULL JOIN billing_rollups r USING (facility_id, period, status_id)
+                WHERE e.facility_id IS NULL OR r.facility_id IS NULL
+                   OR (e.group_id, e.record_count, e.billed_total, e.paid_total)
+                      IS DISTINCT FROM (r.group_id, r.record_count, r.billed_total, r.paid_total)
+                ORDER BY 1, 2, 3
+            ''')
+            drift = cur.fetchall()
+            
+            if not dry_run:
+                cur.execute('DELETE FROM billing_rollups')
+                cur.execute('''
+                    INSERT INTO billing_rollups
+                        (group_id, facility_id, period, status_id, record_count, billed_total, paid_total)
+                    SELECT group_id, facility_id, period, status_id, record_count, billed_total, paid_total
+                    FROM expected_rollups
+                ''')
+            cur.execute('SELECT COUNT(*) AS n FROM expected_rollups')
+            total = cur.fetchone()['n']
+            if dry_run:
+                self.conn.rollback()
+            else:
+                self._commit('billing_summary')
+        
+        counts = {'missing': 0, 'extra': 0, 'mismatched': 0}
+        for d in drift:
+            counts[d['kind']] += 1
+        return {
+            'rows': total,
+            'drift': len(drift),
+            **counts,
+            'samples': drift[:20],
+            'rebuilt': not dry_run
+        }
+    
+    # ========================================================================
+    # PARTITIONS
+    # ========================================================================
+    
+    def get_partitions(self):
+        """billing_records partitions: name, from, to (exclusive) and estimated rows"""
+        with self.conn.cursor() as cur:
+            rows = partitions.list_partitions(cur)
+        self.conn.rollback()
+        return [{'name': name, 'from': low, 'to': high, 'rows': count}
+                for name, low, high, count in rows]
+    
+    def ensure_partitions(self, ahead=partitions.PARTITIONS_AHEAD):
+        """Create missing partitions for the current and next `ahead` periods; returns their names"""
+        with self.conn.cursor() as cur:
+            created = partitions.ensure_partitions(cur, ahead=ahead)
+        self.conn.commit()
+        return created
+    
+    def archive_partitions(self, before, drop=False):
+        """Detach every partition whose range ends on or before `before`
+        
+        Detached partitions are renamed billing_records_archive_* (or
+        dropped with `drop`) and their totals are taken out of
+        billing_rollups. Returns one entry per partition.
+        """
+        archived = []
+        with self.conn.cursor() as cur:
+            cur.execute('SELECT pg_advisory_xact_lock(%s)', (partitions.PARTITION_LOCK_KEY,))
+            for name, low, high, count in partitions.list_partitions(cur):
+                if high <= before:
+                    archive = partitions.detach_partition(cur, name, drop=drop)
+                    archived.append({'name': name, 'from': low, 'to': high, 'rows': count,
+                                     'archivedAs': archive})
+            if archived:
+                # Detaching bypasses the change-counter trigger
+                cur.execute("SELECT bump_table_version('billing_records')")
+            self._commit('billing_summary')
+        return archived
     
     # ========================================================================
     # CUSTOM DATES
     # ========================================================================
     
+    @cached('custom_dates')
     def get_custom_dates(self, group_id):
         """Get custom dates for a group"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(CUSTOM_DATES_SQL, (group_id,))
+            return cur.fetchall()
+    
+    def save_custom_dates(self, group_id, dates):
+        """Make a group's custom dates exactly `dates`, writing only the differences
+        
+        Returns the dates changed: {'inserted': [...], 'updated': [...],
+        'deleted': [...]}. When all are empty nothing is written and no
+        caches are invalidated. A date listed twice keeps its last entry.
+        """
+        incoming = {}
+        for date_obj in dates:
+            incoming[date_obj['date']] = (
+                date_obj.get('frequency', 'monthly'),
+                date_obj.get('customFrom') or None,
+                date_obj.get('customThrough') or None,
+            )
+        
+        with self.conn.cursor() as cur:
+            # Lock the stored dates so concurrent saves diff against what they replace
             cur.execute('''
                 SELECT date, frequency, custom_from, custom_through
                 FROM custom_dates
                 WHERE group_id = %s
-                ORDER BY date DESC
+                FOR UPDATE
             ''', (group_id,))
-            return cur.fetchall()
-    
-    def save_custom_dates(self, group_id, dates):
-        """Save custom dates for a group (replaces all existing)"""
-        with self.conn.cursor() as cur:
-            # Delete existing
-            cur.execute('DELETE FROM custom_dates WHERE group_id = %s', (group_id,))
+            stored = {d: (freq, start or None, end or None) for d, freq, start, end in cur.fetchall()}
             
-            # Insert new dates
-            for date_obj in dates:
-                cur.execute('''
+            changes = {
+                'inserted': sorted(d for d in incoming if d not in stored),
+                'updated': sorted(d for d in incoming if d in stored and incoming[d] != stored[d]),
+                'deleted': sorted(d for d in stored if d not in incoming),
+            }
+            if changes['deleted']:
+                cur.execute(
+                    'DELETE FROM custom_dates WHERE group_id = %s AND date = ANY(%s)',
+                    (group_id, changes['deleted'])
+                )
+            upserts = changes['inserted'] + changes['updated']
+            if upserts:
+                execute_values(cur, '''
                     INSERT INTO custom_dates (group_id, date, frequency, custom_from, custom_through)
-                    VALUES (%s, %s, %s, %s, %s)
-                ''', (
-                    group_id,
-                    date_obj['date'],
-                    date_obj.get('frequency', 'monthly'),
-                    date_obj.get('customFrom'),
-                    date_obj.get('customThrough')
-                ))
+                    VALUES %s
+                    ON CONFLICT (group_id, date) DO UPDATE SET
+                        frequency = EXCLUDED.frequency,
+                        custom_from = EXCLUDED.custom_from,
+                        custom_through = EXCLUDED.custom_through
+                ''', [(group_id, d, *incoming[d]) for d in upserts])
             
-            self.conn.commit()
+            if upserts or changes['deleted']:
+                self._commit('custom_dates', 'facility_groups')
+            else:
+                self.conn.rollback()
+        return changes
     
     # ========================================================================
     # SETTINGS
     # ========================================================================
     
+    @cached('settings')
     def get_settings(self):
         """Get all settings"""
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('SELECT key, value FROM settings')
-            settings = cur.fetchall()
-            
-            # Convert to dict
-            settings_dict = {}
-            for s in settings:
-                settings_dict[s['key']] = s['value']
-            
-            return settings_dict
+        with self.conn.cursor() as cur:
+            cur.execute(SETTINGS_SQL)
+            return dict(cur.fetchall())
     
     def save_settings(self, settings):
         """Save settings"""
@@ -465,36 +1374,18 @@ class Database:
                     DO UPDATE SET value = EXCLUDED.value, updated_at = CURRENT_TIMESTAMP
                 ''', (key, value))
             
-            self.conn.commit()
+            self._commit('settings')
             
 # ========================================================================
     # STATUS GROUPS
     # ========================================================================
     
+    @cached('status_groups')
     def get_status_groups(self):
         """Get all status groups with their statuses"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT id, name, is_default
-                FROM status_groups
-                ORDER BY is_default DESC, name
-            ''')
-            groups = cur.fetchall()
-            
-            # Get statuses for each group
-            for group in groups:
-                cur.execute('''
-                    SELECT id, name, color, sort_order
-                    FROM billing_statuses
-                    WHERE status_group_id = %s
-                    ORDER BY sort_order
-                ''', (group['id'],))
-                group['statuses'] = cur.fetchall()
-                
-                # Convert snake_case to camelCase for frontend
-                group['isDefault'] = group.pop('is_default')
-            
-            return groups
+            cur.execute(STATUS_GROUPS_SQL)
+            return cur.fetchall()
     
     def create_status_group(self, data):
         """Create a new status group"""
@@ -505,49 +1396,26 @@ class Database:
                 RETURNING id
             ''', (data['name'], data.get('isDefault', False)))
             group_id = cur.fetchone()[0]
-            self.conn.commit()
+            self._commit('status_groups')
             return group_id
     
     # ========================================================================
     # BILLING STATUSES
     # ========================================================================
     
+    @cached('statuses')
     def get_all_statuses(self):
         """Get all statuses across all groups"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT bs.id, bs.name, bs.color, bs.sort_order, bs.status_group_id,
-                       sg.name as group_name
-                FROM billing_statuses bs
-                JOIN status_groups sg ON bs.status_group_id = sg.id
-                ORDER BY sg.is_default DESC, bs.sort_order
-            ''')
-            statuses = cur.fetchall()
-            
-            # Convert to camelCase
-            for s in statuses:
-                s['sortOrder'] = s.pop('sort_order')
-                s['statusGroupId'] = s.pop('status_group_id')
-                s['groupName'] = s.pop('group_name')
-            
-            return statuses
+            cur.execute(ALL_STATUSES_SQL)
+            return cur.fetchall()
     
+    @cached('statuses')
     def get_statuses_by_group(self, group_id):
         """Get statuses for a specific group"""
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute('''
-                SELECT id, name, color, sort_order
-                FROM billing_statuses
-                WHERE group_id = %s
-                ORDER BY sort_order
-            ''', (group_id,))
-            statuses = cur.fetchall()
-            
-            # Convert to camelCase
-            for s in statuses:
-                s['sortOrder'] = s.pop('sort_order')
-            
-            return statuses
+            cur.execute(STATUSES_BY_GROUP_SQL, (group_id,))
+            return cur.fetchall()
     
     def create_status(self, data):
         """Create a new status"""
@@ -563,7 +1431,7 @@ class Database:
                 data.get('sortOrder', 0)
             ))
             status_id = cur.fetchone()[0]
-            self.conn.commit()
+            self._commit('statuses', 'status_groups', 'facility_groups')
             return status_id
     
     def update_status(self, status_id, data):
@@ -579,15 +1447,52 @@ class Database:
                 data.get('sortOrder', 0),
                 status_id
             ))
-            self.conn.commit()
+            self._commit('statuses', 'status_groups', 'facility_groups')
     
     def delete_status(self, status_id):
         """Delete a status"""
         with self.conn.cursor() as cur:
             cur.execute('DELETE FROM billing_statuses WHERE id = %s', (status_id,))
-            self.conn.commit()
+            self._commit('statuses', 'status_groups', 'facility_groups')
+    
+    # ========================================================================
+    # JOBS
+    # ========================================================================
+    
+    def enqueue_job(self, kind, payload=None, dedupe_key=None):
+        """Queue a background job for the worker (see jobs.py); returns the job
+        
+        workersAlive is how many workers checked in recently; 0 means
+        nothing will run the job until a worker starts.
+        """
+        with self.conn.cursor() as cur:
+            job = jobs.enqueue(cur, kind, payload, dedupe_key)
+            job['workersAlive'] = jobs.live_workers(cur)
+        self.conn.commit()
+        return job
+    
+    def get_job(self, job_id):
+        """A job's status, progress, result and workersAlive; raises LookupError when there is no such job"""
+        with self.conn.cursor() as cur:
+            job = jobs.get_job(cur, job_id)
+            if job is None:
+                raise LookupError(f"Job {job_id} not found")
+            job['workersAlive'] = jobs.live_workers(cur)
+        return job
+    
+    def live_job_workers(self):
+        """How many job workers checked in recently"""
+        with self.conn.cursor() as cur:
+            return jobs.live_workers(cur)
+    
+    def list_jobs(self, status=None, limit=50):
+        """Most recent jobs, optionally only those in `status`"""
+        with self.conn.cursor() as cur:
+            return jobs.list_jobs(cur, status, limit)
     
     def __del__(self):
-        """Close database connection"""
-        if hasattr(self, 'conn'):
-            self.conn.close()
+        """Stop the listener and close pooled connections"""
+        if hasattr(self, 'listener'):
+            self.listener.stop()
+        if hasattr(self, 'pool'):
+            self.pool.closeall()
@@ -0,0 +1,110 @@
+"""Response encoding: a faster JSON provider and compression of large bodies.
+
+JSON_PROVIDER picks Flask's JSON provider: ``orjson`` (the default when
+orjson is installed) or ``default`` (Flask's, built on the json module).
+Both produce the same compact, key-sorted JSON. The one difference is
+non-ASCII text, which orjson writes as UTF-8 rather than \\u escapes.
+
+Bodies of COMPRESS_MIN_BYTES or more are compressed with brotli when it
+is installed and the client accepts it, otherwise with gzip. Set
+COMPRESSION=off when a proxy in front of the app already compresses.
+"""
+import gzip
+import os
+
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+JSON_PROVIDER = os.environ.get('JSON_PROVIDER', 'orjson' if orjson else 'default')
+
+COMPRESSION = os.environ.get('COMPRESSION', 'on').lower() not in ('off', '0', 'false')
+COMPRESS_MIN_BYTES = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+# Speed over ratio: the bodies are generated for every request
+GZIP_LEVEL = int(os.environ.get('GZIP_LEVEL', 6))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 4))
+COMPRESSIBLE_TYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/html', 'text/plain'}
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask's JSON provider, serializing with orjson
+
+    Dates, Decimals and other types orjson doesn't handle like Flask still
+    go through DefaultJSONProvider.default, so payloads look the same.
+    """
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        # Always compact unless asked to indent; separators etc. need no translation
+        return orjson.dumps(obj, default=self.default, option=self._options(bool(kwargs.get('indent')))).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        """jsonify(): encodes straight to bytes, skipping the str round trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent)) + b'\n'
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {'default': DefaultJSONProvider, 'orjson': OrjsonProvider}
+
+
+def json_provider(app):
+    """The JSON_PROVIDER provider for `app`; raises ValueError if it is unknown or not installed"""
+    if JSON_PROVIDER not in JSON_PROVIDERS:
+        raise ValueError(f"Unknown JSON_PROVIDER {JSON_PROVIDER!r}; expected one of {sorted(JSON_PROVIDERS)}")
+    if JSON_PROVIDER == 'orjson' and orjson is None:
+        raise ValueError("JSON_PROVIDER=orjson but orjson is not installed")
+    return JSON_PROVIDERS[JSON_PROVIDER](app)
+
+
+def compress(body, accept_encoding):
+    """(body, content encoding) for a client sending `accept_encoding`
+
+    The encoding is None, and `body` is returned as is, when compression is
+    off, the body is below COMPRESS_MIN_BYTES or the client accepts neither
+    brotli nor gzip.
+    """
+    if not COMPRESSION or len(body) < COMPRESS_MIN_BYTES:
+        return body, None
+    accepted = parse_accept_header(accept_encoding)
+    if brotli is not None and accepted.quality('br'):
+        return brotli.compress(body, quality=BROTLI_QUALITY), 'br'
+    if accepted.quality('gzip'):
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0), 'gzip'
+    return body, None
+
+
+def compress_response(response, accept_encoding):
+    """Compress a buffered Flask response in place when worthwhile (see compress)"""
+    if (not COMPRESSION or response.is_streamed or response.status_code != 200
+            or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE_TYPES):
+        return response
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_BYTES:
+        return response
+    response.vary.add('Accept-Encoding')
+    body, encoding = compress(body, accept_encoding)
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
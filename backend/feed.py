@@ -0,0 +1,74 @@
+import json
+import threading
+
+from migrations import CHANGES_CHANNEL
+
+
+def format_event(event, data):
+    """A Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+class ChangeFeed:
+    """Fans change notifications from the database out to event-stream subscribers.
+
+    The change triggers (migration 8) NOTIFY the keys of the billing
+    records each statement wrote or deleted; the feed loads the written
+    records once per notification, however many clients are subscribed,
+    and publishes them as a ``records`` event:
+    ``{"upserted": [record, ...], "deleted": [{"facilityId", "cycleStart"}, ...]}``.
+    Changes to reference tables become ``reference`` events naming the
+    table, and ``resync`` tells clients to reload because changes may have
+    been missed (statements too large to list, or a listener reconnect).
+
+    Subscribers are callables taking a formatted message; they run on the
+    listener thread and must not block.
+    """
+
+    def __init__(self, listener, load_records, max_subscribers=100):
+        self.load_records = load_records
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        listener.subscribe(CHANGES_CHANNEL, self._on_notify)
+        listener.on_reconnect(lambda: self.publish('resync', {}))
+
+    def subscribe(self, callback):
+        """Add a subscriber; False when the feed is full"""
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return False
+            self._subscribers.add(callback)
+            return True
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            self._subscribers.discard(callback)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        message = format_event(event, data)
+        for callback in subscribers:
+            callback(message)
+
+    def _on_notify(self, payload):
+        if not self.subscriber_count():
+            return
+        change = json.loads(payload)
+        if change['table'] != 'billing_records':
+            self.publish('reference', {'table': change['table']})
+            return
+        if change.get('upserted') is None:
+            self.publish('resync', {})
+            return
+        self.publish('records', {
+            'upserted': self.load_records([tuple(key) for key in change['upserted']]),
+            'deleted': [{'facilityId': f, 'cycleStart': start} for f, start in change['deleted']],
+        })
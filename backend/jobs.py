@@ -0,0 +1,260 @@
+"""Background jobs on a PostgreSQL queue (the jobs table, migration 11).
+
+Requests enqueue long operations and answer at once with the job, whose
+status, progress and result are then polled at /api/jobs/<id>. Worker
+processes (worker.py) claim queued jobs with FOR UPDATE SKIP LOCKED, so any
+number of them share the queue without running a job twice at the same
+time. Workers also check in to the job_workers table, so the API can
+report a queue that no worker is serving. Claimed jobs send heartbeats. A job whose worker stops sending them
+is requeued, so delivery is at-least-once and handlers must be idempotent.
+Failures are retried with exponential backoff, up to the job's
+max_attempts.
+
+Handlers are registered with @job_handler(kind) and called as
+handler(db, payload, progress). `progress(done, total=None, message=None)`
+publishes progress. The return value (JSON-serializable) becomes the
+job's result. ValueError and LookupError mean the payload can never
+succeed and fail the job without retrying. The queue functions take a
+cursor and leave committing to the caller.
+"""
+import json
+import os
+
+from psycopg2.extras import Json
+
+JOBS_CHANNEL = 'billing_jobs'
+JOB_STATUSES = ('queued', 'running', 'succeeded', 'failed')
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+# Seconds before the first retry, doubled for each further attempt
+JOB_RETRY_DELAY = float(os.environ.get('JOB_RETRY_DELAY', 30))
+# A running job without a heartbeat for this long is presumed abandoned
+JOB_STALE_SECONDS = float(os.environ.get('JOB_STALE_SECONDS', 300))
+# A worker that hasn't checked in for this long is presumed gone
+JOB_WORKER_STALE_SECONDS = float(os.environ.get('JOB_WORKER_STALE_SECONDS', 120))
+JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', 7))
+# Facilities whose records are deleted per transaction by delete_facility_group
+JOB_DELETE_BATCH = int(os.environ.get('JOB_DELETE_BATCH', 50))
+
+# Errors that retrying cannot fix
+PERMANENT_ERRORS = (ValueError, LookupError)
+
+JOB_COLUMNS = '''
+    id, kind, status, payload, attempts, max_attempts, progress, result, error,
+    created_at, started_at, finished_at, run_at
+'''
+
+LIVE_WORKERS_SQL = '''
+    SELECT count(*) AS workers FROM job_workers
+    WHERE seen_at >= CURRENT_TIMESTAMP - make_interval(secs => %s)
+'''
+
+JOB_HANDLERS = {}
+
+
+def job_handler(kind):
+    """Register the decorated function as the handler of `kind` jobs"""
+    def decorator(fn):
+        JOB_HANDLERS[kind] = fn
+        return fn
+    return decorator
+
+
+def _json(value):
+    # Handler results may hold dates and Decimals (e.g. the rollup report)
+    return Json(value, dumps=lambda obj: json.dumps(obj, default=str))
+
+
+def job_to_api(row):
+    """A JOB_COLUMNS row as returned by the status API"""
+    (job_id, kind, status, payload, attempts, max_attempts, progress, result, error,
+     created_at, started_at, finished_at, run_at) = row
+    return {
+        'id': job_id,
+        'kind': kind,
+        'status': status,
+        'payload': payload,
+        'attempts': attempts,
+        'maxAttempts': max_attempts,
+        'progress': progress,
+        'result': result,
+        'error': error,
+        'createdAt': created_at.isoformat(),
+        'startedAt': started_at.isoformat() if started_at else None,
+        'finishedAt': finished_at.isoformat() if finished_at else None,
+        'runAt': run_at.isoformat(),
+    }
+
+
+def enqueue(cur, kind, payload=None, dedupe_key=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """Queue a job and wake the workers; returns it (see job_to_api)
+
+    With `dedupe_key`, a queued or running job with the same key is
+    returned instead of queueing another. Raises ValueError for an
+    unknown kind.
+    """
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    cur.execute(f'''
+        INSERT INTO jobs (kind, payload, dedupe_key, max_attempts)
+        VALUES (%s, %s, %s, %s)
+        ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING {JOB_COLUMNS}
+    ''', (kind, _json(payload or {}), dedupe_key, max_attempts))
+    row = cur.fetchone()
+    if row is None:
+        cur.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE dedupe_key = %s ORDER BY id DESC LIMIT 1',
+                    (dedupe_key,))
+        return job_to_api(cur.fetchone())
+    # Delivered on commit
+    cur.execute('SELECT pg_notify(%s, %s)', (JOBS_CHANNEL, str(row[0])))
+    return job_to_api(row)
+
+
+def get_job(cur, job_id):
+    """The job (see job_to_api), or None"""
+    cur.execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = %s', (job_id,))
+    row = cur.fetchone()
+    return job_to_api(row) if row else None
+
+
+def list_jobs(cur, status=None, limit=50):
+    """Most recent jobs first, optionally only those in `status`"""
+    if status is not None and status not in JOB_STATUSES:
+        raise ValueError(f"Invalid job status: {status}")
+    cur.execute(f'''
+        SELECT {JOB_COLUMNS} FROM jobs
+        WHERE %(status)s::text IS NULL OR status = %(status)s
+        ORDER BY id DESC
+        LIMIT %(limit)s
+    ''', {'status': status, 'limit': limit})
+    return [job_to_api(row) for row in cur.fetchall()]
+
+
+def claim(cur, worker):
+    """Mark the next due job running for `worker`; returns (id, kind, payload, attempts, max_attempts) or None"""
+    cur.execute('''
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, worker = %s,
+            started_at = CURRENT_TIMESTAMP, heartbeat_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM jobs
+            WHERE status = 'queued' AND run_at <= CURRENT_TIMESTAMP
+            ORDER BY run_at, id
+            LIMIT 1
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING id, kind, payload, attempts, max_attempts
+    ''', (worker,))
+    return cur.fetchone()
+
+
+def heartbeat(cur, job_id, progress=None):
+    """Keep a running job claimed, recording its progress when given"""
+    cur.execute('''
+        UPDATE jobs SET heartbeat_at = CURRENT_TIMESTAMP, progress = COALESCE(%s, progress)
+        WHERE id = %s AND status = 'running'
+    ''', (_json(progress) if progress is not None else None, job_id))
+
+
+def succeed(cur, job_id, result):
+    cur.execute('''
+        UPDATE jobs
+        SET status = 'succeeded', result = %s, error = NULL, worker = NULL, finished_at = CURRENT_TIMESTAMP
+        WHERE id = %s
+    ''', (_json(result), job_id))
+
+
+def fail(cur, job_id, attempts, max_attempts, error, permanent=False):
+    """Requeue the job with backoff, or fail it once it is out of attempts; returns the new status"""
+    retry = not permanent and attempts < max_attempts
+    cur.execute('''
+        UPDATE jobs
+        SET status = %s, error = %s, worker = NULL,
+            run_at = CURRENT_TIMESTAMP + make_interval(secs => %s),
+            finished_at = CASE WHEN %s THEN NULL ELSE CURRENT_TIMESTAMP END
+        WHERE id = %s
+    ''', ('queued' if retry else 'failed', error, JOB_RETRY_DELAY * 2 ** (attempts - 1), retry, job_id))
+    return 'queued' if retry else 'failed'
+
+
+def requeue_stale(cur, stale_seconds=JOB_STALE_SECONDS):
+    """Requeue (or fail, when out of attempts) running jobs whose worker went silent; returns their ids"""
+    cur.execute('''
+        UPDATE jobs
+        SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END,
+            error = 'Worker stopped responding', worker = NULL,
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END
+        WHERE status = 'running' AND heartbeat_at < CURRENT_TIMESTAMP - make_interval(secs => %s)
+        RETURNING id
+    ''', (stale_seconds,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def worker_heartbeat(cur, worker):
+    """Record that `worker` is alive"""
+    cur.execute('''
+        INSERT INTO job_workers (name) VALUES (%s)
+        ON CONFLICT (name) DO UPDATE SET seen_at = CURRENT_TIMESTAMP
+    ''', (worker,))
+
+
+def live_workers(cur, stale_seconds=JOB_WORKER_STALE_SECONDS):
+    """How many workers checked in within `stale_seconds`"""
+    cur.execute(LIVE_WORKERS_SQL, (stale_seconds,))
+    return cur.fetchone()[0]
+
+
+def purge_jobs(cur, days=JOB_RETENTION_DAYS):
+    """Delete finished jobs, and workers not seen, older than `days`; returns how many jobs"""
+    cur.execute('''
+        DELETE FROM jobs
+        WHERE status IN ('succeeded', 'failed')
+          AND finished_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+    ''', (days,))
+    purged = cur.rowcount
+    cur.execute('''
+        DELETE FROM job_workers WHERE seen_at < CURRENT_TIMESTAMP - make_interval(days => %s)
+    ''', (days,))
+    return purged
+
+
+# ============================================================================
+# HANDLERS
+# ============================================================================
+
+@job_handler('delete_facility_group')
+def delete_facility_group(db, payload, progress):
+    """Delete a group's records a batch of facilities per transaction, then the group itself
+
+    Short transactions keep the locks and trigger work of a large group
+    from blocking interactive writes for the whole delete.
+    """
+    group_id = int(payload['groupId'])
+    facility_ids = db.get_group_facility_ids(group_id)
+    if facility_ids is None:
+        # Already gone, e.g. a retry after the group was deleted
+        return {'groupId': group_id, 'facilities': 0, 'records': 0}
+    records = 0
+    for start in range(0, len(facility_ids), JOB_DELETE_BATCH):
+        records += db.delete_facility_records(facility_ids[start:start + JOB_DELETE_BATCH])
+        progress(min(start + JOB_DELETE_BATCH, len(facility_ids)), len(facility_ids), 'facilities')
+    db.delete_facility_group(group_id)
+    return {'groupId': group_id, 'facilities': len(facility_ids), 'records': records}
+
+
+@job_handler('rebuild_rollups')
+def rebuild_rollups(db, payload, progress):
+    return db.rebuild_rollups(dry_run=bool(payload.get('dryRun')))
+
+
+@job_handler('purge_tombstones')
+def purge_tombstones(db, payload, progress):
+    return {'purged': db.purge_tombstones()}
+
+
+@job_handler('generate_placeholders')
+def generate_placeholders(db, payload, progress):
+    """Materialize the upcoming cycles' records ({"cycles": n}, default PLACEHOLDER_CYCLES)"""
+    if 'cycles' not in payload:
+        return db.generate_placeholders()
+    return db.generate_placeholders(int(payload['cycles']))
@@ -0,0 +1,107 @@
+import select
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+
+
+class NotificationListener:
+    """Background thread that LISTENs on PostgreSQL channels and dispatches payloads.
+
+    Uses its own dedicated connection (LISTEN state is per session, so it
+    cannot come from the pool). Callbacks run on the listener thread and
+    must be quick and thread-safe. After a reconnect, notifications sent
+    while disconnected are lost, so `on_reconnect` callbacks run to let
+    subscribers resynchronize.
+    """
+
+    def __init__(self, dsn, reconnect_delay=5.0, poll_interval=5.0):
+        self.dsn = dsn
+        self.reconnect_delay = reconnect_delay
+        self.poll_interval = poll_interval
+        self._callbacks = {}        # channel -> [callback(payload)]
+        self._reconnect_callbacks = []
+        self._listening = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def subscribe(self, channel, callback):
+        """Call `callback(payload)` for every notification on `channel`"""
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(channel, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def on_reconnect(self, callback):
+        """Call `callback()` whenever the listener (re)connects"""
+        with self._lock:
+            self._reconnect_callbacks.append(callback)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='pg-listener', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        first = True
+        while not self._stopped.is_set():
+            conn = None
+            try:
+                conn = psycopg2.connect(self.dsn)
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                self._listening = set()
+                self._listen_new_channels(conn)
+                if not first:
+                    self._dispatch_reconnect()
+                first = False
+                while not self._stopped.is_set():
+                    self._listen_new_channels(conn)
+                    if select.select([conn], [], [], self.poll_interval) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except psycopg2.Error as e:
+                print(f"Notification listener error: {e}; reconnecting in {self.reconnect_delay}s")
+                first = False
+                time.sleep(self.reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def _listen_new_channels(self, conn):
+        with self._lock:
+            channels = set(self._callbacks) - self._listening
+        if channels:
+            with conn.cursor() as cur:
+                for channel in channels:
+                    cur.execute(f'LISTEN "{channel}"')
+            self._listening |= channels
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Notification callback error on {channel}: {e}")
+
+    def _dispatch_reconnect(self):
+        with self._lock:
+            callbacks = list(self._reconnect_callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Reconnect callback error: {e}")
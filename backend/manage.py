@@ -0,0 +1,124 @@
+"""Maintenance commands for the billing tracker database.
+
+Run from the backend directory with DATABASE_URL set, e.g.:
+
+    python manage.py migrate
+    python manage.py rebuild-rollups --dry-run
+    python manage.py archive-partitions --before 2024-01-01
+    python manage.py enqueue-job rebuild_rollups --payload '{"dryRun": true}'
+    python manage.py generate-placeholders --cycles 3
+"""
+import argparse
+import json
+from datetime import date
+
+from dotenv import load_dotenv
+
+from database import PLACEHOLDER_CYCLES, Database
+from jobs import JOB_HANDLERS
+from partitions import PARTITIONS_AHEAD
+from migrations import MIGRATIONS, current_version
+
+
+def migrate(db, args):
+    """Apply pending schema migrations and list their status"""
+    # Database() has already migrated; report what is applied
+    with db.conn.cursor() as cur:
+        version = current_version(cur)
+    for number, description, _ in MIGRATIONS:
+        print(f"{'applied' if number <= version else 'pending'}  {number:>3}  {description}")
+    return 0
+
+
+def rebuild_rollups(db, args):
+    """Recompute billing_rollups from scratch and report drift"""
+    report = db.rebuild_rollups(dry_run=args.dry_run)
+    print(json.dumps(report, indent=2, default=str))
+    return 1 if args.check and report['drift'] else 0
+
+
+def list_partitions(db, args):
+    """List billing_records partitions with their ranges and estimated row counts"""
+    for p in db.get_partitions():
+        print(f"{p['name']:<32} {p['from']} .. {p['to']}  ~{p['rows']} rows")
+    return 0
+
+
+def ensure_partitions(db, args):
+    """Create missing billing_records partitions up to --ahead periods past today"""
+    for name in db.ensure_partitions(ahead=args.ahead):
+        print(f"created  {name}")
+    return 0
+
+
+def archive_partitions(db, args):
+    """Detach billing_records partitions that end on or before --before"""
+    report = db.archive_partitions(args.before, drop=args.drop)
+    print(json.dumps(report, indent=2, default=str))
+    return 0
+
+
+def purge_tombstones(db, args):
+    """Delete billing record tombstones older than the delta-sync retention"""
+    print(f"purged  {db.purge_tombstones()} tombstones")
+    return 0
+
+
+def enqueue_job(db, args):
+    """Queue a background job for the worker (see jobs.py)"""
+    job = db.enqueue_job(args.kind, json.loads(args.payload))
+    print(f"queued  job {job['id']} ({job['kind']}), status {job['status']}")
+    return 0
+
+
+def generate_placeholders(db, args):
+    """Create the records of the current and next --cycles cycles for every facility"""
+    report = db.generate_placeholders(args.cycles)
+    print(f"inserted  {report['inserted']} records for {report['windows']} group cycles")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Billing tracker maintenance commands')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    commands.add_parser('migrate', help=migrate.__doc__).set_defaults(handler=migrate)
+
+    rebuild = commands.add_parser('rebuild-rollups', help=rebuild_rollups.__doc__)
+    rebuild.add_argument('--dry-run', action='store_true', help='report drift without rewriting')
+    rebuild.add_argument('--check', action='store_true', help='exit with status 1 if drift was found')
+    rebuild.set_defaults(handler=rebuild_rollups)
+
+    commands.add_parser('list-partitions', help=list_partitions.__doc__).set_defaults(handler=list_partitions)
+
+    ensure = commands.add_parser('ensure-partitions', help=ensure_partitions.__doc__)
+    ensure.add_argument('--ahead', type=int, default=PARTITIONS_AHEAD, help='future periods to pre-create')
+    ensure.set_defaults(handler=ensure_partitions)
+
+    archive = commands.add_parser('archive-partitions', help=archive_partitions.__doc__)
+    archive.add_argument('--before', type=date.fromisoformat, required=True, help='YYYY-MM-DD')
+    archive.add_argument('--drop', action='store_true', help='drop the partitions instead of keeping archive tables')
+    archive.set_defaults(handler=archive_partitions)
+
+    commands.add_parser('purge-tombstones', help=purge_tombstones.__doc__).set_defaults(handler=purge_tombstones)
+
+    enqueue = commands.add_parser('enqueue-job', help=enqueue_job.__doc__)
+    enqueue.add_argument('kind', choices=sorted(JOB_HANDLERS))
+    enqueue.add_argument('--payload', default='{}', help='JSON object passed to the handler')
+    enqueue.set_defaults(handler=enqueue_job)
+
+    placeholders = commands.add_parser('generate-placeholders', help=generate_placeholders.__doc__)
+    placeholders.add_argument('--cycles', type=int, default=PLACEHOLDER_CYCLES, help='upcoming cycles to fill')
+    placeholders.set_defaults(handler=generate_placeholders)
+
+    args = parser.parse_args()
+    load_dotenv()
+    db = Database()
+    try:
+        return args.handler(db, args)
+    finally:
+        db.release_connection()
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
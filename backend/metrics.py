@@ -0,0 +1,232 @@
+"""Opt-in request and SQL instrumentation (METRICS_ENABLED=1).
+
+Per-statement timing comes from InstrumentedConnection, whose cursors time
+execute()/executemany() and count the rows each statement returned. The
+timings are attributed to the request being served on the current thread
+or task. They also go into a process-wide registry, which app.py renders
+at /api/metrics in the Prometheus text format. Statements slower than
+SLOW_QUERY_MS are printed with the function that issued them.
+"""
+import contextvars
+import os
+import sys
+import threading
+import time
+
+import psycopg2.extensions
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 500))
+# Longest statement text printed in the slow-query log
+SLOW_QUERY_MAX_CHARS = 500
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 25, 50, 100)
+
+
+class Registry:
+    """Thread-safe counters and histograms, rendered in the Prometheus text format.
+
+    Metrics are declared once with `counter`/`histogram`; samples are keyed
+    by their labels. Values are per process, so with several workers each
+    scrape sees the worker that answered it.
+    """
+
+    def __init__(self):
+        self._metrics = {}  # name -> [kind, help, buckets, {labels: value}]
+        self._lock = threading.Lock()
+
+    def counter(self, name, help):
+        self._metrics[name] = ['counter', help, None, {}]
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._metrics[name] = ['histogram', help, tuple(buckets), {}]
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        samples = self._metrics[name][3]
+        with self._lock:
+            samples[key] = samples.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        _, _, buckets, samples = self._metrics[name]
+        with self._lock:
+            sample = samples.get(key)
+            if sample is None:
+                # Per-bucket counts (made cumulative on render), then sum and count
+                sample = samples[key] = [[0] * len(buckets), 0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    sample[0][i] += 1
+                    break
+            sample[1] += value
+            sample[2] += 1
+
+    def render(self, gauges=()):
+        """Exposition text; `gauges` are extra (name, help, value) samples taken at scrape time"""
+        lines = []
+        with self._lock:
+            for name, (kind, help, buckets, samples) in self._metrics.items():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for key, value in samples.items():
+                    if kind == 'counter':
+                        lines.append(f'{name}{_labels(key)} {_number(value)}')
+                        continue
+                    counts, total, count = value
+                    cumulative = 0
+                    for bound, n in zip(buckets, counts):
+                        cumulative += n
+                        lines.append(f'{name}_bucket{_labels(key, le=_number(bound))} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(key, le="+Inf")} {count}')
+                    lines.append(f'{name}_sum{_labels(key)} {_number(total)}')
+                    lines.append(f'{name}_count{_labels(key)} {count}')
+        for name, help, value in gauges:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(key, **extra):
+    pairs = list(key) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+registry = Registry()
+registry.histogram('billing_http_request_duration_seconds', 'Wall time of API requests')
+registry.histogram('billing_http_request_db_seconds', 'Time API requests spent in SQL statements')
+registry.histogram('billing_http_request_statements', 'SQL statements per API request', STATEMENT_BUCKETS)
+registry.counter('billing_http_request_rows_total', 'Rows fetched by API requests')
+registry.counter('billing_http_response_bytes_total', 'Serialized response bytes (streamed responses excluded)')
+registry.histogram('billing_db_statement_duration_seconds', 'SQL statement time by issuing function')
+registry.counter('billing_db_slow_statements_total', 'SQL statements slower than SLOW_QUERY_MS')
+
+
+class RequestStats:
+    """What one request spent in the database"""
+
+    __slots__ = ('started', 'db_seconds', 'statements', 'rows')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_seconds = 0.0
+        self.statements = 0
+        self.rows = 0
+
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+def begin_request():
+    """Start attributing statements on this thread/task to a new request"""
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request(method, endpoint, status, response_bytes=None):
+    """Record the current request's metrics; returns its Server-Timing header value (None if not started)"""
+    stats = _current.get()
+    if stats is None:
+        return None
+    _current.set(None)
+    wall = time.perf_counter() - stats.started
+    registry.observe('billing_http_request_duration_seconds', wall,
+                     method=method, endpoint=endpoint, status=status)
+    registry.observe('billing_http_request_db_seconds', stats.db_seconds, method=method, endpoint=endpoint)
+    registry.observe('billing_http_request_statements', stats.statements, method=method, endpoint=endpoint)
+    registry.inc('billing_http_request_rows_total', stats.rows, method=method, endpoint=endpoint)
+    if response_bytes is not None:
+        registry.inc('billing_http_response_bytes_total', response_bytes, method=method, endpoint=endpoint)
+    return (f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.statements} statements, {stats.rows} rows", '
+            f'app;dur={(wall - stats.db_seconds) * 1000:.1f}, total;dur={wall * 1000:.1f}')
+
+
+def _caller():
+    """module.function that issued the statement (first frame outside psycopg2 and this module)"""
+    frame = sys._getframe(2)
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module != __name__ and not module.startswith('psycopg2'):
+            return f'{module}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return 'unknown'
+
+
+def _statement_text(cursor, query):
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cursor)
+    elif isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    return ' '.join(str(query).split())[:SLOW_QUERY_MAX_CHARS]
+
+
+def _record_statement(cursor, query, seconds):
+    # Client-side cursors hold the whole result after execute; server-side
+    # (named) cursors count their rows on close
+    rows = max(cursor.rowcount, 0) if cursor.name is None and cursor.description is not None else 0
+    stats = _current.get()
+    if stats is not None:
+        stats.db_seconds += seconds
+        stats.statements += 1
+        stats.rows += rows
+    caller = _caller()
+    registry.observe('billing_db_statement_duration_seconds', seconds, caller=caller)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        registry.inc('billing_db_slow_statements_total', caller=caller)
+        # The statement template only: parameters may hold billing data
+        print(f"Slow query ({seconds * 1000:.1f} ms, {rows} rows) in {caller}: {_statement_text(cursor, query)}")
+
+
+_cursor_classes = {}
+
+
+def _instrumented_cursor(base):
+    """Subclass of cursor class `base` that times its statements"""
+    if base not in _cursor_classes:
+        def execute(self, query, vars=None):
+            started = time.perf_counter()
+            try:
+                return base.execute(self, query, vars)
+            finally:
+                _record_statement(self, query, time.perf_counter() - started)
+
+        def executemany(self, query, vars_list):
+            started = time.perf_counter()
+            try:
+                return base.executemany(self, query, vars_list)
+            finally:
+                _record_statement(self, query, time.perf_counter() - started)
+
+        def close(self):
+            stats = _current.get()
+            if self.name is not None and stats is not None and not self.closed and self.rowcount > 0:
+                stats.rows += self.rowcount
+            return base.close(self)
+
+        _cursor_classes[base] = type(f'Instrumented{base.__name__}', (base,), {
+            'execute': execute,
+            'executemany': executemany,
+            'close': close,
+        })
+    return _cursor_classes[base]
+
+
+class InstrumentedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose cursors time their statements (pass as connection_factory)"""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop('cursor_factory', None) or self.cursor_factory or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=_instrumented_cursor(base), **kwargs)
@@ -0,0 +1,1102 @@
+"""Versioned schema migrations.
+
+Each migration runs once per database and is recorded in schema_version.
+Workers take a PostgreSQL advisory lock before migrating, so only one of
+them applies pending migrations while the others wait; once the schema
+is current, startup is a single version lookup with no DDL. Waiters poll
+for the lock outside any transaction: a session blocked in
+pg_advisory_lock holds a snapshot, which CREATE INDEX CONCURRENTLY in the
+migrating session would wait on forever.
+"""
+import time
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from cycles import WEEK_EPOCH, cycle_start
+
+# Arbitrary application-wide key for pg_advisory_lock ("bill")
+MIGRATION_LOCK_KEY = 0x62696C6C
+# Seconds between attempts to take the migration lock
+MIGRATION_LOCK_POLL = 0.5
+
+# Typed billing_records columns and the parser that converts legacy text input
+TYPED_RECORD_COLUMNS = {
+    'billing_date': 'date',
+    'from_date': 'date',
+    'through_date': 'date',
+    'billed_amount': 'amount',
+    'paid_amount': 'amount',
+    'paid_date': 'date',
+}
+
+# Rollup keys standing in for NULL billing month / status (they are part of the primary key)
+ROLLUP_PERIOD_SQL = "COALESCE(date_trunc('month', {row}.billing_date)::date, '-infinity'::date)"
+ROLLUP_STATUS_SQL = "COALESCE({row}.status_id, 0)"
+
+# Secondary indexes for the lookups the API performs: name -> (table, columns)
+INDEXES = {
+    'facilities_group_id_idx': ('facilities', 'group_id'),
+    'custom_dates_group_id_idx': ('custom_dates', 'group_id'),
+    'billing_statuses_status_group_id_idx': ('billing_statuses', 'status_group_id, sort_order'),
+    'billing_records_status_id_idx': ('billing_records', 'status_id'),
+    'billing_records_billing_date_idx': ('billing_records', 'billing_date'),
+    'billing_rollups_group_id_idx': ('billing_rollups', 'group_id'),
+}
+
+# Tables whose writes bump change_counters
+COUNTED_TABLES = (
+    'status_groups', 'billing_statuses', 'facility_groups', 'facilities',
+    'billing_records', 'custom_dates', 'settings',
+)
+
+# Rows each table's change counter is spread over (see sharded_change_counters)
+CHANGE_COUNTER_SHARDS = 16
+
+# Channel the change-notification triggers publish on (see feed.py)
+CHANGES_CHANNEL = 'billing_changes'
+# Reference tables whose changes are announced without row keys
+NOTIFIED_TABLES = ('facility_groups', 'facilities', 'billing_statuses', 'status_groups', 'custom_dates')
+# Most record keys one notification carries; larger statements are
+# announced without keys (NOTIFY payloads are limited to 8000 bytes)
+NOTIFY_MAX_KEYS = 250
+
+
+def baseline_schema(db):
+    """Create all tables and seed the default status group, statuses and sample data"""
+    with db.conn.cursor() as cur:
+        # Status Groups table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS status_groups (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                is_default BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Billing Statuses table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS billing_statuses (
+                id SERIAL PRIMARY KEY,
+                status_group_id INTEGER REFERENCES status_groups(id) ON DELETE CASCADE,
+                name VARCHAR(100) NOT NULL,
+                color VARCHAR(20) NOT NULL,
+                sort_order INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        # Facility Groups table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS facility_groups (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                billing_type VARCHAR(50) NOT NULL,
+                billing_day INTEGER,
+                status_group_id INTEGER REFERENCES status_groups(id) DEFAULT 1,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Facilities table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS facilities (
+                id SERIAL PRIMARY KEY,
+                name VARCHAR(255) NOT NULL,
+                group_id INTEGER REFERENCES facility_groups(id) ON DELETE CASCADE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Billing Records table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS billing_records (
+                id SERIAL PRIMARY KEY,
+                facility_id INTEGER REFERENCES facilities(id) ON DELETE CASCADE,
+                cycle INTEGER NOT NULL,
+                billing_date DATE,
+                from_date DATE,
+                through_date DATE,
+                billed_amount NUMERIC(14, 2),
+                status_id INTEGER REFERENCES billing_statuses(id),
+                paid_amount NUMERIC(14, 2),
+                paid_date DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(facility_id, cycle)
+            )
+        ''')
+
+        # Custom Dates table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS custom_dates (
+                id SERIAL PRIMARY KEY,
+                group_id INTEGER REFERENCES facility_groups(id) ON DELETE CASCADE,
+                date VARCHAR(8) NOT NULL,
+                frequency VARCHAR(50),
+                custom_from VARCHAR(10),
+                custom_through VARCHAR(10),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+
+        # Settings table
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                id SERIAL PRIMARY KEY,
+                key VARCHAR(100) UNIQUE NOT NULL,
+                value TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        # Columns added after the first release
+        cur.execute('''
+            ALTER TABLE facility_groups 
+            ADD COLUMN IF NOT EXISTS status_group_id INTEGER DEFAULT 1
+        ''')
+        cur.execute('''
+            ALTER TABLE billing_records 
+            ADD COLUMN IF NOT EXISTS billed_amount NUMERIC(14, 2)
+        ''')
+        cur.execute('''
+            ALTER TABLE billing_records 
+            ADD COLUMN IF NOT EXISTS status_id INTEGER
+        ''')
+        
+        # Default status group and statuses
+        cur.execute('''
+            INSERT INTO status_groups (id, name, is_default)
+            VALUES (1, 'Default', true)
+            ON CONFLICT (id) DO NOTHING
+        ''')
+        cur.execute('''
+            INSERT INTO billing_statuses (status_group_id, name, color, sort_order)
+            SELECT 1, name, color, sort_order
+            FROM (VALUES 
+                ('Not Billed', '#93C5FD', 1),
+                ('Billed', '#FDE047', 2),
+                ('Pending', '#C4B5FD', 3),
+                ('Approved', '#86EFAC', 4),
+                ('Paid', '#22C55E', 5)
+            ) AS defaults (name, color, sort_order)
+            WHERE NOT EXISTS (SELECT 1 FROM billing_statuses WHERE status_group_id = 1)
+        ''')
+        
+        # Sample groups and facilities for an empty database
+        cur.execute('SELECT COUNT(*) FROM facility_groups')
+        if cur.fetchone()[0] == 0:
+            cur.execute('''
+                INSERT INTO facility_groups (id, name, billing_type, billing_day)
+                VALUES 
+                    (1, 'Alabama Facilities', 'monthly', 1),
+                    (2, 'Weekly Facilities', 'weekly', 5)
+            ''')
+            cur.execute('''
+                INSERT INTO facilities (id, name, group_id)
+                VALUES 
+                    (1, 'Birmingham Care Center', 1),
+                    (2, 'Montgomery Health', 1),
+                    (3, 'Phoenix Center', 2),
+                    (4, 'Sunrise Health', 2)
+            ''')
+        
+        # Rows above were inserted with explicit ids; move the sequences past them
+        for table in ('status_groups', 'facility_groups', 'facilities'):
+            cur.execute(f'''
+                SELECT setval(pg_get_serial_sequence('{table}', 'id'),
+                              GREATEST((SELECT max(id) FROM {table}), 1))
+            ''')
+        db.conn.commit()
+
+
+def typed_billing_record_columns(db, batch_size=5000):
+    """Convert legacy VARCHAR amount/date columns of billing_records to NUMERIC/DATE
+
+    Runs online: typed shadow columns are added and backfilled in
+    batches (one short transaction each), then a final transaction
+    converts rows written meanwhile and swaps the columns under a brief
+    exclusive lock. Values that don't parse become NULL, but their text
+    is kept in billing_records_unparsed (record_id, column_name, value)
+    and counted in the migration output.
+    """
+    def is_migrated(cur):
+        cur.execute('''
+            SELECT data_type FROM information_schema.columns
+            WHERE table_name = 'billing_records' AND column_name = 'billed_amount'
+        ''')
+        row = cur.fetchone()
+        return row is None or row[0] == 'numeric'
+
+    conversions = ', '.join(
+        f"{column}_typed = billing_parse_{kind}({column})"
+        for column, kind in TYPED_RECORD_COLUMNS.items()
+    )
+    # Values the parsers turn into NULL are kept, with their row and column
+    keep_unparsed = '''
+        INSERT INTO billing_records_unparsed (record_id, column_name, value)
+    ''' + ' UNION ALL '.join(
+        f"SELECT id, '{column}', {column} FROM billing_records "
+        f"WHERE ({{where}}) AND btrim({column}) <> '' AND {column}_typed IS NULL"
+        for column in TYPED_RECORD_COLUMNS
+    ) + ' ON CONFLICT (record_id, column_name) DO UPDATE SET value = EXCLUDED.value'
+
+    with db.conn.cursor() as cur:
+        # Lenient parsers for the legacy MMDDYYYY / free-text values: anything
+        # unparseable becomes NULL. Writes validate first (see
+        # database.check_record_fields), so only the backfill relies on that
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION billing_parse_date(value TEXT) RETURNS DATE AS $$
+            BEGIN
+                IF value IS NULL OR value !~ '^[0-9]{8}$' THEN
+                    RETURN NULL;
+                END IF;
+                RETURN to_date(value, 'MMDDYYYY');
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql IMMUTABLE
+        ''')
+
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION billing_parse_amount(value TEXT) RETURNS NUMERIC AS $$
+            BEGIN
+                IF value IS NULL OR btrim(value) = '' THEN
+                    RETURN NULL;
+                END IF;
+                RETURN regexp_replace(value, '[$,[:space:]]', '', 'g')::NUMERIC(14, 2);
+            EXCEPTION WHEN others THEN
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql IMMUTABLE
+        ''')
+        db.conn.commit()
+        
+        if is_migrated(cur):
+            db.conn.rollback()
+            return
+
+        print("Converting billing_records amounts and dates to typed columns...")
+        # Writes from transactions already running (or started later) may
+        # land behind the batches; they are swept up before the swap
+        cur.execute('''
+            SELECT LEAST(now(), (
+                SELECT min(xact_start) FROM pg_stat_activity
+                WHERE datname = current_database() AND pid <> pg_backend_pid()
+            ))
+        ''')
+        started_at = cur.fetchone()[0]
+        for column, kind in TYPED_RECORD_COLUMNS.items():
+            column_type = 'DATE' if kind == 'date' else 'NUMERIC(14, 2)'
+            cur.execute(f'ALTER TABLE billing_records ADD COLUMN IF NOT EXISTS {column}_typed {column_type}')
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS billing_records_unparsed (
+                record_id INTEGER NOT NULL,
+                column_name TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (record_id, column_name)
+            )
+        ''')
+        cur.execute('SELECT COALESCE(max(id), 0) FROM billing_records')
+        max_id = cur.fetchone()[0]
+        db.conn.commit()
+
+        for low in range(0, max_id, batch_size):
+            cur.execute(
+                f'UPDATE billing_records SET {conversions} WHERE id > %s AND id <= %s',
+                (low, low + batch_size)
+            )
+            cur.execute(keep_unparsed.format(where='id > %(low)s AND id <= %(high)s'),
+                        {'low': low, 'high': low + batch_size})
+            db.conn.commit()
+
+        cur.execute('LOCK TABLE billing_records IN ACCESS EXCLUSIVE MODE')
+        if is_migrated(cur):
+            # Another worker finished the swap while we were backfilling
+            db.conn.rollback()
+            return
+        swept = 'id > %(max_id)s OR updated_at >= %(started_at)s'
+        cur.execute(
+            f'UPDATE billing_records SET {conversions} WHERE {swept}',
+            {'max_id': max_id, 'started_at': started_at}
+        )
+        cur.execute(f'''
+            DELETE FROM billing_records_unparsed
+            WHERE record_id IN (SELECT id FROM billing_records WHERE {swept})
+        ''', {'max_id': max_id, 'started_at': started_at})
+        cur.execute(keep_unparsed.format(where=swept), {'max_id': max_id, 'started_at': started_at})
+        cur.execute('SELECT count(*) FROM billing_records_unparsed')
+        unparsed = cur.fetchone()[0]
+        if unparsed:
+            print(f"{unparsed} amounts and dates could not be parsed; their original text is "
+                  f"kept in billing_records_unparsed")
+        for column in TYPED_RECORD_COLUMNS:
+            cur.execute(f'ALTER TABLE billing_records DROP COLUMN {column}')
+            cur.execute(f'ALTER TABLE billing_records RENAME COLUMN {column}_typed TO {column}')
+        db.conn.commit()
+        print("billing_records conversion completed")
+
+
+def billing_rollups(db):
+    """Create the billing_rollups table and the triggers that maintain it
+
+    Statement-level triggers on billing_records fold each statement's
+    transition tables into per (facility, month, status) deltas, so
+    rollups change in the same transaction as the records, including
+    rows removed by facility / facility group cascades.
+    """
+    def rows(table, sign):
+        return f'''
+            SELECT facility_id,
+                   {ROLLUP_PERIOD_SQL.format(row=table)} AS period,
+                   {ROLLUP_STATUS_SQL.format(row=table)} AS status_id,
+                   {sign}1 AS record_count,
+                   {sign}COALESCE(billed_amount, 0) AS billed_total,
+                   {sign}COALESCE(paid_amount, 0) AS paid_total
+            FROM {table}
+        '''
+
+    def apply(delta):
+        return f'''
+            INSERT INTO billing_rollups AS r
+                (group_id, facility_id, period, status_id, record_count, billed_total, paid_total)
+            SELECT (SELECT group_id FROM facilities WHERE id = d.facility_id),
+                   d.facility_id, d.period, d.status_id,
+                   SUM(d.record_count), SUM(d.billed_total), SUM(d.paid_total)
+            FROM ({delta}) d
+            WHERE d.facility_id IS NOT NULL
+            GROUP BY d.facility_id, d.period, d.status_id
+            ORDER BY d.facility_id, d.period, d.status_id
+            ON CONFLICT (facility_id, period, status_id) DO UPDATE SET
+                record_count = r.record_count + EXCLUDED.record_count,
+                billed_total = r.billed_total + EXCLUDED.billed_total,
+                paid_total = r.paid_total + EXCLUDED.paid_total;
+            DELETE FROM billing_rollups
+            WHERE record_count = 0
+              AND facility_id IN (SELECT facility_id FROM ({delta}) d);
+        '''
+
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('billing_rollups') IS NULL")
+        created = cur.fetchone()[0]
+
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS billing_rollups (
+                group_id INTEGER,
+                facility_id INTEGER NOT NULL,
+                period DATE NOT NULL,
+                status_id INTEGER NOT NULL,
+                record_count INTEGER NOT NULL DEFAULT 0,
+                billed_total NUMERIC(16, 2) NOT NULL DEFAULT 0,
+                paid_total NUMERIC(16, 2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (facility_id, period, status_id)
+            )
+        ''')
+
+        cur.execute(f'''
+            CREATE OR REPLACE FUNCTION billing_rollups_apply() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    {apply(rows('new_rows', ''))}
+                ELSIF TG_OP = 'UPDATE' THEN
+                    {apply(rows('new_rows', '') + ' UNION ALL ' + rows('old_rows', '-'))}
+                ELSE
+                    {apply(rows('old_rows', '-'))}
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+
+        cur.execute('''
+            SELECT count(*) FROM pg_trigger
+            WHERE tgrelid = 'billing_records'::regclass AND tgname LIKE 'billing_rollups_%'
+        ''')
+        if cur.fetchone()[0] < 3:
+            cur.execute('''
+                DROP TRIGGER IF EXISTS billing_rollups_insert ON billing_records;
+                DROP TRIGGER IF EXISTS billing_rollups_update ON billing_records;
+                DROP TRIGGER IF EXISTS billing_rollups_delete ON billing_records;
+                CREATE TRIGGER billing_rollups_insert AFTER INSERT ON billing_records
+                    REFERENCING NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION billing_rollups_apply();
+                CREATE TRIGGER billing_rollups_update AFTER UPDATE ON billing_records
+                    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION billing_rollups_apply();
+                CREATE TRIGGER billing_rollups_delete AFTER DELETE ON billing_records
+                    REFERENCING OLD TABLE AS old_rows
+                    FOR EACH STATEMENT EXECUTE FUNCTION billing_rollups_apply();
+            ''')
+        db.conn.commit()
+
+    if created:
+        db.rebuild_rollups()
+
+
+def secondary_indexes(db):
+    """Build the secondary indexes with CREATE INDEX CONCURRENTLY (no write lock)"""
+    conn = db.conn
+    # migrate() leaves its version lookup open; autocommit can't be set inside a transaction
+    conn.rollback()
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            for name, (table, columns) in INDEXES.items():
+                # A failed concurrent build leaves an INVALID index behind; rebuild it
+                cur.execute('''
+                    SELECT NOT i.indisvalid FROM pg_index i
+                    JOIN pg_class c ON c.oid = i.indexrelid
+                    WHERE c.relname = %s
+                ''', (name,))
+                row = cur.fetchone()
+                if row and row[0]:
+                    cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+                cur.execute(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})')
+    finally:
+        conn.autocommit = False
+
+
+def change_counters(db):
+    """Per-table change counters bumped by statement-level triggers
+
+    The counters back the API's ETags: a read endpoint can tell whether
+    its tables changed with one primary-key lookup.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS change_counters (
+                table_name TEXT PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            )
+        ''')
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION bump_change_counter() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO change_counters (table_name, version)
+                VALUES (TG_TABLE_NAME, 1)
+                ON CONFLICT (table_name) DO UPDATE SET version = change_counters.version + 1;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        for table in COUNTED_TABLES:
+            cur.execute(
+                'INSERT INTO change_counters (table_name) VALUES (%s) ON CONFLICT DO NOTHING',
+                (table,)
+            )
+            cur.execute(f'''
+                DROP TRIGGER IF EXISTS {table}_change_counter ON {table};
+                CREATE TRIGGER {table}_change_counter
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION bump_change_counter();
+            ''')
+        db.conn.commit()
+
+
+def absolute_cycle_keys(db):
+    """Key billing_records by the absolute start date of their cycle
+
+    `cycle` held an index relative to the day the record was saved, so the
+    same key meant a different period after every rollover. Each row's
+    cycle_start is resolved from that index as of its last update, using
+    its group's current billing settings. Rows that then collide on
+    (facility_id, cycle_start) keep the most recently updated one; the
+    others move to billing_records_superseded for manual review.
+    """
+    groups = {g['id']: g for g in db.get_facility_groups()}
+    with db.conn.cursor() as cur:
+        cur.execute('ALTER TABLE billing_records ADD COLUMN IF NOT EXISTS cycle_start DATE')
+        cur.execute('''
+            SELECT br.id, f.group_id, br.cycle, COALESCE(br.updated_at, br.created_at)::date
+            FROM billing_records br
+            LEFT JOIN facilities f ON f.id = br.facility_id
+        ''')
+        resolved = []
+        for record_id, group_id, cycle, saved_on in cur.fetchall():
+            group = groups.get(group_id, {})
+            # Custom groups may lack the cycle; fall back to calendar months
+            start = cycle_start(group, cycle, saved_on) or cycle_start({}, cycle, saved_on)
+            resolved.append((record_id, start))
+        execute_values(cur, '''
+            UPDATE billing_records br SET cycle_start = v.cycle_start
+            FROM (VALUES %s) AS v(id, cycle_start)
+            WHERE br.id = v.id
+        ''', resolved, template='(%s, %s::date)', page_size=5000)
+
+        cur.execute('CREATE TABLE IF NOT EXISTS billing_records_superseded (LIKE billing_records)')
+        cur.execute('''
+            WITH ranked AS (
+                SELECT id, row_number() OVER (
+                    PARTITION BY facility_id, cycle_start
+                    ORDER BY updated_at DESC NULLS LAST, id DESC
+                ) AS rank
+                FROM billing_records
+            ),
+            moved AS (
+                DELETE FROM billing_records br USING ranked
+                WHERE br.id = ranked.id AND ranked.rank > 1
+                RETURNING br.*
+            )
+            INSERT INTO billing_records_superseded SELECT * FROM moved
+        ''')
+        if cur.rowcount:
+            print(f"Moved {cur.rowcount} colliding billing records to billing_records_superseded")
+
+        cur.execute('ALTER TABLE billing_records ALTER COLUMN cycle_start SET NOT NULL')
+        cur.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS billing_records_facility_cycle_start_key
+            ON billing_records (facility_id, cycle_start)
+        ''')
+        cur.execute('ALTER TABLE billing_records DROP CONSTRAINT IF EXISTS billing_records_facility_id_cycle_key')
+        cur.execute('ALTER TABLE billing_records DROP COLUMN cycle')
+        db.conn.commit()
+
+
+def partitioned_billing_records(db, batch_size=5000):
+    """Rebuild billing_records as a table range-partitioned on cycle_start
+
+    Runs online, like typed_billing_record_columns. The partitioned table
+    is built beside the old one as billing_records_partitioned and filled
+    in batches, one short transaction each. Meanwhile a row trigger logs
+    the ids of rows written to the old table. A final transaction recopies
+    the logged rows and swaps the tables under a brief EXCLUSIVE lock
+    (reads continue, writes wait). Triggers are created on the new table
+    at the swap, so the copied rows don't count twice in billing_rollups.
+    The primary key becomes (id, cycle_start), since unique keys must
+    include the partition key. An interrupted run starts over.
+    """
+    # partitions imports this module, so it can't be imported at the top
+    from partitions import DEFAULT_PARTITION, ensure_partitions
+
+    columns = ('id, facility_id, cycle_start, billing_date, from_date, through_date, '
+               'billed_amount, status_id, paid_amount, paid_date, created_at, updated_at')
+    copied_ids = 'SELECT id FROM billing_records_partition_log'
+    with db.conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'billing_records'::regclass")
+        if cur.fetchone()[0] == 'p':
+            db.conn.rollback()
+            return
+
+        print("Copying billing_records into a partitioned table...")
+        # Leftovers of an interrupted run (the partitions go with their parent)
+        cur.execute('DROP TRIGGER IF EXISTS billing_records_partition_log ON billing_records')
+        cur.execute('DROP TABLE IF EXISTS billing_records_partitioned, billing_records_partition_log')
+        cur.execute('CREATE TABLE billing_records_partition_log (id INTEGER NOT NULL)')
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION billing_records_partition_log() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO billing_records_partition_log (id)
+                VALUES (CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        # Waits for running writers, so every later write is logged
+        cur.execute('''
+            CREATE TRIGGER billing_records_partition_log
+                AFTER INSERT OR UPDATE OR DELETE ON billing_records
+                FOR EACH ROW EXECUTE FUNCTION billing_records_partition_log();
+        ''')
+        cur.execute("SELECT pg_get_serial_sequence('billing_records', 'id')")
+        sequence = cur.fetchone()[0]
+        cur.execute(f'''
+            CREATE TABLE billing_records_partitioned (
+                id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                facility_id INTEGER REFERENCES facilities(id) ON DELETE CASCADE,
+                cycle_start DATE NOT NULL,
+                billing_date DATE,
+                from_date DATE,
+                through_date DATE,
+                billed_amount NUMERIC(14, 2),
+                status_id INTEGER REFERENCES billing_statuses(id),
+                paid_amount NUMERIC(14, 2),
+                paid_date DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CONSTRAINT billing_records_partitioned_pkey PRIMARY KEY (id, cycle_start),
+                CONSTRAINT billing_records_partitioned_facility_cycle_start_key UNIQUE (facility_id, cycle_start)
+            ) PARTITION BY RANGE (cycle_start)
+        ''')
+        cur.execute(f'CREATE TABLE {DEFAULT_PARTITION} PARTITION OF billing_records_partitioned DEFAULT')
+        indexes = {}
+        for name, (table, index_columns) in INDEXES.items():
+            if table == 'billing_records':
+                indexes[name] = name.replace('billing_records', 'billing_records_partitioned', 1)
+                cur.execute(f'CREATE INDEX {indexes[name]} ON billing_records_partitioned ({index_columns})')
+        cur.execute('SELECT min(cycle_start), COALESCE(max(id), 0) FROM billing_records')
+        since, max_id = cur.fetchone()
+        ensure_partitions(cur, since=since, table='billing_records_partitioned')
+        db.conn.commit()
+
+        # Rows rewritten since an earlier batch may collide on (facility_id,
+        # cycle_start); they are logged, so the final pass settles them
+        for low in range(0, max_id, batch_size):
+            cur.execute(f'''
+                INSERT INTO billing_records_partitioned ({columns})
+                SELECT {columns} FROM billing_records WHERE id > %s AND id <= %s
+                ON CONFLICT DO NOTHING
+            ''', (low, low + batch_size))
+            db.conn.commit()
+
+        cur.execute('LOCK TABLE billing_records IN EXCLUSIVE MODE')
+        cur.execute(f'DELETE FROM billing_records_partitioned WHERE id IN ({copied_ids})')
+        cur.execute(f'''
+            INSERT INTO billing_records_partitioned ({columns})
+            SELECT {columns} FROM billing_records WHERE id IN ({copied_ids})
+        ''')
+
+        # The sequence must outlive the old table
+        cur.execute(f'ALTER SEQUENCE {sequence} OWNED BY NONE')
+        cur.execute('DROP TABLE billing_records, billing_records_partition_log')
+        cur.execute('DROP FUNCTION billing_records_partition_log()')
+        cur.execute('ALTER TABLE billing_records_partitioned RENAME TO billing_records')
+        for constraint in ('pkey', 'facility_cycle_start_key'):
+            cur.execute(f'''
+                ALTER TABLE billing_records
+                RENAME CONSTRAINT billing_records_partitioned_{constraint} TO billing_records_{constraint}
+            ''')
+        for name, temporary in indexes.items():
+            cur.execute(f'ALTER INDEX {temporary} RENAME TO {name}')
+
+        cur.execute('''
+            CREATE TRIGGER billing_rollups_insert AFTER INSERT ON billing_records
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION billing_rollups_apply();
+            CREATE TRIGGER billing_rollups_update AFTER UPDATE ON billing_records
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION billing_rollups_apply();
+            CREATE TRIGGER billing_rollups_delete AFTER DELETE ON billing_records
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION billing_rollups_apply();
+            CREATE TRIGGER billing_records_change_counter
+                AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON billing_records
+                FOR EACH STATEMENT EXECUTE FUNCTION bump_change_counter();
+        ''')
+
+        cur.execute(f'ALTER SEQUENCE {sequence} OWNED BY billing_records.id')
+        db.conn.commit()
+        print("billing_records partitioning completed")
+
+
+def change_notifications(db):
+    """NOTIFY billing_changes after every statement that changes billing records or reference data
+
+    billing_records payloads carry the (facility_id, cycle_start) keys
+    written and deleted by the statement, e.g.
+    {"table": "billing_records", "upserted": [[3, "2026-10-01"]], "deleted": []};
+    statements touching more than NOTIFY_MAX_KEYS rows, and TRUNCATE, send
+    null key lists instead. Other tables send just {"table": ...}.
+    Notifications are delivered on commit, so listeners never see
+    uncommitted or rolled back changes.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute(f'''
+            CREATE OR REPLACE FUNCTION notify_record_changes() RETURNS trigger AS $$
+            DECLARE
+                upserted JSONB := '[]';
+                deleted JSONB := '[]';
+            BEGIN
+                IF TG_OP = 'TRUNCATE' THEN
+                    upserted := NULL;
+                    deleted := NULL;
+                ELSIF TG_OP = 'DELETE' THEN
+                    SELECT COALESCE(jsonb_agg(jsonb_build_array(facility_id, cycle_start)), '[]')
+                    INTO deleted FROM old_rows;
+                ELSE
+                    SELECT COALESCE(jsonb_agg(jsonb_build_array(facility_id, cycle_start)), '[]')
+                    INTO upserted FROM new_rows;
+                    IF TG_OP = 'UPDATE' THEN
+                        -- Keys an UPDATE moved away from
+                        SELECT COALESCE(jsonb_agg(jsonb_build_array(facility_id, cycle_start)), '[]')
+                        INTO deleted FROM (
+                            SELECT facility_id, cycle_start FROM old_rows
+                            EXCEPT SELECT facility_id, cycle_start FROM new_rows
+                        ) moved;
+                    END IF;
+                END IF;
+                IF upserted = '[]' AND deleted = '[]' THEN
+                    RETURN NULL;
+                END IF;
+                IF jsonb_array_length(upserted) + jsonb_array_length(deleted) > {NOTIFY_MAX_KEYS} THEN
+                    upserted := NULL;
+                    deleted := NULL;
+                END IF;
+                PERFORM pg_notify('{CHANGES_CHANNEL}', jsonb_build_object(
+                    'table', TG_TABLE_NAME, 'upserted', upserted, 'deleted', deleted
+                )::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cur.execute(f'''
+            CREATE OR REPLACE FUNCTION notify_table_changes() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('{CHANGES_CHANNEL}', jsonb_build_object('table', TG_TABLE_NAME)::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cur.execute('''
+            DROP TRIGGER IF EXISTS billing_records_notify_insert ON billing_records;
+            DROP TRIGGER IF EXISTS billing_records_notify_update ON billing_records;
+            DROP TRIGGER IF EXISTS billing_records_notify_delete ON billing_records;
+            DROP TRIGGER IF EXISTS billing_records_notify_truncate ON billing_records;
+            CREATE TRIGGER billing_records_notify_insert AFTER INSERT ON billing_records
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_record_changes();
+            CREATE TRIGGER billing_records_notify_update AFTER UPDATE ON billing_records
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_record_changes();
+            CREATE TRIGGER billing_records_notify_delete AFTER DELETE ON billing_records
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_record_changes();
+            CREATE TRIGGER billing_records_notify_truncate AFTER TRUNCATE ON billing_records
+                FOR EACH STATEMENT EXECUTE FUNCTION notify_record_changes();
+        ''')
+        for table in NOTIFIED_TABLES:
+            cur.execute(f'''
+                DROP TRIGGER IF EXISTS {table}_notify ON {table};
+                CREATE TRIGGER {table}_notify
+                    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+                    FOR EACH STATEMENT EXECUTE FUNCTION notify_table_changes();
+            ''')
+        db.conn.commit()
+
+
+def record_tombstones(db):
+    """Tombstones for deleted billing records and an index on updated_at, for delta sync
+
+    Records only disappear through the cascades from deleting a facility or
+    facility group; a statement trigger keeps a (facility_id, cycle_start,
+    deleted_at) row for each so /api/billing-records/changes can report
+    them. Partitions detached by archive-partitions leave no tombstones.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS billing_record_tombstones (
+                facility_id INTEGER NOT NULL,
+                cycle_start DATE NOT NULL,
+                deleted_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS billing_record_tombstones_deleted_at_idx
+            ON billing_record_tombstones (deleted_at)
+        ''')
+        # Partitioned, so not CONCURRENTLY; the index is created on every partition
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS billing_records_updated_at_idx
+            ON billing_records (updated_at)
+        ''')
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION billing_records_tombstone() RETURNS trigger AS $$
+            BEGIN
+                INSERT INTO billing_record_tombstones (facility_id, cycle_start)
+                SELECT facility_id, cycle_start FROM old_rows;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cur.execute('''
+            DROP TRIGGER IF EXISTS billing_records_tombstone ON billing_records;
+            CREATE TRIGGER billing_records_tombstone AFTER DELETE ON billing_records
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION billing_records_tombstone();
+        ''')
+        db.conn.commit()
+
+
+def unique_custom_dates(db):
+    """One custom date per (group_id, date), so saves can upsert and diff
+
+    Duplicates left by the old delete-and-reinsert saves keep their
+    newest row.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            DELETE FROM custom_dates c
+            USING custom_dates newer
+            WHERE newer.group_id = c.group_id AND newer.date = c.date AND newer.id > c.id
+        ''')
+        cur.execute('''
+            ALTER TABLE custom_dates
+            ADD CONSTRAINT custom_dates_group_id_date_key UNIQUE (group_id, date)
+        ''')
+        db.conn.commit()
+
+
+def job_queue(db):
+    """jobs table for the background worker (see jobs.py)
+
+    Workers claim queued rows with FOR UPDATE SKIP LOCKED; the partial
+    indexes keep the claim and the stale-job sweep to the few live rows.
+    A dedupe_key is unique among queued and running jobs, so enqueueing
+    the same operation twice returns the job already in flight.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS jobs (
+                id SERIAL PRIMARY KEY,
+                kind VARCHAR(64) NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+                dedupe_key TEXT,
+                status VARCHAR(16) NOT NULL DEFAULT 'queued'
+                    CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 3,
+                run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                progress JSONB,
+                result JSONB,
+                error TEXT,
+                worker TEXT,
+                heartbeat_at TIMESTAMP,
+                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                started_at TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS jobs_queued_idx ON jobs (run_at, id) WHERE status = 'queued'
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS jobs_running_idx ON jobs (heartbeat_at) WHERE status = 'running'
+        ''')
+        cur.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS jobs_active_dedupe_key_idx ON jobs (dedupe_key)
+            WHERE status IN ('queued', 'running')
+        ''')
+        cur.execute('''
+            CREATE INDEX IF NOT EXISTS jobs_finished_at_idx ON jobs (finished_at)
+            WHERE status IN ('succeeded', 'failed')
+        ''')
+        db.conn.commit()
+
+
+def fixed_cycle_grid(db):
+    """Move biweekly and bimonthly cycle_start values onto the fixed cycle grid
+
+    These cycles used to start from the week or month the record was saved
+    in, so the same group's records could start on either parity. Each
+    record now moves to the grid cycle containing its old start (see
+    cycles.WEEK_EPOCH). Where that brings two records of a facility onto one
+    cycle, the most recently updated one is kept and the others move to
+    billing_records_superseded, as in absolute_cycle_keys. The old keys get
+    tombstones so delta-sync clients drop them.
+    """
+    # partitions imports this module, so it can't be imported at the top
+    from partitions import ensure_partitions
+
+    columns = ('id, facility_id, cycle_start, billing_date, from_date, through_date, '
+               'billed_amount, status_id, paid_amount, paid_date, created_at, updated_at')
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            CREATE TEMPORARY TABLE realigned ON COMMIT DROP AS
+            SELECT br.id, br.facility_id, br.cycle_start, br.updated_at,
+                   CASE fg.billing_type
+                       WHEN 'biweekly' THEN br.cycle_start - ((br.cycle_start - %s::date) %% 14 + 14) %% 14
+                       ELSE (date_trunc('month', br.cycle_start)
+                             - make_interval(months => (extract(month FROM br.cycle_start)::int - 1) %% 2))::date
+                   END AS new_start
+            FROM billing_records br
+            JOIN facilities f ON f.id = br.facility_id
+            JOIN facility_groups fg ON fg.id = f.group_id
+            WHERE fg.billing_type IN ('biweekly', 'bimonthly')
+        ''', (WEEK_EPOCH,))
+        cur.execute('SELECT min(new_start) FROM realigned WHERE new_start <> cycle_start')
+        since = cur.fetchone()[0]
+        if since is None:
+            db.conn.commit()
+            return
+        ensure_partitions(cur, since=since)
+
+        # billing_records_superseded was made before `cycle` was dropped
+        cur.execute('ALTER TABLE billing_records_superseded ALTER COLUMN cycle DROP NOT NULL')
+        cur.execute(f'''
+            WITH ranked AS (
+                SELECT id, row_number() OVER (
+                    PARTITION BY facility_id, new_start
+                    ORDER BY updated_at DESC NULLS LAST, id DESC
+                ) AS rank
+                FROM realigned
+            ),
+            moved AS (
+                DELETE FROM billing_records br USING ranked
+                WHERE br.id = ranked.id AND ranked.rank > 1
+                RETURNING br.*
+            )
+            INSERT INTO billing_records_superseded ({columns}) SELECT {columns} FROM moved
+        ''')
+        if cur.rowcount:
+            print(f"Moved {cur.rowcount} colliding billing records to billing_records_superseded")
+
+        cur.execute('''
+            INSERT INTO billing_record_tombstones (facility_id, cycle_start)
+            SELECT r.facility_id, r.cycle_start FROM realigned r
+            JOIN billing_records br ON br.id = r.id AND br.cycle_start = r.cycle_start
+            WHERE r.new_start <> r.cycle_start
+        ''')
+        # Only off-grid rows move, and only onto grid starts no other row keeps
+        cur.execute('''
+            UPDATE billing_records br
+            SET cycle_start = r.new_start, updated_at = CURRENT_TIMESTAMP
+            FROM realigned r
+            WHERE br.id = r.id AND br.cycle_start = r.cycle_start AND r.new_start <> r.cycle_start
+        ''')
+        print(f"Moved {cur.rowcount} billing records onto the fixed cycle grid")
+        db.conn.commit()
+
+
+def job_workers(db):
+    """job_workers table: when each job worker last checked in (see jobs.py)
+
+    Lets the API tell a queued job that is merely waiting from one that no
+    running worker will ever pick up.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS job_workers (
+                name TEXT PRIMARY KEY,
+                seen_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        db.conn.commit()
+
+
+def sharded_change_counters(db):
+    """Spread each table's change counter over CHANGE_COUNTER_SHARDS rows
+
+    A single counter row per table stayed locked by each writer until it
+    committed, so every concurrent write to a table queued behind the
+    others. The trigger now bumps the shard of its backend, and
+    change_counters becomes a view summing the shards: still one lookup
+    for an ETag, and the sum still grows with every committed write.
+    Existing versions carry over in shard 0, so no ETag goes backwards.
+    """
+    with db.conn.cursor() as cur:
+        cur.execute('''
+            CREATE TABLE IF NOT EXISTS change_counter_shards (
+                table_name TEXT NOT NULL,
+                shard SMALLINT NOT NULL,
+                version BIGINT NOT NULL DEFAULT 0,
+                PRIMARY KEY (table_name, shard)
+            )
+        ''')
+        cur.execute(f'''
+            CREATE OR REPLACE FUNCTION bump_table_version(name TEXT) RETURNS void AS $$
+                INSERT INTO change_counter_shards (table_name, shard, version)
+                VALUES (name, pg_backend_pid() % {CHANGE_COUNTER_SHARDS}, 1)
+                ON CONFLICT (table_name, shard) DO UPDATE SET version = change_counter_shards.version + 1
+            $$ LANGUAGE sql
+        ''')
+        cur.execute('''
+            CREATE OR REPLACE FUNCTION bump_change_counter() RETURNS trigger AS $$
+            BEGIN
+                PERFORM bump_table_version(TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass('change_counters')")
+        if cur.fetchone() == ('r',):
+            cur.execute('''
+                INSERT INTO change_counter_shards (table_name, shard, version)
+                SELECT table_name, 0, version FROM change_counters
+                ON CONFLICT DO NOTHING
+            ''')
+            cur.execute('DROP TABLE change_counters')
+        cur.execute('''
+            CREATE OR REPLACE VIEW change_counters AS
+            SELECT table_name, sum(version)::bigint AS version
+            FROM change_counter_shards
+            GROUP BY table_name
+        ''')
+        db.conn.commit()
+
+
+# (version, description, function); append new migrations, never reorder
+MIGRATIONS = [
+    (1, 'baseline schema and default data', baseline_schema),
+    (2, 'typed amount and date columns on billing_records', typed_billing_record_columns),
+    (3, 'billing_rollups table and triggers', billing_rollups),
+    (4, 'secondary indexes', secondary_indexes),
+    (5, 'per-table change counters', change_counters),
+    (6, 'absolute cycle_start key on billing_records', absolute_cycle_keys),
+    (7, 'partition billing_records by cycle_start', partitioned_billing_records),
+    (8, 'change notification triggers', change_notifications),
+    (9, 'billing record tombstones and updated_at index', record_tombstones),
+    (10, 'unique (group_id, date) on custom_dates', unique_custom_dates),
+    (11, 'jobs queue', job_queue),
+    (12, 'biweekly and bimonthly cycles on a fixed grid', fixed_cycle_grid),
+    (13, 'job worker heartbeats', job_workers),
+    (14, 'sharded change counters', sharded_change_counters),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(cur):
+    """Highest applied migration, or 0 for a database without schema_version"""
+    cur.execute("SELECT to_regclass('schema_version') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute('SELECT COALESCE(max(version), 0) FROM schema_version')
+    return cur.fetchone()[0]
+
+
+def _lock(conn, cur):
+    """Take the migration lock, polling in autocommit so no snapshot is held while waiting"""
+    conn.autocommit = True
+    try:
+        while True:
+            cur.execute('SELECT pg_try_advisory_lock(%s)', (MIGRATION_LOCK_KEY,))
+            if cur.fetchone()[0]:
+                return
+            time.sleep(MIGRATION_LOCK_POLL)
+    finally:
+        conn.autocommit = False
+
+
+def migrate(db):
+    """Apply pending migrations; a no-op (one query) when the schema is current"""
+    conn = db.conn
+    with conn.cursor() as cur:
+        version = current_version(cur)
+        conn.rollback()
+        if version >= LATEST_VERSION:
+            return
+        
+        # Session-level lock: held across the commits each migration makes
+        _lock(conn, cur)
+        try:
+            cur.execute('''
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.commit()
+            
+            # Another worker may have migrated while we waited for the lock
+            version = current_version(cur)
+            for number, description, apply in MIGRATIONS:
+                if number <= version:
+                    continue
+                print(f"Applying migration {number}: {description}")
+                try:
+                    apply(db)
+                except psycopg2.Error:
+                    conn.rollback()
+                    print(f"Migration {number} failed")
+                    raise
+                cur.execute(
+                    'INSERT INTO schema_version (version, description) VALUES (%s, %s)',
+                    (number, description)
+                )
+                conn.commit()
+        finally:
+            conn.rollback()
+            cur.execute('SELECT pg_advisory_unlock(%s)', (MIGRATION_LOCK_KEY,))
+            conn.commit()
@@ -0,0 +1,143 @@
+"""Range partitions of billing_records on cycle_start.
+
+Each partition covers BILLING_PARTITION_MONTHS calendar months (3, i.e.
+quarterly, by default; 1 for monthly) and is named after its first month,
+e.g. billing_records_y2026m10. A DEFAULT partition catches rows outside
+every range; when a partition is created, matching rows are moved out of
+the default partition first. The helpers take a cursor and leave
+committing to the caller.
+"""
+import os
+import re
+from datetime import date
+
+from migrations import ROLLUP_PERIOD_SQL, ROLLUP_STATUS_SQL
+
+PARTITION_MONTHS = int(os.environ.get('BILLING_PARTITION_MONTHS', 3))
+# Future periods kept partitioned ahead of today
+PARTITIONS_AHEAD = int(os.environ.get('BILLING_PARTITIONS_AHEAD', 4))
+
+DEFAULT_PARTITION = 'billing_records_default'
+ARCHIVE_PREFIX = 'billing_records_archive_'
+
+# Serializes partition DDL between workers ("bilm")
+PARTITION_LOCK_KEY = 0x62696C6D
+
+_RANGE_BOUND = re.compile(r"FROM \('([0-9-]+)'\) TO \('([0-9-]+)'\)")
+
+
+def add_months(day, months):
+    """First day of the month `months` after `day`'s month"""
+    month = day.year * 12 + day.month - 1 + months
+    return date(month // 12, month % 12 + 1, 1)
+
+
+def period_start(day, months=PARTITION_MONTHS):
+    """First day of the partition period containing `day`"""
+    return date(day.year, (day.month - 1) // months * months + 1, 1)
+
+
+def partition_name(start):
+    return f'billing_records_y{start.year}m{start.month:02d}'
+
+
+def list_partitions(cur, table='billing_records'):
+    """(name, from, to, estimated rows) of each range partition, oldest first"""
+    cur.execute('''
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = %s::regclass
+    ''', (table,))
+    partitions = []
+    for name, bound, rows in cur.fetchall():
+        match = _RANGE_BOUND.search(bound)
+        if match:
+            partitions.append((name, date.fromisoformat(match[1]), date.fromisoformat(match[2]),
+                               max(int(rows), 0)))
+    return sorted(partitions, key=lambda p: p[1])
+
+
+def create_partition(cur, start, end, table='billing_records'):
+    """Create and attach the partition for [start, end), moving its rows out of the default partition
+
+    Rows are moved partition to partition, so the statement triggers on
+    billing_records (rollups, change counters) don't see them as changes.
+    `table` is the parent, another name only while the partitioned table
+    is being built (see migrations.partitioned_billing_records).
+    """
+    name = partition_name(start)
+    cur.execute(f'CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+    cur.execute(f'''
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION}
+            WHERE cycle_start >= %s AND cycle_start < %s
+            RETURNING *
+        )
+        INSERT INTO {name} SELECT * FROM moved
+    ''', (start, end))
+    cur.execute(f'ALTER TABLE {table} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)',
+                (start, end))
+    return name
+
+
+def ensure_partitions(cur, since=None, ahead=PARTITIONS_AHEAD, months=PARTITION_MONTHS, table='billing_records'):
+    """Create the partitions missing between `since` (default today) and `ahead` periods past today
+
+    Ranges already covered by existing partitions (possibly of a different
+    length) are skipped. Returns the names of the partitions created.
+    """
+    cur.execute('SELECT pg_advisory_xact_lock(%s)', (PARTITION_LOCK_KEY,))
+    today = date.today()
+    start = period_start(min(since or today, today), months)
+    last = add_months(period_start(today, months), months * (ahead + 1))
+    existing = list_partitions(cur, table)
+    created = []
+    while start < last:
+        end = add_months(start, months)
+        # Fill the gaps left in [start, end) by existing partitions
+        gap = start
+        for _, low, high, _ in existing:
+            if high <= gap or low >= end:
+                continue
+            if low > gap:
+                created.append(create_partition(cur, gap, low, table))
+            gap = max(gap, high)
+        if gap < end:
+            created.append(create_partition(cur, gap, end, table))
+        start = end
+    return created
+
+
+def detach_partition(cur, name, drop=False):
+    """Detach a partition, take its rows out of billing_rollups, then rename it to the archive name or drop it
+
+    Returns the archive table name (None when dropped).
+    """
+    cur.execute(f'ALTER TABLE billing_records DETACH PARTITION {name}')
+    # Detaching bypasses the rollup triggers; subtract the partition's totals
+    cur.execute(f'''
+        UPDATE billing_rollups r SET
+            record_count = r.record_count - d.record_count,
+            billed_total = r.billed_total - d.billed_total,
+            paid_total = r.paid_total - d.paid_total
+        FROM (
+            SELECT facility_id,
+                   {ROLLUP_PERIOD_SQL.format(row=name)} AS period,
+                   {ROLLUP_STATUS_SQL.format(row=name)} AS status_id,
+                   COUNT(*) AS record_count,
+                   COALESCE(SUM(billed_amount), 0) AS billed_total,
+                   COALESCE(SUM(paid_amount), 0) AS paid_total
+            FROM {name}
+            WHERE facility_id IS NOT NULL
+            GROUP BY 1, 2, 3
+        ) d
+        WHERE (r.facility_id, r.period, r.status_id) = (d.facility_id, d.period, d.status_id)
+    ''')
+    cur.execute('DELETE FROM billing_rollups WHERE record_count = 0')
+    if drop:
+        cur.execute(f'DROP TABLE {name}')
+        return None
+    archive = ARCHIVE_PREFIX + name[len('billing_records_'):]
+    cur.execute(f'ALTER TABLE {name} RENAME TO {archive}')
+    return archive
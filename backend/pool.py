@@ -0,0 +1,176 @@
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available before the checkout timeout"""
+
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    Connections are validated on checkout (closed or long-idle connections
+    are pinged and reconnected) and rolled back on return, so one failed
+    statement never leaks an aborted transaction to the next borrower.
+    """
+
+    def __init__(self, dsn, minconn=1, maxconn=10, timeout=30.0,
+                 health_check_interval=30.0, **connect_kwargs):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: min={minconn}, max={maxconn}")
+
+        self.dsn = dsn
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []      # (connection, returned_at) pairs, most recent last
+        self._size = 0       # open connections, idle + in use
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+
+        # Metrics
+        self._checkouts = 0
+        self._timeouts = 0
+        self._reconnects = 0
+        self._checkout_seconds = 0.0
+        self._max_checkout_seconds = 0.0
+
+        for _ in range(minconn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._size += 1
+
+    def _connect(self):
+        return psycopg2.connect(self.dsn, **self.connect_kwargs)
+
+    def _validate(self, conn, idle_since):
+        """Return a usable connection, reconnecting if `conn` is broken"""
+        if not conn.closed and time.monotonic() - idle_since < self.health_check_interval:
+            return conn
+
+        if not conn.closed:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute('SELECT 1')
+                conn.rollback()
+                return conn
+            except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                pass
+
+        self._close_quietly(conn)
+        with self._cond:
+            self._reconnects += 1
+        return self._connect()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def getconn(self):
+        """Borrow a connection, waiting up to `timeout` seconds for one to free up"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        conn, idle_since = None, None
+
+        with self._cond:
+            if self._closed:
+                raise psycopg2.pool.PoolError("connection pool is closed")
+            self._waiting += 1
+            try:
+                while True:
+                    if self._idle:
+                        conn, idle_since = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        # Reserve a slot; the connection is opened outside the lock
+                        self._size += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeout(
+                            f"No database connection available after {self.timeout}s "
+                            f"(max {self.maxconn} in use)"
+                        )
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            else:
+                conn = self._validate(conn, idle_since)
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        elapsed = time.monotonic() - started
+        with self._cond:
+            self._in_use += 1
+            self._checkouts += 1
+            self._checkout_seconds += elapsed
+            self._max_checkout_seconds = max(self._max_checkout_seconds, elapsed)
+        return conn
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection, rolling back any open transaction"""
+        if not close and not conn.closed:
+            status = conn.info.transaction_status
+            if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                close = True
+            elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    close = True
+
+        with self._cond:
+            self._in_use -= 1
+            if close or conn.closed or self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Close every idle connection and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._size -= len(self._idle)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self):
+        """Snapshot of pool occupancy and checkout latency"""
+        with self._cond:
+            checkouts = self._checkouts
+            return {
+                'size': self._size,
+                'idle': len(self._idle),
+                'inUse': self._in_use,
+                'waiting': self._waiting,
+                'min': self.minconn,
+                'max': self.maxconn,
+                'checkouts': checkouts,
+                'timeouts': self._timeouts,
+                'reconnects': self._reconnects,
+                'avgCheckoutMs': round(self._checkout_seconds / checkouts * 1000, 3) if checkouts else 0.0,
+                'maxCheckoutMs': round(self._max_checkout_seconds * 1000, 3),
+            }
@@ -0,0 +1,43 @@
+"""Relative cycle ranges must not widen for groups that lack some of the cycles."""
+from datetime import date
+
+import pytest
+
+from cycles import cycle_range_starts, cycles_for_group
+
+ANCHOR = date(2025, 1, 1)
+
+# Four custom cycles, indexes 0..3 relative to ANCHOR
+CUSTOM = {
+    'id': 1,
+    'billingType': 'custom',
+    'customDates': [{'date': d} for d in ('01312025', '02282025', '03312025', '04302025')],
+}
+MONTHLY = {'id': 2, 'billingType': 'monthly', 'billingDay': 1}
+
+
+def starts(group):
+    return [c.start for c in cycles_for_group(group, 0, 3, ANCHOR)]
+
+
+def test_range_past_the_custom_cycles_matches_nothing():
+    assert cycle_range_starts(CUSTOM, 5, 6, ANCHOR) is None
+    assert cycle_range_starts(CUSTOM, 5, None, ANCHOR) is None
+    assert cycle_range_starts(CUSTOM, None, -2, ANCHOR) is None
+
+
+def test_range_partly_past_the_custom_cycles_is_clamped():
+    windows = starts(CUSTOM)
+    assert cycle_range_starts(CUSTOM, 2, 6, ANCHOR) == (windows[2], windows[3])
+    assert cycle_range_starts(CUSTOM, -3, 1, ANCHOR) == (windows[0], windows[1])
+    assert cycle_range_starts(CUSTOM, None, 6, ANCHOR) == (None, windows[3])
+
+
+def test_cycle_bounds_leaves_out_groups_without_the_cycles():
+    pytest.importorskip('psycopg2')
+    from database import cycle_bounds
+
+    group_ids, lows, highs = cycle_bounds([CUSTOM, MONTHLY], 5, 6, ANCHOR)
+    assert group_ids == [MONTHLY['id']]
+    assert lows == [date(2025, 6, 1)]
+    assert highs == [date(2025, 7, 1)]
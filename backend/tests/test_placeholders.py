@@ -0,0 +1,65 @@
+"""generate_placeholders must be idempotent across days, not just within one.
+
+The database test needs PostgreSQL server binaries (or BENCH_DATABASE_URL,
+see benchmarks.postgres) and is skipped without them.
+"""
+from datetime import date, timedelta
+
+import pytest
+
+from cycles import cycles_for_group
+
+# Monday starting a biweekly cycle, and the Monday after: same biweekly,
+# bimonthly (September-October) and monthly cycles
+FIRST_RUN = date(2025, 10, 6)
+SECOND_RUN = FIRST_RUN + timedelta(days=7)
+
+GROUPS = [
+    {'name': 'biweekly', 'billingType': 'biweekly', 'billingDay': 'Monday'},
+    {'name': 'bimonthly', 'billingType': 'bimonthly', 'billingDay': 1},
+    {'name': 'monthly', 'billingType': 'monthly', 'billingDay': 15},
+]
+
+
+@pytest.mark.parametrize('group', GROUPS, ids=lambda g: g['name'])
+def test_cycle_starts_do_not_move_with_the_anchor(group):
+    first = {c.start for c in cycles_for_group(group, 0, 3, FIRST_RUN)}
+    second = {c.start for c in cycles_for_group(group, 0, 3, SECOND_RUN)}
+    assert second == first
+
+
+@pytest.fixture
+def db(monkeypatch):
+    pytest.importorskip('psycopg2')
+    from benchmarks.postgres import temporary_postgres
+    try:
+        server = temporary_postgres()
+        dsn = server.__enter__()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+    monkeypatch.setenv('DATABASE_URL', dsn)
+    from database import Database
+    database = Database()
+    try:
+        yield database
+    finally:
+        database.release_connection()
+        database.listener.stop()
+        database.pool.closeall()
+        server.__exit__(None, None, None)
+
+
+def test_second_run_a_week_later_inserts_nothing(db):
+    # Only the groups under test: the default weekly group gains a week
+    for group in db.get_facility_groups():
+        db.delete_facility_group(group['id'])
+    for group in GROUPS:
+        group_id = db.create_facility_group(group)
+        for n in range(3):
+            db.create_facility({'name': f"{group['name']} {n}", 'groupId': group_id})
+
+    first = db.generate_placeholders(3, anchor=FIRST_RUN)
+    second = db.generate_placeholders(3, anchor=SECOND_RUN)
+
+    assert first['inserted'] == 3 * first['windows']
+    assert second['inserted'] == 0
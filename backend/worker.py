@@ -0,0 +1,163 @@
+"""Background job worker (see jobs.py).
+
+    python worker.py            # the Procfile's `worker` process
+
+Runs jobs one at a time until SIGTERM/SIGINT, finishing the current one
+first. It wakes on the jobs channel's NOTIFY and polls every
+JOB_POLL_INTERVAL seconds in case a notification was missed. On start and
+every PLACEHOLDER_INTERVAL_HOURS it also queues generate_placeholders, so
+upcoming cycles always have their records. Setting
+JOBS_EMBEDDED_WORKER=1 runs the same loop on a thread inside each web
+worker, for deployments that can only run one process.
+"""
+import os
+import signal
+import socket
+import threading
+import time
+import traceback
+
+import psycopg2
+from dotenv import load_dotenv
+
+import jobs
+from database import Database
+
+JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', 10))
+# Heartbeats must come well inside JOB_STALE_SECONDS (and JOB_WORKER_STALE_SECONDS)
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', 30))
+# Finished jobs past their retention are purged this often
+JOB_PURGE_INTERVAL = 3600
+# Hours between scheduled generate_placeholders jobs; 0 turns the schedule off
+PLACEHOLDER_INTERVAL_HOURS = float(os.environ.get('PLACEHOLDER_INTERVAL_HOURS', 24))
+
+
+class JobWorker:
+    """Claims and runs jobs with `db`'s handlers.
+
+    Queue bookkeeping (claims, heartbeats, progress, outcomes) goes through
+    a dedicated autocommit connection, so it is visible at once and
+    independent of the transactions the job itself makes.
+    """
+
+    def __init__(self, db, name=None):
+        self.db = db
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+        self._control = None
+        self._control_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._last_purge = 0.0
+        self._last_placeholders = None
+        db.listener.subscribe(jobs.JOBS_CHANNEL, lambda payload: self._wake.set())
+        # A reconnect may have swallowed notifications
+        db.listener.on_reconnect(self._wake.set)
+
+    def _queue(self, fn, *args):
+        """Run a jobs.* queue function on the control connection, reconnecting once if it dropped"""
+        with self._control_lock:
+            for attempt in (1, 2):
+                if self._control is None or self._control.closed:
+                    self._control = psycopg2.connect(self.db.db_url)
+                    self._control.autocommit = True
+                try:
+                    with self._control.cursor() as cur:
+                        return fn(cur, *args)
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    self._control.close()
+                    if attempt == 2:
+                        raise
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def run(self):
+        """Work until stop() is called"""
+        while not self._stopped.is_set():
+            try:
+                if not self.run_once():
+                    self._wake.wait(JOB_POLL_INTERVAL)
+                    self._wake.clear()
+            except Exception as e:
+                print(f"Job worker error: {e}; retrying in {JOB_POLL_INTERVAL}s")
+                self._stopped.wait(JOB_POLL_INTERVAL)
+        if self._control is not None:
+            self._control.close()
+
+    def run_once(self):
+        """Housekeeping, then claim and run one due job; False when the queue was empty"""
+        self._queue(jobs.worker_heartbeat, self.name)
+        for job_id in self._queue(jobs.requeue_stale):
+            print(f"Requeued job {job_id}: worker stopped responding")
+        if time.monotonic() - self._last_purge > JOB_PURGE_INTERVAL:
+            self._queue(jobs.purge_jobs)
+            self._last_purge = time.monotonic()
+        if PLACEHOLDER_INTERVAL_HOURS > 0 and (
+                self._last_placeholders is None
+                or time.monotonic() - self._last_placeholders > PLACEHOLDER_INTERVAL_HOURS * 3600):
+            # Every worker schedules it; the dedupe key keeps one in the queue
+            # at a time and the job is idempotent, so extra runs insert nothing
+            self._queue(jobs.enqueue, 'generate_placeholders', {}, 'generate_placeholders')
+            self._last_placeholders = time.monotonic()
+        claimed = self._queue(jobs.claim, self.name)
+        if claimed is None:
+            return False
+        self.run_job(*claimed)
+        return True
+
+    def run_job(self, job_id, kind, payload, attempts, max_attempts):
+        def progress(done, total=None, message=None):
+            self._queue(jobs.heartbeat, job_id, {'done': done, 'total': total, 'message': message})
+
+        # Heartbeats (the job's and the worker's) while the handler runs,
+        # whether or not it reports progress
+        finished = threading.Event()
+
+        def beat():
+            while not finished.wait(JOB_HEARTBEAT_INTERVAL):
+                try:
+                    self._queue(jobs.heartbeat, job_id)
+                    self._queue(jobs.worker_heartbeat, self.name)
+                except Exception as e:
+                    print(f"Heartbeat for job {job_id} failed: {e}")
+        heart = threading.Thread(target=beat, name=f'job-{job_id}-heartbeat', daemon=True)
+        heart.start()
+        try:
+            handler = jobs.JOB_HANDLERS.get(kind)
+            if handler is None:
+                raise ValueError(f"Unknown job kind: {kind}")
+            result = handler(self.db, payload, progress)
+        except Exception as e:
+            # release_connection below rolls back whatever the handler left open
+            status = self._queue(jobs.fail, job_id, attempts, max_attempts, str(e),
+                                 isinstance(e, jobs.PERMANENT_ERRORS))
+            print(f"Job {job_id} ({kind}) attempt {attempts} failed, now {status}: {e}")
+            traceback.print_exc()
+        else:
+            self._queue(jobs.succeed, job_id, result)
+        finally:
+            finished.set()
+            heart.join()
+            self.db.release_connection()
+
+
+def start_embedded(db):
+    """Run a JobWorker on a daemon thread of this process; returns it"""
+    worker = JobWorker(db)
+    threading.Thread(target=worker.run, name='job-worker', daemon=True).start()
+    return worker
+
+
+def main():
+    load_dotenv()
+    worker = JobWorker(Database())
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: worker.stop())
+    print(f"Job worker {worker.name} started")
+    worker.run()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())